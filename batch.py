@@ -0,0 +1,152 @@
+import concurrent.futures
+import os
+import time
+from typing import NamedTuple
+
+import cheesegrater
+import wheel
+
+
+class BatchOptions(NamedTuple):
+    """How every job in a batch is assembled, mirroring the CLI options."""
+
+    encoder: str = "int"
+    memo: bool = False
+    object_file: bool = False
+    optimize: bool = False
+    relax: bool = True
+    scratch: str | None = None
+    stream: bool = False
+    sparse: bool = False
+    merge_gap: int = wheel.DEFAULT_MERGE_GAP
+
+
+class BatchResult(NamedTuple):
+    in_path: str
+    out_path: str
+    seconds: float
+    error: str | None
+
+
+def output_path_for(in_path, out_dir=None, extension=".wheel"):
+    base = os.path.splitext(in_path)[0] + extension
+    if out_dir is None:
+        return base
+    return os.path.join(out_dir, os.path.basename(base))
+
+
+def read_manifest(manifest_path, out_dir=None, extension=".wheel"):
+    """Read (input, output) jobs from a manifest file.
+
+    Each non-blank line names an input file, optionally followed by the output
+    path to write. Lines starting with # are ignored. Relative paths are taken
+    relative to the manifest's directory.
+    """
+    root = os.path.dirname(manifest_path)
+    jobs = []
+    with open(manifest_path, "r") as manifest:
+        for line in manifest:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            in_path = os.path.join(root, fields[0])
+            if len(fields) > 1:
+                out_path = os.path.join(root, fields[1])
+            else:
+                out_path = output_path_for(in_path, out_dir, extension)
+            jobs.append((in_path, out_path))
+    return jobs
+
+
+def init_worker():
+    # Everything the assembler needs is imported with cheesegrater, so each
+    # worker pays for the parser and encoder tables exactly once. Assembling
+    # a trivial program also compiles the tokenizer regex up front.
+    cheesegrater.assemble("NOP")
+
+
+# per-process memo, reused by every job a worker assembles when memo is on
+worker_memo = None
+
+
+def assemble_job(job, options=BatchOptions()):
+    global worker_memo
+    in_path, out_path = job
+    start = time.perf_counter()
+    if options.memo and worker_memo is None:
+        import memo as line_memo
+
+        worker_memo = line_memo.Memo()
+    try:
+        if options.object_file:
+            import objfile
+
+            obj = objfile.assemble_object_file(in_path, options.encoder, options.optimize)
+            objfile.write_object(obj, out_path)
+        else:
+            if options.stream:
+                import stream
+
+                image = stream.assemble_stream_file(in_path)
+            else:
+                image = cheesegrater.assemble_file(
+                    in_path,
+                    options.encoder,
+                    worker_memo if options.memo else None,
+                    None,
+                    options.relax,
+                    options.scratch,
+                    options.optimize,
+                )
+            image.write(out_path, options.sparse, options.merge_gap)
+    except (OSError, SyntaxError, EOFError, ValueError) as e:
+        return BatchResult(in_path, out_path, time.perf_counter() - start, str(e))
+    except Exception as e:
+        # a bug in the assembler must not take the rest of the batch down
+        return BatchResult(in_path, out_path, time.perf_counter() - start, "Internal error: %r" % e)
+    return BatchResult(in_path, out_path, time.perf_counter() - start, None)
+
+
+def run_batch(jobs, workers=None, options=BatchOptions()):
+    """Assemble every (input, output) job, in parallel across worker processes.
+
+    Returns one BatchResult per job, in the order the jobs were given. Errors
+    are recorded on the result instead of stopping the batch. options is a
+    BatchOptions: with memo, each worker keeps a memo.Memo across the files
+    it assembles, and with object_file, each job writes a relocatable object
+    (see objfile.py) instead of a WHEEL.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        return [assemble_job(job, options) for job in jobs]
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker
+    ) as executor:
+        return list(
+            executor.map(
+                assemble_job,
+                jobs,
+                [options] * len(jobs),
+                chunksize=chunksize,
+            )
+        )
+
+
+def print_report(results, wall_seconds):
+    failures = [result for result in results if result.error is not None]
+    for result in results:
+        if result.error is None:
+            print("ok    %8.4fs  %s -> %s" % (result.seconds, result.in_path, result.out_path))
+        else:
+            print("FAIL  %8.4fs  %s: %s" % (result.seconds, result.in_path, result.error))
+    print(
+        "assembled %d/%d files in %.3fs (%.3fs of per-file assembly time)"
+        % (
+            len(results) - len(failures),
+            len(results),
+            wall_seconds,
+            sum(result.seconds for result in results),
+        )
+    )
+    return failures
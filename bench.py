@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import cache
+import cheesegrater
+import lex
+import parse
+
+# Benchmark suite: generates synthetic SWISS programs and times each stage of
+# the assembler separately. Every run is appended as one JSON line, so results
+# from different versions can be compared stage by stage.
+
+REGISTERS = ["ax", "bx", "cx", "dx", "ix", "bp", "sp", "lr"]
+RR_OPCODES = ["ADD", "SUB", "AND", "OR", "XOR", "CMP", "LSL", "LSR", "ADC", "SBC", "TEST", "ASR", "MOV"]
+RI_OPCODES = ["ADD", "SUB", "CMP", "LSL", "LSR", "MOVL", "MOVH"]
+MASK_OPCODES = ["AND", "OR", "XOR"]
+MASKS = ["$5555", "$3333", "$0F0F", "$00FF", "$FF00", "$FFFF"]
+LOAD_STORE_OPCODES = ["LOADW", "STOREW", "LOADB", "STOREB"]
+CONDITION_CODES = ["EQ", "NE", "GE", "GT", "LT", "LE", "CS", "CC"]
+
+DEFAULT_MIX = {
+    "alu_rr": 30,
+    "alu_ri": 25,
+    "load_store": 20,
+    "branch": 15,
+    "data": 2,
+    "comment": 8,
+}
+
+# one label every this many statements; branches target labels within a few
+# blocks so that every offset stays encodable
+LABEL_SPACING = 16
+BRANCH_REACH = 3
+
+
+def generate_program(size, mix=None, seed=0):
+    """Generate a SWISS program of roughly size statements.
+
+    Programs start at address 0, so up to about 30000 statements fit in the
+    64KB address space.
+
+    mix maps the categories in DEFAULT_MIX to relative weights. Branches jump
+    both forwards and backwards to nearby labels, and data directives emit
+    .byte/.word/.ascii lines, so the result assembles without errors.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    categories = list(mix)
+    weights = [mix[category] for category in categories]
+    num_labels = max(1, (size + LABEL_SPACING - 1) // LABEL_SPACING)
+    lines = [".seek $0000"]
+    for i in range(size):
+        block = i // LABEL_SPACING
+        if i % LABEL_SPACING == 0:
+            lines.append("L%d:" % block)
+        category = rng.choices(categories, weights)[0]
+        reg = rng.choice(REGISTERS)
+        if category == "alu_rr":
+            lines.append("  %s %%%s, %%%s" % (rng.choice(RR_OPCODES), reg, rng.choice(REGISTERS)))
+        elif category == "alu_ri":
+            if rng.random() < 0.25:
+                lines.append("  %s %%%s, %s" % (rng.choice(MASK_OPCODES), reg, rng.choice(MASKS)))
+            else:
+                opcode = rng.choice(RI_OPCODES)
+                limit = 255 if opcode in ("MOVL", "MOVH") else 31
+                lines.append("  %s %%%s, #%d" % (opcode, reg, rng.randint(0, limit)))
+        elif category == "load_store":
+            opcode = rng.choice(LOAD_STORE_OPCODES)
+            mode = rng.randrange(3)
+            if mode == 0:
+                base = rng.choice(["ix", "sp"])
+                lines.append("  %s %%%s, [%%%s, #%d]" % (opcode, reg, base, rng.randint(-64, 63)))
+            elif mode == 1:
+                lines.append("  %s %%%s, [%%%s, #%d]!" % (opcode, reg, rng.choice(REGISTERS), rng.randint(-16, 15)))
+            else:
+                lines.append("  %s %%%s, [%%%s], #%d" % (opcode, reg, rng.choice(REGISTERS), rng.randint(-16, 15)))
+        elif category == "branch":
+            target = rng.randint(max(0, block - BRANCH_REACH), min(num_labels - 1, block + BRANCH_REACH))
+            kind = rng.randrange(4)
+            if kind == 0:
+                lines.append("  J.%s L%d" % (rng.choice(CONDITION_CODES), target))
+            elif kind == 1:
+                lines.append("  JMP L%d" % target)
+            elif kind == 2:
+                lines.append("  CALL L%d" % target)
+            else:
+                lines.append("  %s %%%s" % (rng.choice(["JMP", "CALL"]), reg))
+        elif category == "data":
+            kind = rng.randrange(3)
+            if kind == 0:
+                lines.append("  .byte " + ", ".join("#%d" % rng.randint(0, 255) for _ in range(8)))
+            elif kind == 1:
+                lines.append("  .word " + ", ".join("$%04X" % rng.randint(0, 0xFFFF) for _ in range(4)))
+            else:
+                lines.append('  .ascii "bench%06d"' % i)
+            # keep instructions word-aligned after odd-sized data
+            lines.append("  .align #2")
+        else:
+            lines.append("; filler comment %d" % i)
+    lines.append("  HALT")
+    return "\n".join(lines) + "\n"
+
+
+def time_stage(fn, setup, repeat):
+    """Run fn(setup()) repeat times, timing only fn. Returns the timings."""
+    timings = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def parse_tokenized(tokenized):
+    return list(parse.parse_tokenized(tokenized))
+
+
+def run_benchmark(source, repeat=5, encoder="int"):
+    """Time each assembler stage on source, returning {stage: [seconds, ...]}."""
+    tokenized = list(lex.tokenize_lines(source))
+
+    def emit(statements, image):
+        if encoder in cheesegrater.VECTOR_ENCODERS:
+            cheesegrater.emit_numpy(statements, image)
+        else:
+            cheesegrater.emit_statements(statements, image, cheesegrater.encoder_backend(encoder))
+
+    def parsed_statements():
+        return parse_tokenized(tokenized)
+
+    def located():
+        return cheesegrater.build_statements(parse_tokenized(tokenized))
+
+    def resolved():
+        return cheesegrater.resolve_labels(*located())
+
+    def emitted():
+        image = cheesegrater.WheelImage()
+        emit(resolved(), image)
+        return image
+
+    def resolve(located_statements):
+        cheesegrater.resolve_labels(*located_statements)
+
+    def encode(statements):
+        image = cheesegrater.WheelImage()
+        emit(statements, image)
+
+    def write_wheel(image):
+        image.to_bytes()
+        image.to_sparse_bytes()
+
+    stages = {
+        "lex": (lambda _: list(lex.tokenize_lines(source)), lambda: None),
+        "parse": (parse_tokenized, lambda: tokenized),
+        "layout": (lambda parsed: cheesegrater.build_statements(parsed), parsed_statements),
+        "labels": (resolve, located),
+        "encode": (encode, resolved),
+        "wheel": (write_wheel, emitted),
+        "total": (lambda _: cheesegrater.assemble(source, encoder), lambda: None),
+    }
+    return {name: time_stage(fn, setup, repeat) for name, (fn, setup) in stages.items()}
+
+
+def summarize(timings, num_lines):
+    summary = {}
+    for stage, runs in timings.items():
+        best = min(runs)
+        summary[stage] = {
+            "best_s": best,
+            "median_s": statistics.median(runs),
+            "lines_per_s": num_lines / best if best else None,
+        }
+    return summary
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark the assembler stage by stage on synthetic SWISS programs."
+    )
+    arg_parser.add_argument(
+        "-n", "--size", type=int, default=20000, help="statements per generated program"
+    )
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("-r", "--repeat", type=int, default=5)
+    arg_parser.add_argument(
+        "--mix",
+        help="comma-separated category=weight pairs overriding the default mix, e.g. alu_rr=50,branch=50",
+    )
+    arg_parser.add_argument(
+        "--encoder", choices=cheesegrater.ENCODER_NAMES, default="int"
+    )
+    arg_parser.add_argument(
+        "-o", "--output", help="append results to this file as one JSON line per run"
+    )
+    arg_parser.add_argument(
+        "--emit-source", metavar="PATH", help="also write the generated program to PATH"
+    )
+    args = arg_parser.parse_args(argv)
+
+    mix = dict(DEFAULT_MIX)
+    if args.mix:
+        mix = {category: 0 for category in DEFAULT_MIX}
+        for pair in args.mix.split(","):
+            category, weight = pair.split("=")
+            if category not in DEFAULT_MIX:
+                arg_parser.error("unknown mix category %s" % category)
+            mix[category] = float(weight)
+
+    source = generate_program(args.size, mix, args.seed)
+    if args.emit_source:
+        with open(args.emit_source, "w") as out:
+            out.write(source)
+    num_lines = source.count("\n")
+    summary = summarize(run_benchmark(source, args.repeat, args.encoder), num_lines)
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "assembler_version": cache.assembler_version(),
+        "python": platform.python_version(),
+        "size": args.size,
+        "lines": num_lines,
+        "seed": args.seed,
+        "mix": mix,
+        "encoder": args.encoder,
+        "repeat": args.repeat,
+        "stages": summary,
+    }
+    for stage, stats in summary.items():
+        print(
+            "%-8s %9.4fs best  %9.4fs median  %12.0f lines/s"
+            % (stage, stats["best_s"], stats["median_s"], stats["lines_per_s"] or 0)
+        )
+    if args.output:
+        with open(args.output, "a") as out:
+            out.write(json.dumps(result) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+from memo import DEFAULT_MAX_ENTRIES, Memo
+
+# Modules whose behaviour determines what a line parses to or encodes as. The
+# cache is discarded whenever any of them changes.
+VERSIONED_MODULES = [
+    "eval_fns",
+    "eval_int_fns",
+    "eval_lookups",
+    "lex",
+    "memo",
+    "opcodes",
+    "parse",
+    "pseudo",
+    "statements",
+    "symbols",
+]
+
+
+def source_digest(module_names):
+    """Hash the source of the given modules, to version things derived from them."""
+    digest = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for name in module_names:
+        with open(os.path.join(root, name + ".py"), "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def assembler_version():
+    return source_digest(VERSIONED_MODULES)
+
+
+# what unpickling a truncated or foreign file can raise
+UNPICKLING_ERRORS = (
+    EOFError,
+    pickle.UnpicklingError,
+    AttributeError,
+    ImportError,
+    IndexError,
+    TypeError,
+    ValueError,
+)
+
+
+def load_versioned(path, version):
+    """Return the dict pickled at path if it carries version, else None."""
+    try:
+        with open(path, "rb") as cache_file:
+            contents = pickle.load(cache_file)
+    except OSError:
+        return None
+    except UNPICKLING_ERRORS:
+        # a corrupt or foreign file is just a cache miss
+        return None
+    if not isinstance(contents, dict) or contents.get("version") != version:
+        return None
+    return contents
+
+
+def dump_atomically(path, contents):
+    """Pickle contents to path through a temporary file and a rename."""
+    cache_dir = os.path.dirname(os.path.abspath(path))
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as cache_file:
+            pickle.dump(contents, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class AssemblyCache(Memo):
+    """On-disk cache of parsed lines and encoded instructions.
+
+    The memo's two LRU layers (see memo.Memo) are loaded when the cache is
+    opened and written back atomically by save(), so concurrent writers never
+    corrupt the file (the last one to save wins).
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__(max_entries)
+        self.path = path
+        self.version = assembler_version()
+        self.load()
+
+    def load(self):
+        contents = load_versioned(self.path, self.version)
+        if contents is None:
+            return
+        self.statements = contents["statements"]
+        self.encodings = contents["encodings"]
+
+    def save(self):
+        for layer in (self.statements, self.encodings):
+            while len(layer) > self.max_entries:
+                layer.popitem(last=False)
+        dump_atomically(
+            self.path,
+            {
+                "version": self.version,
+                "statements": self.statements,
+                "encodings": self.encodings,
+            },
+        )
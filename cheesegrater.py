@@ -1,154 +1,554 @@
 #!/usr/bin/env python3
-from bitstring import BitArray
-import sys
+import time
+
+# taken before anything else is imported, for --time-startup; the CPU time
+# used so far is the interpreter's own startup. Every phase is measured on this
+# one clock so that the phases add up to the total.
+STARTED = time.process_time()
+
 import os
+import sys
+import lex
 import parse
-import eval_fns
+import eval_int_fns
+import eval_lookups
+import wheel
+from statements import PROCESSOR_START_ADDR, align_offset
+from symbols import SymbolTable, out_of_range
+from wheel import WheelImage
 
-WHEEL_VERSION = 2
-PROCESSOR_START_ADDR = 0xF000
+# Everything else (argparse for the command line, bitstring for the bitarray
+# encoder, relaxation, caching, statistics) is imported where it is first needed, since for a small source
+# file importing it would take longer than assembling.
 
-# Handle arguments
-if "-h" in sys.argv:
-    print(
-        "Run with 2 arguments. Arg1 is the input file path, arg2 is the output file path."
-    )
-    exit(0)
 
-if len(sys.argv) < 3:
-    print(
-        "Run with at least 2 arguments. Arg1 is the input file path, arg2 is the output file path. Additional args are memdump files to add."
-    )
-    exit(1)
-
-in_path = sys.argv[1]
-# in_path = "sws/multiple_strlen.sws"
-out_path = sys.argv[2]
-# out_path = "out"
-if not os.path.exists(in_path):
-    print("No such file exists for input file of:\n\t%s" % in_path)
-    exit(1)
-
-labels = {}
-current_offset = PROCESSOR_START_ADDR
-
-print("parsing")
-statements = []
-# 1. Parse file, list of statements
-# As we parse, keep the current offset.
-# This allows us to determine label locations, needed during eval.
-# We also build the label table here.
-with open(in_path, "r") as infile:
-    for line in infile:
-        # print(current_offset)
-        try:
-            statement = parse.parse_line(line.strip())
-        except SyntaxError as e:
-            print(e)
-            sys.exit(1)
-        if statement is None:
-            continue
-        if "size" not in statement:
-            statement["size"] = 0
-        if statement["type"] == "label":
-            label = statement["label"]
-            if label in labels:
-                raise SyntaxError("Duplicate label %s!" % statement["label"])
-            labels[label] = current_offset
-        elif statement["type"] == "seek":
-            current_offset = statement["seek"]
-        elif statement["type"] == "align":
-            current_offset = (
-                (current_offset + statement["align"] - 1) // statement["align"]
-            ) * statement["align"]
-        else:
-            current_offset += statement["size"]
+def encode_checked(statement):
+    # run both backends and insist on bit-exact agreement
+    import eval_fns
 
-        statements.append(statement)
-        # print("\t", parsed)
+    int_bytes = eval_int_fns.encode_statement(statement)
+    bitarray_bytes = eval_fns.encode_statement(statement)
+    if int_bytes != bitarray_bytes:
+        raise AssertionError(
+            "Encoder mismatch for %s: int backend %s, bitarray backend %s"
+            % (statement, int_bytes.hex(), bitarray_bytes.hex())
+        )
+    return int_bytes
+
+
+ENCODER_BACKENDS = ["bitarray", "check", "int"]
 
-# pprint.pprint(statements)
-print("==============================")
-# pprint.pprint(labels)
-# exit()
+# encoders that work on the whole program at once rather than per statement
+VECTOR_ENCODERS = ["numpy"]
+ENCODER_NAMES = ENCODER_BACKENDS + VECTOR_ENCODERS
 
-# 2. Evaluate file
-#   b. Loop over a second time, this time evaluating each instruction.
-#      This step emits instructions to be written to the file.
 
-current_offset = PROCESSOR_START_ADDR
+def encoder_backend(encoder):
+    """Return the encode_statement function of a per-statement encoder."""
+    if encoder == "int":
+        return eval_int_fns.encode_statement
+    if encoder == "bitarray":
+        import eval_fns
 
+        return eval_fns.encode_statement
+    if encoder == "check":
+        return encode_checked
+    raise ValueError("Unknown encoder %s" % encoder)
 
-with open(out_path, "wb") as file:
-    # Write WHEEL header
-    #   char magic_identifier[4]; // should be "whee"
-    #   uint8_t version;
-    #   uint8_t num_of_segments;
-    #   uint16_t reserved;
-    file.write(b"whee")
-    file.write(BitArray(uint=WHEEL_VERSION, length=8).bytes)
-    file.write(BitArray(uint=1, length=8).bytes)
-    file.write(BitArray(uint=0, length=16).bytes)
 
-    # having written the header, now we write each segment, starting with the main code segment
-    # format of each header:
-    # uint16_t start_address;
-    # uint16_t length;
-    # uint32_t checksum; // currently unimplemented, but might eventually be
-    file.write(BitArray(uintle=0, length=16).bytes)  # start address is always 0xF000
-    length = 65535
+def build_statements(parsed):
+    """Pass 1: collect parsed statements into a list and build the symbol table.
 
-    file.write(BitArray(uintle=length, length=16).bytes)
-    file.write(BitArray(uint=0, length=32).bytes)  # checksum
+    parsed yields (line number, statement) pairs, as parse.parse_source does.
+    As we go, keep the current offset. This allows us to determine label
+    locations, needed during eval. Every label branch is recorded as a fixup
+    against the index of its statement.
+    """
+    symbols = SymbolTable()
+    statements = []
+    current_offset = PROCESSOR_START_ADDR
+    for _, statement in parsed:
+        if statement.type == "label":
+            symbols.define(statement.label, current_offset)
+        elif statement.type == "directive" and statement.subtype == "seek":
+            current_offset = statement.seek
+        elif statement.type == "directive" and statement.subtype == "align":
+            current_offset = align_offset(current_offset, statement.align)
+        else:
+            if statement.type == "instruction":
+                branch_dest = statement.branch_dest
+                if branch_dest is not None and branch_dest.type == "LABEL":
+                    symbols.reference(len(statements), branch_dest.dest, statement.instr_type)
+                    # kept so that resolution can check the branch's reach
+                    statement.address = current_offset
+            current_offset += statement.size
 
-    block_start = file.tell()
+        statements.append(statement)
+    return statements, symbols
 
-    file.seek(block_start + current_offset)
 
-    # assemble
-    print("assembling")
+def resolve_labels(statements, symbols, relax=True, scratch=None):
+    """Patch label jumps with the address of the label they refer to.
 
-    for statement in statements:
-        if statement["type"] == "instruction":
-            # patch label jumps if needed
-            if (
-                "branch_dest" in statement
-                and statement["branch_dest"]["type"] == "LABEL"
-            ):
-                statement["branch_dest"]["dest"] = labels[
-                    statement["branch_dest"]["dest"]
-                ]
-            statement["address"] = current_offset
-            insnbits = eval_fns.INSTR_TYPE_TO_EVAL_FN[statement["instr_type"]](
-                statement
-            )
+    Every duplicate or undefined label is reported at once. Only the recorded
+    fixups are visited, not every statement.
+
+    If relax is set, branches that cannot reach their label are rewritten
+    into longer sequences (see relax.py); scratch names the register that
+    absolute jumps may clobber. Returns the statement list to emit, which is
+    a new list if anything was relaxed. symbols.fixups then indexes into the
+    new list, but absolute jumps hold their target as fixed immediates, so
+    the result of a relaxation is final: it cannot be resolved again for
+    different label addresses.
+    """
+    symbols.check()
+    if relax and out_of_range(statements, symbols):
+        import relax as branch_relax
+
+        return branch_relax.relax_branches(statements, symbols, PROCESSOR_START_ADDR, scratch)
+    addresses = symbols.addresses
+    fixups = symbols.fixups
+    for index, label_id in zip(fixups.sites, fixups.label_ids):
+        statements[index].branch_dest.dest = addresses[label_id]
+    return statements
 
-            insnbits.byteswap()
-            file.write(insnbits.bytes)
+
+def emit_statements(statements, image, encode_statement):
+    """Pass 2: evaluate each statement and write its bytes into the image."""
+    current_offset = PROCESSOR_START_ADDR
+    for statement in statements:
+        if statement.type == "instruction":
+            statement.address = current_offset
+            image.write_at(current_offset, encode_statement(statement))
             current_offset += 2
-        elif statement["type"] == "directive":
+        elif statement.type == "directive":
             # handle directive
             # bytes-type things
-            if statement["subtype"] == "bytes":
-                file.write(statement["bytes"])
-                current_offset += statement["size"]
-            elif statement["subtype"] == "seek":
-                file.seek(block_start + statement["seek"])
-                current_offset = statement["seek"]
-            elif statement["subtype"] == "align":
-                current_offset = (
-                    (current_offset + statement["align"] - 1) // statement["align"]
-                ) * statement["align"]
-                diff = current_offset - (file.tell() - 16)
-                file.write(statement["fill"] * diff)
+            if statement.subtype == "bytes":
+                image.write_at(current_offset, statement.bytes)
+                current_offset += statement.size
+            elif statement.subtype == "seek":
+                current_offset = statement.seek
+            elif statement.subtype == "align":
+                aligned = align_offset(current_offset, statement.align)
+                image.write_at(current_offset, statement.fill * (aligned - current_offset))
+                current_offset = aligned
             else:
-                print("Unknown directive subtype", statement)
-        elif statement["type"] == "label":
+                raise ValueError("Unknown directive subtype %s" % statement)
+        elif statement.type == "label":
             # nothing to do for label definitions at this stage
             pass
+        else:
+            raise ValueError("Unknown statement type %s" % statement)
+
+
+def emit_numpy(statements, image):
+    """Pass 2 with the vectorised NumPy encoder (see eval_numpy)."""
+    import eval_numpy
+
+    if not eval_numpy.emit_statements(statements, image, PROCESSOR_START_ADDR):
+        # the program seeks back over itself, so write order matters
+        emit_statements(statements, image, eval_int_fns.encode_statement)
 
+
+def call_untimed(name, run_phase, *args):
+    return run_phase(*args)
+
+
+def encoder_for(encoder, cache=None):
+    """Return the encode_statement function for encoder, memoised by cache.
+
+    Returns None for a vector encoder, which works on the whole program.
+    """
+    if encoder in VECTOR_ENCODERS:
+        return None
+    encode_statement = encoder_backend(encoder)
+    if cache is not None:
+        encode_statement = cache.wrap_encoder(encode_statement, encoder)
+    return encode_statement
+
+
+def optimize_parsed(parsed):
+    import peephole
+
+    return peephole.optimize(parsed)
+
+
+def emit_image(statements, encode_statement):
+    """Pass 2 into a new WheelImage; encode_statement is None for NumPy."""
+    image = WheelImage()
+    if encode_statement is None:
+        emit_numpy(statements, image)
+    else:
+        emit_statements(statements, image, encode_statement)
+    return image
+
+
+def assemble(
+    source,
+    encoder="int",
+    cache=None,
+    stats=None,
+    relax=True,
+    scratch=None,
+    optimize=False,
+    include_dir=None,
+    parse_jobs=None,
+):
+    """Assemble SWISS source text into an in-memory WheelImage.
+
+    encoder selects one of ENCODER_NAMES. If a memo.Memo (or its on-disk
+    form, cache.AssemblyCache) is given, lines and instructions it has seen
+    before are taken from it instead of being parsed and encoded again. If
+    a stats.Stats is given, each pass is timed and every encoded instruction
+    counted into it. relax and scratch control branch relaxation, as for
+    resolve_labels, and optimize runs the peephole pass. .include and
+    .incbin paths are relative to include_dir (default: the working
+    directory). If parse_jobs is given, the source is parsed in chunks on
+    that many processes (0 for all cores, see chunked.py), unless a cache or
+    optimize is also given.
+    Nothing is printed or written to disk, so this can be called repeatedly
+    from one long-lived process.
+    """
+    # every pass goes through timed, which with stats times it on its own
+    timed = call_untimed if stats is None else stats.timed
+    encode_statement = encoder_for(encoder, cache)
+    if stats is not None and encode_statement is not None:
+        encode_statement = stats.wrap_encoder(encode_statement)
+    if parse_jobs is not None and cache is None and not optimize:
+        import chunked
+
+        # lexing, parsing and layout all happen inside the chunk workers
+        statements, symbols = timed(
+            "parse", chunked.build_statements, source, include_dir, parse_jobs
+        )
+    else:
+        if cache is None:
+            tokenized = timed("lex", lex.tokenize_lines, source)
+            parsed = timed("parse", parse.parse_tokenized, tokenized, include_dir)
         else:
-            print("Unknown statement type", statement)
+            parsed = timed("parse", cache.parse_source, source, include_dir)
+        if optimize:
+            parsed = timed("optimize", optimize_parsed, parsed)
+        statements, symbols = timed("layout", build_statements, parsed)
+    if stats is not None:
+        stats.count_statements(statements)
+    statements = timed("labels", resolve_labels, statements, symbols, relax, scratch)
+    image = timed("encode", emit_image, statements, encode_statement)
+    if stats is not None and encode_statement is None:
+        # vectorised encoders have no per-instruction calls to count
+        stats.count_instructions(statements)
+    return image
+
+
+def scratch_register(name):
+    """Turn a register name such as %bp into the form resolve_labels expects."""
+    register = name.lstrip("%").upper()
+    if register not in eval_lookups.REG_BITS:
+        raise ValueError("unknown register %s" % name)
+    return register
+
+
+def assemble_file(
+    in_path,
+    encoder="int",
+    cache=None,
+    stats=None,
+    relax=True,
+    scratch=None,
+    optimize=False,
+    parse_jobs=None,
+):
+    with open(in_path, "r") as infile:
+        source = infile.read()
+    # .include paths are relative to the file doing the including
+    include_dir = os.path.dirname(os.path.abspath(in_path))
+    return assemble(
+        source, encoder, cache, stats, relax, scratch, optimize, include_dir, parse_jobs
+    )
+
+
+def main(argv=None):
+    entered_main = time.process_time()
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        description="Assemble a SWISS source file into a WHEEL executable."
+    )
+    arg_parser.add_argument(
+        "paths",
+        nargs="*",
+        metavar="PATH",
+        help="INPUT OUTPUT, or with --batch any number of INPUT files",
+    )
+    arg_parser.add_argument(
+        "--encoder",
+        choices=ENCODER_NAMES,
+        default="int",
+        help="instruction encoder; 'check' runs both encoders and compares their output, "
+        "'numpy' encodes whole groups of instructions at once",
+    )
+    arg_parser.add_argument(
+        "--cache",
+        metavar="CACHE_FILE",
+        help="reuse parsed lines and encoded instructions from this cache file, updating it afterwards",
+    )
+    arg_parser.add_argument(
+        "--memo",
+        action="store_true",
+        help="reuse the parse and encoding of repeated lines within this run (or, in batch mode, within each worker)",
+    )
+    arg_parser.add_argument(
+        "--sparse",
+        action="store_true",
+        help="write one WHEEL wedge per touched address range instead of a full 64KB image",
+    )
+    arg_parser.add_argument(
+        "--merge-gap",
+        type=int,
+        default=wheel.DEFAULT_MERGE_GAP,
+        metavar="BYTES",
+        help="with --sparse, merge ranges separated by fewer than this many bytes (default: %d)"
+        % wheel.DEFAULT_MERGE_GAP,
+    )
+    arg_parser.add_argument(
+        "-O",
+        "--optimize",
+        action="store_true",
+        help="run the peephole optimiser over the parsed program (see peephole.py)",
+    )
+    arg_parser.add_argument(
+        "--no-relax",
+        action="store_true",
+        help="report out-of-range branches as errors instead of rewriting them into longer sequences",
+    )
+    arg_parser.add_argument(
+        "--relax-scratch",
+        metavar="REGISTER",
+        help="register that relaxed JMP and J.cc branches may clobber to reach any address, e.g. %%bp",
+    )
+    arg_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="assemble in constant memory, streaming the source line by line (integer encoder only, no branch relaxation)",
+    )
+    arg_parser.add_argument(
+        "--parse-jobs",
+        type=int,
+        metavar="N",
+        help="parse the source in chunks on N processes (0: all cores), for very large files; "
+        "not combined with --cache, --memo or -O",
+    )
+    arg_parser.add_argument(
+        "-c",
+        "--object",
+        action="store_true",
+        help="write a relocatable object for link.py instead of a WHEEL (INPUT.obj in batch mode)",
+    )
+    arg_parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="assemble every PATH in parallel, writing INPUT.wheel for each",
+    )
+    arg_parser.add_argument(
+        "--manifest",
+        help="file listing inputs (and optionally outputs) to assemble in batch mode",
+    )
+    arg_parser.add_argument(
+        "--out-dir", help="in batch mode, write outputs into this directory"
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes in batch mode (default: all cores)",
+    )
+    arg_parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print time spent in each phase and counts per instruction type and opcode",
+    )
+    arg_parser.add_argument(
+        "--stats-json",
+        metavar="PATH",
+        help="write the --stats report to PATH as JSON",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="run under cProfile and dump the profile to PATH (view with python -m pstats PATH)",
+    )
+    arg_parser.add_argument(
+        "--time-startup",
+        action="store_true",
+        help="print how long interpreter startup, imports and the assembly itself took",
+    )
+    args = arg_parser.parse_args(argv)
+    started_main = time.process_time()
+
+    if args.encoder == "numpy":
+        import importlib.util
+
+        if importlib.util.find_spec("numpy") is None:
+            arg_parser.error("--encoder=numpy needs NumPy to be installed")
+
+    if args.object:
+        if args.stream or args.cache or args.memo or args.encoder in VECTOR_ENCODERS:
+            arg_parser.error("--object cannot be combined with --stream, --cache, --memo or --encoder=numpy")
+        if args.parse_jobs is not None or args.no_relax or args.relax_scratch:
+            # objects are always parsed in one piece and never relaxed
+            arg_parser.error("--object cannot be combined with --parse-jobs, --no-relax or --relax-scratch")
+        if args.stats or args.stats_json or args.profile:
+            arg_parser.error("--stats, --stats-json and --profile are not supported with --object")
+    batch_mode = args.batch or args.manifest
+    if batch_mode:
+        if args.stats or args.stats_json or args.profile or args.time_startup:
+            arg_parser.error(
+                "--stats, --stats-json, --profile and --time-startup are not supported in batch mode"
+            )
+        if args.cache or args.parse_jobs is not None:
+            # workers would race on one cache file, and files are already
+            # assembled in parallel
+            arg_parser.error("--cache and --parse-jobs are not supported in batch mode; use --memo and -j")
+    elif len(args.paths) != 2:
+        arg_parser.error("expected an INPUT and an OUTPUT path")
+    if args.stream and args.cache:
+        arg_parser.error("--stream cannot be combined with --cache")
+    if args.stream and args.optimize:
+        arg_parser.error("--stream cannot be combined with -O")
+    if args.parse_jobs is not None and args.parse_jobs < 0:
+        arg_parser.error("--parse-jobs must be 0 (all cores) or a number of processes")
+    if args.parse_jobs is not None and (args.stream or args.cache or args.memo or args.optimize):
+        arg_parser.error("--parse-jobs cannot be combined with --stream, --cache, --memo or -O")
+    scratch = None
+    if args.relax_scratch:
+        try:
+            scratch = scratch_register(args.relax_scratch)
+        except ValueError as e:
+            arg_parser.error(str(e))
+    if batch_mode:
+        return batch_main(args, scratch)
+
+    in_path, out_path = args.paths
+    cache = None
+    if args.cache:
+        import cache as assembly_cache
+
+        cache = assembly_cache.AssemblyCache(args.cache)
+    elif args.memo:
+        import memo
+
+        cache = memo.Memo()
+    stats = None
+    if args.stats or args.stats_json:
+        import stats as assembler_stats
+
+        stats = assembler_stats.Stats()
+    profiler = None
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        status = assemble_main(args, in_path, out_path, cache, stats, scratch)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+    if status == 0 and stats is not None:
+        if cache is not None:
+            stats.memo = cache.hit_rates()
+        if args.stats:
+            print(stats.format_report())
+        if args.stats_json:
+            stats.write_json(args.stats_json)
+    if args.time_startup:
+        print_startup_times(entered_main, started_main, time.process_time())
+    return status
+
+
+def print_startup_times(entered_main, started_main, finished):
+    print(
+        "CPU time: interpreter %.1f ms, imports %.1f ms, arguments %.1f ms, assembly %.1f ms, total %.1f ms"
+        % (
+            STARTED * 1000,
+            (entered_main - STARTED) * 1000,
+            (started_main - entered_main) * 1000,
+            (finished - started_main) * 1000,
+            finished * 1000,
+        ),
+        file=sys.stderr,
+    )
+
+
+def assemble_main(args, in_path, out_path, cache, stats, scratch):
+    import contextlib
+
+    try:
+        if args.object:
+            import objfile
+
+            obj = objfile.assemble_object_file(in_path, args.encoder, args.optimize)
+            objfile.write_object(obj, out_path)
+            return 0
+        if args.stream:
+            import stream
+
+            # streaming interleaves every pass, so it is timed as one phase
+            with stats.phase("stream") if stats else contextlib.nullcontext():
+                image = stream.assemble_stream_file(in_path)
+        else:
+            image = assemble_file(
+                in_path,
+                args.encoder,
+                cache,
+                stats,
+                not args.no_relax,
+                scratch,
+                args.optimize,
+                args.parse_jobs,
+            )
+    except FileNotFoundError:
+        print("No such file exists for input file of:\n\t%s" % in_path)
+        return 1
+    except (SyntaxError, EOFError, ValueError) as e:
+        print(e)
+        return 1
+    with stats.phase("wheel") if stats else contextlib.nullcontext():
+        image.write(out_path, args.sparse, args.merge_gap)
+    if args.cache:
+        cache.save()
+    return 0
+
+
+def batch_main(args, scratch):
+    import batch
+
+    extension = ".obj" if args.object else ".wheel"
+    jobs = [(path, batch.output_path_for(path, args.out_dir, extension)) for path in args.paths]
+    if args.manifest:
+        jobs += batch.read_manifest(args.manifest, args.out_dir, extension)
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    options = batch.BatchOptions(
+        args.encoder,
+        args.memo,
+        args.object,
+        args.optimize,
+        not args.no_relax,
+        scratch,
+        args.stream,
+        args.sparse,
+        args.merge_gap,
+    )
+    results = batch.run_batch(jobs, args.jobs, options)
+    failures = batch.print_report(results, time.perf_counter() - start)
+    return 1 if failures else 0
+
 
-    file.seek(65535 + block_start)
-    file.write(b"\0")
+if __name__ == "__main__":
+    sys.exit(main())
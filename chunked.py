@@ -0,0 +1,118 @@
+import concurrent.futures
+import functools
+import os
+
+import lex
+import parse
+from statements import PROCESSOR_START_ADDR, align_offset, from_fields, to_fields
+from symbols import SymbolTable
+
+# Pass 1 for one very large source, parsed in line-aligned chunks on a pool of
+# worker processes. A worker cannot know where its chunk will end up, so it
+# lays the chunk out relative to the chunk's start and returns, along with the
+# statements, the events the merge needs in source order:
+#
+#   ("label", name, offset)                          a label definition
+#   ("branch", index, name, instr_type, offset)      a label branch
+#   ("seek", address)                                a .seek
+#   ("align", offset, boundary)                      a .align
+#
+# Offsets count from the chunk start or from the last .seek/.align before
+# them, whichever is later; index counts statements within the chunk. The
+# merge then only walks the events, adding each chunk's running base address
+# (a prefix sum over the chunk sizes, restarted by .seek and rounded up by
+# .align), and interns labels in the same order build_statements would.
+# Statements travel back as statements.to_fields tuples, which unpickle
+# faster than the objects themselves.
+
+# chunks smaller than this are not worth sending to another process
+MIN_CHUNK_LINES = 20000
+
+
+def parse_chunk(chunk, include_dir=None):
+    text, first_line = chunk
+    statements = []
+    events = []
+    offset = 0
+    for _, statement in parse.parse_tokenized(lex.tokenize_lines(text, first_line), include_dir):
+        if statement.type == "label":
+            events.append(("label", statement.label, offset))
+        elif statement.type == "directive" and statement.subtype == "seek":
+            events.append(("seek", statement.seek))
+            offset = 0
+        elif statement.type == "directive" and statement.subtype == "align":
+            events.append(("align", offset, statement.align))
+            offset = 0
+        else:
+            if statement.type == "instruction":
+                branch_dest = statement.branch_dest
+                if branch_dest is not None and branch_dest.type == "LABEL":
+                    events.append(
+                        ("branch", len(statements), branch_dest.dest, statement.instr_type, offset)
+                    )
+            offset += statement.size
+        statements.append(to_fields(statement))
+    return statements, events, offset
+
+
+def split_source(source, count):
+    """Split source at line ends into at most count (text, first line) chunks."""
+    chunks = []
+    start = 0
+    first_line = 1
+    for i in range(1, count + 1):
+        end = len(source) if i == count else source.find("\n", len(source) * i // count)
+        end = len(source) if end == -1 else end + 1
+        if end <= start:
+            continue
+        chunks.append((source[start:end], first_line))
+        first_line += source.count("\n", start, end)
+        start = end
+    return chunks
+
+
+def merge(results):
+    """Build the statement list and symbol table from the chunks' results."""
+    symbols = SymbolTable()
+    statements = []
+    address = PROCESSOR_START_ADDR
+    for chunk_statements, events, tail in results:
+        index_base = len(statements)
+        statements.extend(map(from_fields, chunk_statements))
+        for event in events:
+            kind = event[0]
+            if kind == "label":
+                symbols.define(event[1], address + event[2])
+            elif kind == "branch":
+                _, index, label, instr_type, offset = event
+                symbols.reference(index_base + index, label, instr_type)
+                statements[index_base + index].address = address + offset
+            elif kind == "seek":
+                address = event[1]
+            else:
+                address = align_offset(address + event[1], event[2])
+        address += tail
+    return statements, symbols
+
+
+def build_statements(source, include_dir=None, workers=None):
+    """Pass 1 over source, parsing it on up to workers processes.
+
+    Returns (statements, symbols) exactly as cheesegrater.build_statements
+    does. A source using .include or .macro is parsed in one piece, since
+    each line's meaning can depend on every macro defined before it.
+    """
+    if workers is not None and workers < 0:
+        raise ValueError("Cannot parse on %d processes" % workers)
+    if parse.uses_preprocessor(source):
+        import cheesegrater
+
+        return cheesegrater.build_statements(parse.parse_source(source, include_dir))
+    workers = workers or os.cpu_count() or 1
+    count = min(workers, source.count("\n") // MIN_CHUNK_LINES + 1)
+    chunks = split_source(source, count)
+    parse_chunk_in_dir = functools.partial(parse_chunk, include_dir=include_dir)
+    if len(chunks) <= 1:
+        return merge(map(parse_chunk_in_dir, chunks))
+    with concurrent.futures.ProcessPoolExecutor(len(chunks)) as executor:
+        return merge(executor.map(parse_chunk_in_dir, chunks))
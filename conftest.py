@@ -0,0 +1,41 @@
+import glob
+import os
+
+import pytest
+
+SAMPLES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "sws", "*.sws")))
+
+# what each sample stores to the simulator's output address
+SAMPLE_OUTPUTS = {
+    "loop": [5, 4, 3, 2, 1],
+    "multiple_strlen": [12, 9, 8, 15],
+    "nested_call": [84],
+    "popcount": [5, 4, 16, 8],
+    "simple_call_ret": [84],
+    "strlen": [12],
+}
+
+
+@pytest.fixture(params=SAMPLES, ids=os.path.basename)
+def sample_path(request):
+    """Each program in sws/ in turn."""
+    return request.param
+
+
+@pytest.fixture
+def sample_output(sample_path):
+    return SAMPLE_OUTPUTS[os.path.splitext(os.path.basename(sample_path))[0]]
+
+
+@pytest.fixture
+def sample_source(sample_path):
+    with open(sample_path, "r") as infile:
+        return infile.read()
+
+
+@pytest.fixture(scope="session")
+def decode_table(tmp_path_factory):
+    import disasm
+
+    # kept out of the user's cache directory
+    return disasm.load_table(str(tmp_path_factory.mktemp("disasm") / "decode_table.pickle"))
@@ -0,0 +1,96 @@
+import eval_lookups
+
+# Instruction decoder: the inverse of the encoding tables in eval_lookups,
+# shared by the simulator and the disassembler.
+#
+# decode(word) returns (opcode, form, operands) with registers as 3-bit
+# register numbers, or None if the word is not a valid instruction:
+#
+#   form           operands
+#   "noarg"        ()
+#   "jcc"          (condition code, signed word offset)
+#   "jump"         (signed word offset,)                 JMP/CALL
+#   "jump_reg"     (register,)                           JMP/CALL
+#   "rr"           (dst, src)                            ALU ops and MOV
+#   "ri"           (dst, immediate)                      AND/OR/XOR with the
+#                                                        mask value, MOVL/MOVH
+#   "base-offset"  (trf, base register, signed offset)
+#   "pre-index"    (trf, source register, signed offset)
+#   "post-index"   (trf, source register, signed offset)
+
+REG_NAMES = {bits: name for name, bits in eval_lookups.REG_BITS.items()}
+CC_NAMES = {bits: name for name, bits in eval_lookups.CC_BITS.items()}
+NOARG_NAMES = {word: name for name, word in eval_lookups.NOARG_OPCODES.items()}
+RR_NAMES = {bits: name for name, bits in eval_lookups.ALU_RR_ALUOP_BITS.items()}
+RI_NAMES = {bits: name for name, bits in eval_lookups.ALU_RI_ALUOP_BITS.items()}
+MASK_OPCODES = ("AND", "OR", "XOR")
+
+# top five bits of the word -> (opcode, addressing mode)
+LOAD_STORE_NAMES = {}
+for _name, _bits in eval_lookups.LOAD_STORE_BITS.items():
+    LOAD_STORE_NAMES[_bits] = (_name, "pre-index")
+    LOAD_STORE_NAMES[_bits + 1] = (_name, "post-index")
+    LOAD_STORE_NAMES[_bits + 2] = (_name, "base-offset")
+del _name, _bits
+
+JUMP_CALL_NAMES = {
+    eval_lookups.JUMP_CALL_BASE["JMP"] >> 11: ("JMP", "jump"),
+    (eval_lookups.JUMP_CALL_BASE["JMP"] >> 11) + 1: ("JMP", "jump_reg"),
+    eval_lookups.JUMP_CALL_BASE["CALL"] >> 11: ("CALL", "jump"),
+    (eval_lookups.JUMP_CALL_BASE["CALL"] >> 11) + 1: ("CALL", "jump_reg"),
+}
+
+RR_TOP = eval_lookups.RR_BASE["ADD"] >> 11
+RI_TOP = eval_lookups.RI_BASE["ADD"] >> 11
+MOVL_TOP = eval_lookups.RI_BASE_MOVL >> 11
+MOVH_TOP = eval_lookups.RI_BASE_MOVH >> 11
+JCC_TOP = eval_lookups.JCC_BASE["EQ"] >> 11
+MOV_HIGH_BYTE = eval_lookups.RR_BASE_MOV >> 8
+
+
+def signed(value, length):
+    if value >= 1 << (length - 1):
+        return value - (1 << length)
+    return value
+
+
+def decode(word):
+    top = word >> 11
+    dst = word & 0b111
+    src = (word >> 3) & 0b111
+    if top == 0:
+        opcode = NOARG_NAMES.get(word)
+        return None if opcode is None else (opcode, "noarg", ())
+    if top == RR_TOP:
+        opcode = RR_NAMES.get((word >> 7) & 0b1111)
+        if opcode is None or word & (1 << 6):
+            return None
+        return (opcode, "rr", (dst, src))
+    if top == RI_TOP:
+        opcode = RI_NAMES[(word >> 8) & 0b111]
+        immediate = (word >> 3) & 0b11111
+        if opcode in MASK_OPCODES:
+            immediate = eval_lookups.BITMASKS_LOOKUPS[immediate]
+        return (opcode, "ri", (dst, immediate))
+    if top == MOVL_TOP or top == MOVH_TOP:
+        return ("MOVL" if top == MOVL_TOP else "MOVH", "ri", (dst, (word >> 3) & 0xFF))
+    if top == JCC_TOP:
+        return ("J", "jcc", (CC_NAMES[(word >> 8) & 0b111], signed(word & 0xFF, 8)))
+    if word >> 8 == MOV_HIGH_BYTE:
+        if word & (0b11 << 6):
+            return None
+        return ("MOV", "rr", (dst, src))
+    if top in LOAD_STORE_NAMES:
+        opcode, mode = LOAD_STORE_NAMES[top]
+        if mode == "base-offset":
+            base = eval_lookups.REG_BITS["SP" if word & (1 << 10) else "IX"]
+            return (opcode, mode, (dst, base, signed((word >> 3) & 0x7F, 7)))
+        return (opcode, mode, (dst, src, signed((word >> 6) & 0x1F, 5)))
+    if top in JUMP_CALL_NAMES:
+        opcode, form = JUMP_CALL_NAMES[top]
+        if form == "jump":
+            return (opcode, form, (signed(word & 0x7FF, 11),))
+        if word & 0x7F8:
+            return None
+        return (opcode, form, (dst,))
+    return None
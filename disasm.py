@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+
+import cache
+import decode
+import eval_lookups
+from wheel import WheelImage
+
+# Disassembler for WHEEL images. Every one of the 65536 possible words is
+# decoded once into a table entry:
+#
+#   a string              the complete instruction text (or a .word, for the
+#                         few words the assembler would encode differently)
+#   (mnemonic, offset)    a branch, which needs its address to name a target
+#   None                  not a valid instruction, shown as .word
+#
+# The table only depends on the decoder and the encoding tables, so it is
+# pickled under the user's cache directory and rebuilt whenever one of them
+# changes. The output is SWISS source that assembles back to the same memory.
+
+TABLE_MODULES = ["decode", "disasm", "eval_lookups"]
+
+# zero words (HALT) in a row before the rest of the run is left out, since
+# memory the assembler never writes is zero anyway
+ZERO_RUN_WORDS = 8
+
+table = None
+
+
+def default_table_path():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "cheesegrater", "decode_table.pickle")
+
+
+def register(bits):
+    return "%" + decode.REG_NAMES[bits].lower()
+
+
+def format_word(word):
+    """Return the table entry for one word."""
+    decoded = decode.decode(word)
+    if decoded is None:
+        return None
+    opcode, form, operands = decoded
+    if form == "jcc":
+        cc, offset = operands
+        return ("J.%s" % cc, offset)
+    if form == "jump":
+        return (opcode, operands[0])
+    if form == "noarg":
+        return opcode
+    if form == "jump_reg":
+        return "%s %s" % (opcode, register(operands[0]))
+    if form == "rr":
+        return "%s %s, %s" % (opcode, register(operands[0]), register(operands[1]))
+    if form == "ri":
+        dst, immediate = operands
+        if opcode in ("MOVL", "MOVH"):
+            return "%s %s, $%02X" % (opcode, register(dst), immediate)
+        if opcode in decode.MASK_OPCODES:
+            if eval_lookups.BITMASK_CODES[immediate] != (word >> 3) & 0b11111:
+                # a repeated mask, which the assembler encodes with its first index
+                return ".word $%04X ; %s %s, $%04X" % (word, opcode, register(dst), immediate)
+            return "%s %s, $%04X" % (opcode, register(dst), immediate)
+        return "%s %s, #%d" % (opcode, register(dst), immediate)
+    trf, reg, offset = operands
+    if form == "base-offset":
+        return "%s %s, [%s, #%d]" % (opcode, register(trf), register(reg), offset)
+    if form == "pre-index":
+        return "%s %s, [%s, #%d]!" % (opcode, register(trf), register(reg), offset)
+    return "%s %s, [%s], #%d" % (opcode, register(trf), register(reg), offset)
+
+
+def build_table():
+    return [format_word(word) for word in range(1 << 16)]
+
+
+def load_table(path=None):
+    """Return the decode table, from the on-disk copy if it is current."""
+    global table
+    if table is not None:
+        return table
+    path = path or default_table_path()
+    version = cache.source_digest(TABLE_MODULES)
+    contents = cache.load_versioned(path, version)
+    if contents is not None:
+        table = contents["table"]
+        return table
+    table = build_table()
+    try:
+        cache.dump_atomically(path, {"version": version, "table": table})
+    except OSError:
+        # an unwritable cache only costs rebuilding the table next time
+        pass
+    return table
+
+
+def regions(image):
+    """Merge the image's written ranges into sorted, disjoint [start, end) regions."""
+    merged = []
+    for start, end in sorted(image.ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def items(image):
+    """Yield (address, size) for each word or byte to disassemble.
+
+    Long runs of zero words are skipped, keeping the first word after
+    anything non-zero so that a program's final HALT is still shown.
+    """
+    memory = image.memory
+    for start, end in regions(image):
+        address = start
+        if address % 2 and address < end:
+            yield address, 1
+            address += 1
+        while address + 2 <= end:
+            run_end = address
+            while run_end + 2 <= end and memory[run_end] == 0 and memory[run_end + 1] == 0:
+                run_end += 2
+            if run_end - address >= 2 * ZERO_RUN_WORDS:
+                if address != start:
+                    yield address, 2
+                address = run_end
+                continue
+            while address < run_end:
+                yield address, 2
+                address += 2
+            if run_end + 2 <= end:
+                yield run_end, 2
+                address = run_end + 2
+        if address < end:
+            yield address, 1
+
+
+def label_name(address):
+    return "L_%04X" % address
+
+
+def disassemble(image, table=None):
+    """Return SWISS source for the written parts of image, as a list of lines."""
+    table = table or load_table()
+    memory = image.memory
+    layout = list(items(image))
+    word_addresses = {address for address, size in layout if size == 2}
+
+    targets = set()
+    for address in word_addresses:
+        entry = table[memory[address] | (memory[address + 1] << 8)]
+        if type(entry) is tuple:
+            target = address + 2 * entry[1]
+            if target in word_addresses:
+                targets.add(target)
+
+    lines = []
+    expected = None
+    for address, size in layout:
+        if address != expected:
+            lines.append(".seek $%04X" % address)
+        expected = address + size
+        if address in targets:
+            lines.append("%s:" % label_name(address))
+        if size == 1:
+            lines.append("  .byte $%02X" % memory[address])
+            continue
+        word = memory[address] | (memory[address + 1] << 8)
+        entry = table[word]
+        if entry is None:
+            lines.append("  .word $%04X" % word)
+        elif type(entry) is tuple:
+            mnemonic, offset = entry
+            target = address + 2 * offset
+            if target in targets:
+                lines.append("  %s %s" % (mnemonic, label_name(target)))
+            else:
+                # no label can be placed there, so keep the raw word
+                lines.append("  .word $%04X ; %s $%04X" % (word, mnemonic, target & 0xFFFF))
+        else:
+            lines.append("  " + entry)
+    return lines
+
+
+def check_round_trip(table=None, encode_statement=None):
+    """Re-encode every decodable word from its text. Returns the words that differ.
+
+    encode_statement defaults to the integer encoder.
+    """
+    import eval_int_fns
+    import parse
+
+    table = table or load_table()
+    encode_statement = encode_statement or eval_int_fns.encode_statement
+    # far enough from both ends for any branch offset
+    address = 0x8000
+    mismatches = []
+    for word, entry in enumerate(table):
+        if entry is None:
+            continue
+        if type(entry) is tuple:
+            statement = parse.parse_line("%s target" % entry[0])
+            statement.branch_dest.dest = address + 2 * entry[1]
+        elif entry.startswith(".word"):
+            continue
+        else:
+            statement = parse.parse_line(entry)
+        statement.address = address
+        try:
+            encoded = int.from_bytes(encode_statement(statement), "little")
+        except SyntaxError:
+            encoded = None
+        if encoded != word:
+            mismatches.append(word)
+    return mismatches
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Disassemble a WHEEL image into SWISS source that assembles back to it."
+    )
+    arg_parser.add_argument("path", metavar="PATH", nargs="?", help="the .wheel image to disassemble")
+    arg_parser.add_argument("-o", "--output", metavar="FILE", help="write the source here instead of stdout")
+    arg_parser.add_argument("--table", metavar="FILE", help="where to cache the decode table")
+    arg_parser.add_argument(
+        "--check",
+        action="store_true",
+        help="re-encode every decodable word and report any that differ, instead of disassembling",
+    )
+    args = arg_parser.parse_args(argv)
+
+    decode_table = load_table(args.table)
+    if args.check:
+        mismatches = check_round_trip(decode_table)
+        for word in mismatches:
+            entry = decode_table[word]
+            print("0x%04X: %s" % (word, entry if type(entry) is str else "%s %+d" % entry))
+        print(
+            "%d of %d decodable words round-trip"
+            % (sum(entry is not None for entry in decode_table) - len(mismatches), sum(entry is not None for entry in decode_table)),
+            file=sys.stderr,
+        )
+        return 1 if mismatches else 0
+    if args.path is None:
+        arg_parser.error("a WHEEL file to disassemble is required")
+
+    try:
+        image = WheelImage.read(args.path)
+    except FileNotFoundError:
+        print("No such file exists for input file of:\n\t%s" % args.path)
+        return 1
+    except (ValueError, EOFError) as e:
+        print(e)
+        return 1
+    source = "\n".join(disassemble(image, decode_table)) + "\n"
+    if args.output:
+        with open(args.output, "w") as out_file:
+            out_file.write(source)
+    else:
+        sys.stdout.write(source)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import eval_lookups
+import opcodes
+
+# Integer encoder backend. Mirrors eval_fns bit for bit, but builds each 16-bit
+# instruction word with shifts and masks instead of concatenating BitArrays.
+
+
+def check_uint(val, length, what):
+    if not 0 <= val < (1 << length):
+        raise ValueError(
+            "%s %d does not fit in an unsigned %d-bit field" % (what, val, length)
+        )
+    return val
+
+
+def check_int(val, length, what):
+    if not -(1 << (length - 1)) <= val < (1 << (length - 1)):
+        raise ValueError(
+            "%s %d does not fit in a signed %d-bit field" % (what, val, length)
+        )
+    return val & ((1 << length) - 1)
+
+
+def eval_noarg(statement):
+    return eval_lookups.NOARG_OPCODES[statement.opcode]
+
+
+def eval_jcc(statement):
+    base = eval_lookups.JCC_BASE[statement.condition_code]
+    dest = int(statement.branch_dest.dest)
+    offset = dest - statement.address
+    assert offset % 2 == 0
+    return base | check_int(offset // 2, 8, "Branch offset")
+
+
+def eval_jump_call(statement):
+    base = eval_lookups.JUMP_CALL_BASE[statement.opcode]
+    if statement.branch_dest.type == "REGISTER":
+        # reg-type branch: JMPR/CALR are one above their label forms
+        return (base + (1 << 11)) | eval_lookups.REG_BITS[statement.branch_dest.dest]
+    dest = int(statement.branch_dest.dest)
+    offset = dest - statement.address
+    assert offset % 2 == 0
+    return base | check_int(offset // 2, 11, "Jump offset")
+
+
+def eval_load_store(statement):
+    base = eval_lookups.LOAD_STORE_BASE[statement.opcode]
+    trf_int = eval_lookups.REG_BITS[statement.trf]
+    mem_operand = statement.mem_operand
+    if mem_operand.type == "base-offset":
+        # must use either SP or IX as base
+        if mem_operand.source not in ["IX", "SP"]:
+            raise SyntaxError(
+                "Only register %ix or %sp can be used in base + offset addressing!"
+            )
+        s_int = 0 if mem_operand.source == "IX" else 1
+        imm_int = check_int(mem_operand.offset, 7, "Memory offset")
+        return (base + (2 << 11)) | (s_int << 10) | (imm_int << 3) | trf_int
+    # pre or post indexed
+    src_int = eval_lookups.REG_BITS[mem_operand.source]
+    imm_int = check_int(mem_operand.offset, 5, "Memory offset")
+    if mem_operand.type == "post-index":
+        base += 1 << 11
+    return base | (imm_int << 6) | (src_int << 3) | trf_int
+
+
+# opcode -> fixed bits of its RR and RI forms, MOV/MOVL/MOVH included
+RR_BASES = dict(eval_lookups.RR_BASE, MOV=eval_lookups.RR_BASE_MOV)
+RI_BASES = dict(
+    eval_lookups.RI_BASE,
+    MOVL=eval_lookups.RI_BASE_MOVL,
+    MOVH=eval_lookups.RI_BASE_MOVH,
+)
+
+
+def eval_rr_format(statement):
+    # ALU_RR and also MOV
+    src_int = eval_lookups.REG_BITS[statement.src]
+    dst_int = eval_lookups.REG_BITS[statement.dst]
+    return RR_BASES[statement.opcode] | (src_int << 3) | dst_int
+
+
+def eval_ri_format(statement):
+    # ALU_RI and also MOVL/MOVH; the immediate's kind and width come from the
+    # opcode registry
+    dst_int = eval_lookups.REG_BITS[statement.dst]
+    imm_int = int(statement.immediate)
+    opcode = statement.opcode
+    kind, bits = opcodes.OPCODES[opcode].immediate
+    if kind == "mask":
+        code = eval_lookups.BITMASK_CODES.get(imm_int)
+        if code is None:
+            raise SyntaxError(
+                "Immediate 0x%X cannot be encoded for %s instruction!"
+                % (imm_int, opcode)
+            )
+        imm_int = code
+    else:
+        check_uint(imm_int, bits, "Immediate")
+    return RI_BASES[opcode] | (imm_int << 3) | dst_int
+
+
+INSTR_TYPE_TO_EVAL_FN = {
+    "noarg": eval_noarg,
+    "jcc": eval_jcc,
+    "jump_call": eval_jump_call,
+    "load_store": eval_load_store,
+    "rr_format": eval_rr_format,
+    "ri_format": eval_ri_format,
+}
+
+
+def encode_statement(statement):
+    """Encode an instruction statement into its little-endian machine bytes."""
+    return INSTR_TYPE_TO_EVAL_FN[statement.instr_type](statement).to_bytes(
+        2, "little"
+    )
@@ -66,3 +66,88 @@ BITMASKS_LOOKUPS = [0x0000, 0x1111, 0x2222, 0x3333, 0x4444, 0x5555, 0x6666, 0x77
   0x8888, 0x9999, 0xAAAA, 0xBBBB, 0xCCCC, 0xDDDD, 0xEEEE, 0xFFFF,
   0x00FF, 0xFF00, 0x0FF0, 0xF00F, 0x0F0F, 0xF0F0, 0x0000, 0x0000,
   0x0000, 0x0000, 0x0000, 0x0000, 0x0000, 0x0000, 0x0000, 0x0000]
+
+# mask -> 5-bit AND/OR/XOR immediate code, the reverse of BITMASKS_LOOKUPS;
+# a repeated mask is encoded with its first code
+BITMASK_CODES = {
+    0x0000: 0,
+    0x1111: 1,
+    0x2222: 2,
+    0x3333: 3,
+    0x4444: 4,
+    0x5555: 5,
+    0x6666: 6,
+    0x7777: 7,
+    0x8888: 8,
+    0x9999: 9,
+    0xAAAA: 10,
+    0xBBBB: 11,
+    0xCCCC: 12,
+    0xDDDD: 13,
+    0xEEEE: 14,
+    0xFFFF: 15,
+    0x00FF: 16,
+    0xFF00: 17,
+    0x0FF0: 18,
+    0xF00F: 19,
+    0x0F0F: 20,
+    0xF0F0: 21,
+}
+
+
+# Precomputed opcode base words for the integer encoder backend (eval_int_fns).
+# Each value holds the fixed bits of an instruction word; only the operand
+# fields still need to be OR-ed in at encode time. They are written out as
+# literals so that importing this module builds nothing, and have to be kept
+# in step with the *_BITS tables above (disasm.py --check catches a mismatch).
+JCC_BASE = {  # 0b10100 cc3 ........
+    "EQ": 0xA000,
+    "NE": 0xA100,
+    "GE": 0xA200,
+    "GT": 0xA300,
+    "LT": 0xA400,
+    "LE": 0xA500,
+    "CS": 0xA600,
+    "CC": 0xA700,
+}
+
+JUMP_CALL_BASE = {
+    "JMP": 0b11000 << 11,
+    "CALL": 0b11010 << 11,
+}
+
+LOAD_STORE_BASE = {  # LOAD_STORE_BITS << 11
+    "LOADW": 0x2000,
+    "STOREW": 0x4000,
+    "LOADB": 0x6000,
+    "STOREB": 0x8000,
+}
+
+RR_BASE = {  # 0b00001 aluop4 .......
+    "ADD": 0x0800,
+    "SUB": 0x0880,
+    "AND": 0x0900,
+    "OR": 0x0980,
+    "XOR": 0x0A00,
+    "CMP": 0x0A80,
+    "LSL": 0x0B00,
+    "LSR": 0x0B80,
+    "ADC": 0x0C00,
+    "SBC": 0x0C80,
+    "TEST": 0x0D00,
+    "ASR": 0x0D80,
+}
+RR_BASE_MOV = 0b10101000 << 8
+
+RI_BASE = {  # 0b00010 aluop3 ........
+    "ADD": 0x1000,
+    "SUB": 0x1100,
+    "AND": 0x1200,
+    "OR": 0x1300,
+    "XOR": 0x1400,
+    "CMP": 0x1500,
+    "LSL": 0x1600,
+    "LSR": 0x1700,
+}
+RI_BASE_MOVL = 0b00111 << 11
+RI_BASE_MOVH = 0b01011 << 11
@@ -0,0 +1,231 @@
+import numpy as np
+
+import eval_int_fns
+import eval_lookups
+from statements import align_offset
+from wheel import IMAGE_SIZE
+
+# Vectorised pass 2. Instead of one encoder call per instruction, instructions
+# are grouped by instr_type, their operand fields are gathered into arrays, and
+# every word of a group is computed with a handful of array shifts and ORs.
+# Range checks are done array-wide too; when one fails, the first offending
+# statement is handed to the integer backend so the error raised is exactly
+# the one a statement-by-statement build would have raised.
+
+RR_BASES = eval_int_fns.RR_BASES
+RI_BASES = eval_int_fns.RI_BASES
+MEM_MODES = {"pre-index": 0, "post-index": 1, "base-offset": 2}
+
+# immediate -> 5-bit bitmask code for AND/OR/XOR, -1 where not encodable
+MASK_CODES = np.full(0x10000, -1, dtype=np.int64)
+MASK_CODES[list(eval_lookups.BITMASK_CODES)] = list(eval_lookups.BITMASK_CODES.values())
+
+
+def column(values):
+    return np.array(values, dtype=np.int64)
+
+
+def signed_fits(values, length):
+    return (values >= -(1 << (length - 1))) & (values < (1 << (length - 1)))
+
+
+def encode_noarg(group, addresses):
+    words = column([eval_lookups.NOARG_OPCODES[s.opcode] for s in group])
+    return words, np.zeros(len(group), dtype=bool)
+
+
+def encode_rr_format(group, addresses):
+    reg_bits = eval_lookups.REG_BITS
+    base = column([RR_BASES[s.opcode] for s in group])
+    src = column([reg_bits[s.src] for s in group])
+    dst = column([reg_bits[s.dst] for s in group])
+    return base | (src << 3) | dst, np.zeros(len(group), dtype=bool)
+
+
+def encode_ri_format(group, addresses):
+    base = column([RI_BASES[s.opcode] for s in group])
+    dst = column([eval_lookups.REG_BITS[s.dst] for s in group])
+    imm = column([s.immediate for s in group])
+    # MOVL/MOVH take an 8-bit immediate, AND/OR/XOR a bitmask code and the
+    # rest of the ALU ops a 5-bit immediate
+    is_byte = (base >> 11) != 0b00010
+    aluop = (base >> 8) & 0b111
+    is_mask = ~is_byte & (aluop >= 0b010) & (aluop <= 0b100)
+    mask_codes = MASK_CODES[np.clip(imm, 0, 0xFFFF)]
+    mask_codes[(imm < 0) | (imm > 0xFFFF)] = -1
+    limit = np.where(is_byte, 1 << 8, 1 << 5)
+    field = np.where(is_mask, mask_codes, imm)
+    bad = np.where(is_mask, mask_codes < 0, (imm < 0) | (imm >= limit))
+    return base | ((field & 0xFF) << 3) | dst, bad
+
+
+def encode_load_store(group, addresses):
+    reg_bits = eval_lookups.REG_BITS
+    base = column([eval_lookups.LOAD_STORE_BASE[s.opcode] for s in group])
+    trf = column([reg_bits[s.trf] for s in group])
+    operands = [s.mem_operand for s in group]
+    mode = column([MEM_MODES[m.type] for m in operands])
+    src = column([reg_bits[m.source] for m in operands])
+    offset = column([m.offset for m in operands])
+    base_offset = mode == 2
+    bad = np.where(
+        base_offset,
+        # base + offset addressing can only use %ix or %sp
+        ~signed_fits(offset, 7) | ((src != 0b100) & (src != 0b110)),
+        ~signed_fits(offset, 5),
+    )
+    s_bit = (src == 0b110).astype(np.int64)
+    words = np.where(
+        base_offset,
+        (base + (2 << 11)) | (s_bit << 10) | ((offset & 0x7F) << 3) | trf,
+        (base + (mode << 11)) | ((offset & 0x1F) << 6) | (src << 3) | trf,
+    )
+    return words, bad
+
+
+def encode_jcc(group, addresses):
+    base = column([eval_lookups.JCC_BASE[s.condition_code] for s in group])
+    offset = column([s.branch_dest.dest for s in group]) - addresses
+    words_offset = offset >> 1
+    bad = ((offset & 1) != 0) | ~signed_fits(words_offset, 8)
+    return base | (words_offset & 0xFF), bad
+
+
+def encode_jump_call(group, addresses):
+    reg_bits = eval_lookups.REG_BITS
+    base = column([eval_lookups.JUMP_CALL_BASE[s.opcode] for s in group])
+    dests = [s.branch_dest for s in group]
+    is_reg = column([d.type == "REGISTER" for d in dests]).astype(bool)
+    # register number for JMPR/CALR, target address for label jumps
+    operand = column([reg_bits[d.dest] if d.type == "REGISTER" else d.dest for d in dests])
+    offset = operand - addresses
+    words_offset = offset >> 1
+    bad = ~is_reg & (((offset & 1) != 0) | ~signed_fits(words_offset, 11))
+    words = np.where(
+        is_reg,
+        (base + (1 << 11)) | operand,
+        base | (words_offset & 0x7FF),
+    )
+    return words, bad
+
+
+INSTR_TYPE_TO_ENCODE_FN = {
+    "noarg": encode_noarg,
+    "jcc": encode_jcc,
+    "jump_call": encode_jump_call,
+    "load_store": encode_load_store,
+    "rr_format": encode_rr_format,
+    "ri_format": encode_ri_format,
+}
+
+
+def raise_statement_error(statements, position, image, data_writes):
+    # re-run a statement that failed an array-wide check through the scalar
+    # path, which raises the same error a scalar build would have
+    statement = statements[position]
+    if statement.type == "directive":
+        for data_position, address, data in data_writes:
+            if data_position == position:
+                image.write_at(address, data)
+    else:
+        image.write_at(statement.address, eval_int_fns.encode_statement(statement))
+    raise AssertionError("Vectorised check rejected %s but it encodes fine" % statement)
+
+
+def emit_statements(statements, image, start_address):
+    """Pass 2, vectorised: write every statement's bytes into the image.
+
+    Returns False without touching the image if the statements seek backwards
+    over memory they already wrote, since then write order decides the
+    result and the caller should emit them one at a time instead.
+    """
+    groups = {instr_type: [] for instr_type in INSTR_TYPE_TO_ENCODE_FN}
+    add_to_group = {instr_type: group.append for instr_type, group in groups.items()}
+    # (position, address, data) for every directive that writes bytes
+    data_writes = []
+    first_error = None
+    written_end = 0
+    current_offset = start_address
+    for position, statement in enumerate(statements):
+        if statement.type == "instruction":
+            statement.address = current_offset
+            add_to_group[statement.instr_type](statement)
+            current_offset += 2
+            written_end = current_offset
+        elif statement.type == "directive":
+            if statement.subtype == "seek":
+                current_offset = statement.seek
+                if current_offset < written_end:
+                    return False
+                continue
+            if statement.subtype == "bytes":
+                data = statement.bytes
+            elif statement.subtype == "align":
+                aligned = align_offset(current_offset, statement.align)
+                data = statement.fill * (aligned - current_offset)
+            else:
+                raise ValueError("Unknown directive subtype %s" % statement)
+            end = current_offset + len(data)
+            if end > IMAGE_SIZE and first_error is None:
+                first_error = position
+            if end != current_offset:
+                data_writes.append((position, current_offset, data))
+                written_end = end
+            current_offset = end
+        elif statement.type != "label":
+            raise ValueError("Unknown statement type %s" % statement)
+
+    encoded = []
+    for instr_type, group in groups.items():
+        if not group:
+            continue
+        addresses = column([s.address for s in group])
+        try:
+            words, bad = INSTR_TYPE_TO_ENCODE_FN[instr_type](group, addresses)
+        except OverflowError:
+            # an operand too large for an int64 column; let the scalar
+            # encoder find and report it
+            words = None
+            bad = np.ones(len(group), dtype=bool)
+        bad |= addresses > IMAGE_SIZE - 2
+        if bad.any():
+            # a group is in program order, so its first failure comes first
+            position = statements.index(group[int(bad.argmax())])
+            if first_error is None or position < first_error:
+                first_error = position
+        encoded.append((addresses, words))
+
+    if first_error is not None:
+        raise_statement_error(statements, first_error, image, data_writes)
+
+    memory = np.frombuffer(image.memory, dtype=np.uint8)
+    starts = []
+    ends = []
+    for addresses, words in encoded:
+        memory[addresses] = words & 0xFF
+        memory[addresses + 1] = words >> 8
+        starts.append(addresses)
+        ends.append(addresses + 2)
+    for _, address, data in data_writes:
+        image.memory[address : address + len(data)] = data
+    starts.append(column([address for _, address, _ in data_writes]))
+    ends.append(column([address + len(data) for _, address, data in data_writes]))
+
+    # record the touched ranges exactly as sequential write_at calls would,
+    # joining writes that start where the previous one ended
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+    if len(starts):
+        order = np.argsort(starts, kind="stable")
+        starts = starts[order]
+        ends = ends[order]
+        breaks = starts[1:] != ends[:-1]
+        range_starts = starts[np.concatenate(([True], breaks))]
+        range_ends = ends[np.concatenate((breaks, [True]))]
+        ranges = image.ranges
+        for start, end in zip(range_starts.tolist(), range_ends.tolist()):
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+    return True
@@ -1,138 +1,156 @@
-DIGITS_AND_SIGN = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "0", "-"]
+import re
+from collections import namedtuple
+
+# val is a str, or an int for NUMBER tokens. A plain namedtuple rather than
+# typing.NamedTuple, which would cost an import of typing on every run.
+Token = namedtuple("Token", ["type", "val", "line", "col"])
+
+
+# One alternative per token class, each preceded by any run of blanks so that
+# whitespace never costs a match of its own. MISMATCH catches anything the
+# grammar does not know, and END swallows trailing blanks at end of input.
+TOKEN_RE = re.compile(
+    r"""[^\S\n]*(?:
+      (?P<NEWLINE>\n)
+    | (?P<COMMENT>;[^\n]*)
+    | (?P<REGISTER>%\w\w)
+    | (?P<HEX>\$[0-9A-Za-z]*)
+    | (?P<DECIMAL>\#[0-9-]*)
+    | (?P<IDENTIFIER>[^\W\d]\w*)
+    | (?P<STRING>"[^"\n]*")
+    | (?P<UNTERMINATED>"[^"\n]*)
+    | (?P<PUNCT>[\[\]:.!,])
+    | (?P<END>\Z)
+    | (?P<MISMATCH>.)
+    )""",
+    re.VERBOSE,
+)
+
+PUNCT_TOKENS = {
+    "[": "LBRACKET",
+    "]": "RBRACKET",
+    ":": "COLON",
+    ".": "PERIOD",
+    "!": "BANG",
+    ",": "COMMA",
+}
+
+# Token() goes through a Python-level __new__; building the tuple directly
+# is noticeably cheaper in the tokenizer's inner loop.
+_new_token = tuple.__new__
+
+
+def tokenize_lines(source, first_line=1):
+    """Scan a whole source buffer in one pass.
+
+    Yields a (line number, tokens) pair for every line, numbering from
+    first_line. Each token list ends with an EOL token, so a blank or
+    comment-only line is just [EOL].
+    """
+    line_no = first_line
+    line_start = 0
+    tokens = []
+    append = tokens.append
+    for match in TOKEN_RE.finditer(source):
+        kind = match.lastgroup
+        if kind == "IDENTIFIER":
+            append(_new_token(Token, ("IDENTIFIER", match.group(kind), line_no, match.start(kind) - line_start + 1)))
+        elif kind == "PUNCT":
+            append(_new_token(Token, (PUNCT_TOKENS[match.group(kind)], "", line_no, match.start(kind) - line_start + 1)))
+        elif kind == "NEWLINE":
+            append(_new_token(Token, ("EOL", "", line_no, match.start(kind) - line_start + 1)))
+            yield line_no, tokens
+            tokens = []
+            append = tokens.append
+            line_no += 1
+            line_start = match.end()
+        elif kind == "REGISTER":
+            append(_new_token(Token, ("REGISTER", match.group(kind)[1:].upper(), line_no, match.start(kind) - line_start + 1)))
+        elif kind == "COMMENT":
+            continue
+        elif kind == "HEX":
+            append(_new_token(Token, ("NUMBER", int(match.group(kind)[1:], 16), line_no, match.start(kind) - line_start + 1)))
+        elif kind == "DECIMAL":
+            append(_new_token(Token, ("NUMBER", int(match.group(kind)[1:], 10), line_no, match.start(kind) - line_start + 1)))
+        elif kind == "STRING":
+            append(_new_token(Token, ("STRING", match.group(kind)[1:-1], line_no, match.start(kind) - line_start + 1)))
+        elif kind == "END":
+            break
+        elif kind == "UNTERMINATED":
+            raise EOFError(
+                "Error: Encountered EOL while trying to parse string on line %d!"
+                % line_no
+            )
+        else:
+            raise SyntaxError(
+                "Un-Handleable char in input stream. The char was %s (line %d, column %d)"
+                % (match.group(kind), line_no, match.start(kind) - line_start + 1)
+            )
+    if tokens or line_start < len(source):
+        append(Token("EOL", "", line_no, len(source) - line_start + 1))
+        yield line_no, tokens
+
+
+def tokenize(source):
+    """Scan a whole source buffer in one pass, yielding a flat stream of tokens."""
+    for _, tokens in tokenize_lines(source):
+        yield from tokens
+
+
+BEGIN_TOKEN = Token("BEGIN", "", 0, 0)
 
 
 class tok:
+    # Kept for compatibility with code that builds tokens by hand; the
+    # tokenizer itself produces Token tuples.
     def __init__(self) -> None:
         self.type = ""
         self.val: str | int = ""
 
 
 class lexer:
-    def __init__(self, in_str) -> None:
+    """Cursor over the tokens of one line, with curr_tok and lookahead_tok.
+
+    Constructing it from a string tokenizes that string up front; parse_source
+    instead reuses a single instance and loads each line's tokens into it.
+    """
+
+    def __init__(self, in_str="") -> None:
         self.input_str = in_str
-        self.char_index = 0
+        tokens = [token for _, line_tokens in tokenize_lines(in_str) for token in line_tokens]
+        self.load(tokens or [Token("EOL", "", 1, 1)])
+
+    def load(self, tokens):
+        """Point the cursor at a new line's tokens (which must end with EOL)."""
+        self.tokens = tokens
+        self.tok_index = 0
         self.eol = False
-        self.current_char = self.input_str[0]
-        self.lookahead_tok = self.get_tok()
-        curr = tok()
-        curr.type = "BEGIN"
-        self.curr_tok = curr
-
-    def __advance_char(self):
-        self.char_index += 1
-        if self.char_index >= len(self.input_str):
-            self.eol = True
-            self.current_char = "*"
-            # TODO: This is gross, there is certainly a better way to do this. Learn how to write a proper lexer.
-            return
-        # TODO: verbose exception syntax
-        self.current_char = self.input_str[self.char_index]
+        self.curr_tok = BEGIN_TOKEN
+        self.lookahead_tok = tokens[0]
 
     def get_tok(self):
-        """Attempt to parse a new token using self.input_str as the string of input."""
-
-        # advance past whitespace
-        while not self.eol and self.current_char.isspace():
-            self.__advance_char()
-
-        ret = tok()
-
-        if self.eol:
-            ret.type = "EOL"
-            return ret
-
-        # We are now at the start of input
-        # brackets
-        if self.current_char == "[":
-            self.__advance_char()
-            ret.type = "LBRACKET"
-            return ret
-        elif self.current_char == "]":
-            self.__advance_char()
-            ret.type = "RBRACKET"
-            return ret
-        # semicolon
-        elif self.current_char == ";":
-            self.__advance_char()
-            ret.type = "SEMICOLON"
-            return ret
-        # semicolon
-        elif self.current_char == ":":
-            self.__advance_char()
-            ret.type = "COLON"
-            return ret
-        # period
-        elif self.current_char == ".":
-            self.__advance_char()
-            ret.type = "PERIOD"
-            return ret
-        # bang
-        elif self.current_char == "!":
-            self.__advance_char()
-            ret.type = "BANG"
-            return ret
-        # comma
-        elif self.current_char == ",":
-            self.__advance_char()
-            ret.type = "COMMA"
-            return ret
-        # register literal
-        elif self.current_char == "%":
-            self.__advance_char()
-            reg_name = self.current_char
-            self.__advance_char()
-            reg_name += self.current_char
-            self.__advance_char()
-            ret.type = "REGISTER"
-            ret.val = reg_name.upper()
-            return ret
-        # hex literal
-        elif self.current_char == "$":
-            self.__advance_char()
-            num = ""
-            while self.current_char.isalnum():
-                num += self.current_char
-                self.__advance_char()
-            ret.type = "NUMBER"
-            ret.val = int(num, 16)
-            return ret
-        # integer literal
-        elif self.current_char == "#":
-            self.__advance_char()
-            num = ""
-            while self.current_char in DIGITS_AND_SIGN:
-                num += self.current_char
-                self.__advance_char()
-            ret.type = "NUMBER"
-            ret.val = int(num, 10)
-            return ret
-        # String of any sort
-        elif self.current_char.isidentifier():
-            string = ""
-            while self.current_char.isidentifier():
-                string += self.current_char
-                self.__advance_char()
-            ret.type = "IDENTIFIER"
-            ret.val = string
-            return ret
-        elif self.current_char == '"':
-            string = ""
-            self.__advance_char()
-            while not self.current_char == '"':
-                if self.eol:
-                    raise EOFError("Error: Encountered EOL while trying to parse string!")
-                string += self.current_char
-                self.__advance_char()
-            self.__advance_char()
-            ret.type = "STRING"
-            ret.val = string
-            return ret
+        """Return the next token of the line, repeating EOL once it is reached."""
+        if self.tok_index < len(self.tokens) - 1:
+            self.tok_index += 1
         else:
-            raise SyntaxError(
-                "Un-Handleable char in input stream. The char was %s"
-                % self.current_char
-            )
+            self.eol = True
+        return self.tokens[self.tok_index]
+
+    def take_rest(self):
+        """Consume every token left before EOL and return them as a list."""
+        tokens = self.tokens
+        rest = tokens[self.tok_index:-1]
+        self.tok_index = len(tokens) - 1
+        self.curr_tok = self.lookahead_tok = tokens[-1]
+        self.eol = True
+        return rest
 
     def advance(self):
+        # get_tok() inlined; this runs once per token
         self.curr_tok = self.lookahead_tok
-        self.lookahead_tok = self.get_tok()
+        tok_index = self.tok_index + 1
+        if tok_index < len(self.tokens):
+            self.tok_index = tok_index
+            self.lookahead_tok = self.tokens[tok_index]
+        else:
+            self.eol = True
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+
+import cheesegrater
+import objfile
+from eval_int_fns import check_int
+from statements import PROCESSOR_START_ADDR, align_offset
+from symbols import OFFSET_BITS, OFFSET_NAMES
+from wheel import WheelImage
+
+# Linker for the relocatable objects written by objfile.py (and by
+# cheesegrater.py --object). Objects are linked in the order given: each
+# relocatable section follows the previous one, starting at the processor's
+# start address, while sections after a .seek go where the .seek put them.
+# Labels are global, as in a single source file, so every fixup is looked up
+# in one table of all the objects' symbols.
+
+
+def place_sections(objects, start_address=PROCESSOR_START_ADDR):
+    """Return the address of every section, as one list per object."""
+    bases = []
+    address = start_address
+    for obj in objects:
+        object_bases = []
+        for section in obj["sections"]:
+            if section["start"] is None:
+                address = align_offset(address, section["align"])
+                object_bases.append(address)
+                address += len(section["data"])
+            else:
+                object_bases.append(section["start"])
+        bases.append(object_bases)
+    return bases
+
+
+def link(objects, start_address=PROCESSOR_START_ADDR):
+    """Link object dicts (as objfile.read_object returns them) into a WheelImage."""
+    bases = place_sections(objects, start_address)
+    addresses = {}
+    duplicates = []
+    for obj, object_bases in zip(objects, bases):
+        for label, (section, offset) in obj["symbols"].items():
+            if label in addresses:
+                duplicates.append(label)
+            else:
+                addresses[label] = object_bases[section] + offset
+    undefined = sorted(
+        {fixup[2] for obj in objects for fixup in obj["fixups"] if fixup[2] not in addresses}
+    )
+    problems = []
+    if duplicates:
+        problems.append("Duplicate label(s): %s" % ", ".join(duplicates))
+    if undefined:
+        problems.append("Undefined label(s): %s" % ", ".join(undefined))
+    if problems:
+        raise SyntaxError("; ".join(problems))
+
+    image = WheelImage()
+    for obj, object_bases in zip(objects, bases):
+        for section, base in zip(obj["sections"], object_bases):
+            image.write_at(base, section["data"])
+    memory = image.memory
+    for obj, object_bases in zip(objects, bases):
+        for section, offset, label, instr_type in obj["fixups"]:
+            site = object_bases[section] + offset
+            distance = addresses[label] - site
+            try:
+                if distance % 2:
+                    raise ValueError("%s %d is odd" % (OFFSET_NAMES[instr_type], distance))
+                field = check_int(distance // 2, OFFSET_BITS[instr_type], OFFSET_NAMES[instr_type])
+            except ValueError as e:
+                raise ValueError("In %s, branch to %s: %s" % (obj["source"], label, e)) from None
+            word = (memory[site] | (memory[site + 1] << 8)) | field
+            memory[site] = word & 0xFF
+            memory[site + 1] = word >> 8
+    return image
+
+
+def build_objects(paths, obj_dir=None, workers=None, encoder="int", force=False):
+    """Bring the object of every .sws path up to date, assembling in parallel.
+
+    Paths that are not .sws files are taken to be objects already. Returns
+    the object paths in order and the batch.BatchResults of the modules that
+    were assembled.
+    """
+    import batch
+
+    obj_paths = []
+    jobs = []
+    for path in paths:
+        if not path.endswith(".sws"):
+            obj_paths.append(path)
+            continue
+        obj_path = batch.output_path_for(path, obj_dir, ".obj")
+        obj_paths.append(obj_path)
+        if force or not objfile.is_current(obj_path, path):
+            jobs.append((path, obj_path))
+    if obj_dir:
+        os.makedirs(obj_dir, exist_ok=True)
+    options = batch.BatchOptions(encoder=encoder, object_file=True)
+    return obj_paths, batch.run_batch(jobs, workers, options)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Link relocatable objects into a WHEEL executable, assembling any "
+        ".sws modules whose object is missing or out of date."
+    )
+    arg_parser.add_argument("output", metavar="OUTPUT", help="the WHEEL file to write")
+    arg_parser.add_argument(
+        "modules", nargs="+", metavar="MODULE", help=".sws modules or .obj objects, in link order"
+    )
+    arg_parser.add_argument(
+        "--obj-dir", help="write the objects of .sws modules here instead of next to them"
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes assembling modules (default: all cores)",
+    )
+    arg_parser.add_argument(
+        "--encoder",
+        choices=cheesegrater.ENCODER_BACKENDS,
+        default="int",
+        help="instruction encoder for modules that need assembling",
+    )
+    arg_parser.add_argument(
+        "-B", "--always-make", action="store_true", help="reassemble every module, even if its object is current"
+    )
+    arg_parser.add_argument(
+        "--sparse",
+        action="store_true",
+        help="write one WHEEL wedge per touched address range instead of a full 64KB image",
+    )
+    args = arg_parser.parse_args(argv)
+
+    import batch
+
+    start = time.perf_counter()
+    obj_paths, results = build_objects(
+        args.modules, args.obj_dir, args.jobs, args.encoder, args.always_make
+    )
+    if results and batch.print_report(results, time.perf_counter() - start):
+        return 1
+    try:
+        image = link([objfile.read_object(path) for path in obj_paths])
+    except FileNotFoundError as e:
+        print("No such object file: %s" % e.filename)
+        return 1
+    except (SyntaxError, ValueError) as e:
+        print(e)
+        return 1
+    image.write(args.output, args.sparse)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
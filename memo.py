@@ -0,0 +1,170 @@
+import collections
+
+import eval_int_fns
+import parse
+import statements
+from symbols import OFFSET_BITS, OFFSET_NAMES
+
+DEFAULT_MAX_ENTRIES = 200_000
+
+
+def normalize(line):
+    """Reduce a source line to the text that decides what it parses to."""
+    line = line.strip()
+    if '"' not in line:
+        # whitespace only matters inside string literals
+        line = " ".join(line.split())
+    return line
+
+
+def shape_key(statement, encoder):
+    """Key for an instruction whose encoding does not depend on its address."""
+    mem_operand = statement.mem_operand
+    branch_dest = statement.branch_dest
+    return (
+        encoder,
+        statement.opcode,
+        statement.dst,
+        statement.src,
+        statement.immediate,
+        statement.trf,
+        None if mem_operand is None else (mem_operand.type, mem_operand.source, mem_operand.offset),
+        None if branch_dest is None else branch_dest.dest,
+    )
+
+
+class Memo:
+    """In-memory memo of parsed lines and encoded instructions.
+
+    Two bounded LRU layers are kept: normalised line text -> parsed statement
+    template, and (encoder, instruction shape) -> encoded bytes. Label
+    branches are memoised as the word for their opcode and condition with a
+    zero offset, so only the offset field is computed for each occurrence.
+    Encodings are keyed by encoder name so that a warm memo never answers
+    for an encoder that was not run, such as the cross-check of "check".
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.statements = collections.OrderedDict()
+        self.encodings = collections.OrderedDict()
+        self.line_hits = 0
+        self.line_misses = 0
+        self.encoding_hits = 0
+        self.encoding_misses = 0
+
+    def hit_rates(self):
+        report = {}
+        for layer, hits, misses in (
+            ("lines", self.line_hits, self.line_misses),
+            ("encodings", self.encoding_hits, self.encoding_misses),
+        ):
+            total = hits + misses
+            report[layer] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / total if total else None,
+            }
+        return report
+
+    def parse_source(self, source, include_dir=None):
+        """Drop-in replacement for parse.parse_source that reuses parsed lines.
+
+        Statements are stored as field tuples, so every hit hands back a fresh
+        object that pass 2 is free to patch. A source using .include or
+        .macro is parsed normally, since a line's meaning then depends on the
+        macros defined before it; included files are still only parsed once
+        (see preprocess.py).
+        """
+        if parse.uses_preprocessor(source):
+            yield from parse.parse_source(source, include_dir)
+            return
+        cached = self.statements
+        max_entries = self.max_entries
+        from_fields = statements.from_fields
+        for line_no, line in enumerate(source.splitlines(), 1):
+            line = normalize(line)
+            if line == "" or line[0] == ";":
+                continue
+            fields = cached.get(line)
+            if fields is not None:
+                cached.move_to_end(line)
+                self.line_hits += 1
+                if type(fields) is list:
+                    # a pseudo-instruction's expansion
+                    for expanded in fields:
+                        yield line_no, from_fields(expanded)
+                else:
+                    yield line_no, from_fields(fields)
+                continue
+            self.line_misses += 1
+            try:
+                statement = parse.parse_line(line, include_dir)
+            except SyntaxError as e:
+                raise SyntaxError("Line %d: %s" % (line_no, e)) from None
+            if statement is None:
+                continue
+            if type(statement) is tuple:
+                cached[line] = [statements.to_fields(expanded) for expanded in statement]
+                if len(cached) > max_entries:
+                    cached.popitem(last=False)
+                for expanded in statement:
+                    yield line_no, expanded
+                continue
+            # .incbin contents live in another file, so the line text alone
+            # does not identify them
+            if statement.type != "directive" or statement.path is None:
+                cached[line] = statements.to_fields(statement)
+                if len(cached) > max_entries:
+                    cached.popitem(last=False)
+            yield line_no, statement
+
+    def wrap_encoder(self, encode_statement, encoder="int"):
+        """Wrap an encode_statement function so that its results are memoised.
+
+        encoder is the name of the backend encode_statement belongs to.
+        """
+        encodings = self.encodings
+        max_entries = self.max_entries
+        check_int = eval_int_fns.check_int
+
+        def encode_memo(statement):
+            branch_dest = statement.branch_dest
+            if branch_dest is not None and branch_dest.type == "LABEL":
+                key = (encoder, statement.opcode, statement.condition_code)
+                base = encodings.get(key)
+                if base is None:
+                    self.encoding_misses += 1
+                    # encode a branch to itself to get every bit but the offset
+                    dest = branch_dest.dest
+                    branch_dest.dest = statement.address
+                    try:
+                        base = int.from_bytes(encode_statement(statement), "little")
+                    finally:
+                        branch_dest.dest = dest
+                    encodings[key] = base
+                    if len(encodings) > max_entries:
+                        encodings.popitem(last=False)
+                else:
+                    encodings.move_to_end(key)
+                    self.encoding_hits += 1
+                offset = branch_dest.dest - statement.address
+                assert offset % 2 == 0
+                instr_type = statement.instr_type
+                word = base | check_int(offset // 2, OFFSET_BITS[instr_type], OFFSET_NAMES[instr_type])
+                return word.to_bytes(2, "little")
+
+            key = shape_key(statement, encoder)
+            data = encodings.get(key)
+            if data is not None:
+                encodings.move_to_end(key)
+                self.encoding_hits += 1
+                return data
+            self.encoding_misses += 1
+            data = encode_statement(statement)
+            encodings[key] = data
+            if len(encodings) > max_entries:
+                encodings.popitem(last=False)
+            return data
+
+        return encode_memo
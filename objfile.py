@@ -0,0 +1,195 @@
+import base64
+import hashlib
+import json
+import math
+import os
+
+import cache
+import cheesegrater
+import lex
+import parse
+import preprocess
+from statements import align_offset
+
+# Relocatable object files, for building a program out of separately assembled
+# modules (see link.py). An object is the JSON form of a dict:
+#
+#   {
+#     "format": "cheesegrater-object", "version": 1,
+#     "assembler": <digest of the assembler's source>,
+#     "source": "main.sws", "source_sha256": <hex>,
+#     "dependencies": {<included or .incbin path>: <sha256 hex>},
+#     "sections": [{"start": null, "align": 2, "data": <base64>}, ...],
+#     "symbols": {"loop": [section, offset], ...},
+#     "fixups": [[section, offset, "loop", "jcc"], ...]
+#   }
+#
+# Section 0 holds everything before the module's first .seek and is
+# relocatable: its start is null, and the linker places it after the previous
+# module's. Every .seek starts a new section at a fixed address. align is the
+# least common multiple of the .align boundaries in a relocatable section, so
+# its layout holds wherever the linker puts it.
+#
+# A label branch is encoded right away when its label is in the same section,
+# since the distance between them is known. Branches to any other label are
+# encoded with a zero offset and listed as fixups, for the linker to fill in.
+# Branches are never relaxed, as their reach is only known once linked.
+
+OBJECT_FORMAT = "cheesegrater-object"
+OBJECT_VERSION = 1
+
+# modules that determine an object's contents, besides those in cache.VERSIONED_MODULES
+OBJECT_MODULES = ["objfile", "preprocess"]
+
+
+def assembler_version():
+    return cache.source_digest(cache.VERSIONED_MODULES + OBJECT_MODULES)
+
+
+def assemble_object(source, encoder="int", optimize=False, include_dir=None, name=None):
+    """Assemble one module's SWISS source into an object dict.
+
+    Section data is kept as bytearrays; write_object encodes it for JSON.
+    Duplicate labels are an error, undefined ones are left to the linker.
+    """
+    if encoder in cheesegrater.VECTOR_ENCODERS:
+        raise ValueError("Objects need a per-instruction encoder, not %s" % encoder)
+    encode_statement = cheesegrater.encoder_backend(encoder)
+    preprocessor = preprocess.Preprocessor(include_dir)
+    parsed = parse.parse_tokenized(lex.tokenize_lines(source), preprocessor=preprocessor)
+    if optimize:
+        import peephole
+
+        parsed = peephole.optimize(parsed)
+
+    # pass 1: the section and offset of every statement and label
+    sections = [{"start": None, "align": 1, "data": bytearray()}]
+    placed = []
+    symbols = {}
+    duplicates = []
+    dependencies = {}
+    section = 0
+    offset = 0
+    for _, statement in parsed:
+        if statement.type == "label":
+            if statement.label in symbols:
+                duplicates.append(statement.label)
+            else:
+                symbols[statement.label] = [section, offset]
+            continue
+        if statement.type == "directive":
+            if statement.subtype == "seek":
+                sections.append({"start": statement.seek, "align": 1, "data": bytearray()})
+                section = len(sections) - 1
+                offset = 0
+                continue
+            if statement.subtype == "align":
+                start = sections[section]["start"]
+                if start is None:
+                    sections[section]["align"] = math.lcm(sections[section]["align"], statement.align)
+                    start = 0
+                aligned = align_offset(start + offset, statement.align) - start
+                placed.append((statement, section, offset, aligned - offset))
+                offset = aligned
+                continue
+            if statement.path is not None:
+                dependencies[statement.path] = preprocess.file_stamp(statement.path)[2].hex()
+        placed.append((statement, section, offset, statement.size))
+        offset += statement.size
+    if duplicates:
+        raise SyntaxError("Duplicate label(s): %s" % ", ".join(duplicates))
+
+    # pass 2: encode into each section's data
+    fixups = []
+    for statement, section, offset, size in placed:
+        data = sections[section]["data"]
+        if statement.type == "instruction":
+            base = sections[section]["start"] or 0
+            statement.address = base + offset
+            branch_dest = statement.branch_dest
+            if branch_dest is not None and branch_dest.type == "LABEL":
+                label = branch_dest.dest
+                target = symbols.get(label)
+                if target is not None and target[0] == section:
+                    branch_dest.dest = base + target[1]
+                else:
+                    # a branch to itself, whose offset field is zero
+                    branch_dest.dest = statement.address
+                    fixups.append([section, offset, label, statement.instr_type])
+            data += encode_statement(statement)
+        elif statement.subtype == "bytes":
+            data += statement.bytes
+        else:
+            data += statement.fill * size
+
+    for path, (_, _, digest) in preprocessor.stamps.items():
+        dependencies[path] = digest.hex()
+    return {
+        "format": OBJECT_FORMAT,
+        "version": OBJECT_VERSION,
+        "assembler": assembler_version(),
+        "source": name,
+        "source_sha256": hashlib.sha256(source.encode("utf-8")).hexdigest(),
+        "dependencies": dependencies,
+        "sections": sections,
+        "symbols": symbols,
+        "fixups": fixups,
+    }
+
+
+def assemble_object_file(in_path, encoder="int", optimize=False):
+    with open(in_path, "r") as infile:
+        source = infile.read()
+    include_dir = os.path.dirname(os.path.abspath(in_path))
+    return assemble_object(source, encoder, optimize, include_dir, in_path)
+
+
+def write_object(obj, out_path):
+    sections = [
+        dict(section, data=base64.b64encode(section["data"]).decode("ascii"))
+        for section in obj["sections"]
+    ]
+    with open(out_path, "w") as out_file:
+        json.dump(dict(obj, sections=sections), out_file)
+        out_file.write("\n")
+
+
+def read_object(path):
+    with open(path, "r") as in_file:
+        try:
+            obj = json.load(in_file)
+        except ValueError as e:
+            raise ValueError("%s is not an object file: %s" % (path, e)) from None
+    if not isinstance(obj, dict) or obj.get("format") != OBJECT_FORMAT:
+        raise ValueError("%s is not an object file" % path)
+    if obj.get("version") != OBJECT_VERSION:
+        raise ValueError("%s is object format version %s, expected %d" % (path, obj.get("version"), OBJECT_VERSION))
+    for section in obj["sections"]:
+        section["data"] = base64.b64decode(section["data"])
+    return obj
+
+
+def is_current(obj_path, in_path):
+    """Return whether the object at obj_path is up to date with in_path.
+
+    It is if it was built by this assembler from the same source text, and
+    nothing it includes has changed since.
+    """
+    try:
+        with open(obj_path, "r") as in_file:
+            obj = json.load(in_file)
+        with open(in_path, "r") as source_file:
+            source_sha256 = hashlib.sha256(source_file.read().encode("utf-8")).hexdigest()
+        if (
+            obj.get("format") != OBJECT_FORMAT
+            or obj.get("version") != OBJECT_VERSION
+            or obj.get("assembler") != assembler_version()
+            or obj.get("source_sha256") != source_sha256
+        ):
+            return False
+        for path, digest in obj["dependencies"].items():
+            if preprocess.file_stamp(path)[2].hex() != digest:
+                return False
+    except (OSError, ValueError, KeyError, AttributeError):
+        return False
+    return True
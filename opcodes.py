@@ -0,0 +1,73 @@
+from collections import namedtuple
+
+# Opcode registry: everything the parser and the integer encoder need to know
+# about a mnemonic, so that parsing a line and encoding its instruction are
+# each a single dictionary lookup. Adding an instruction means adding an entry
+# here, plus its bits in eval_lookups.
+#
+#   grammar     how the operands are parsed, one of parse.OPERAND_PARSERS:
+#                 "none"       no operands                         HALT
+#                 "condition"  .cc label                           J.eq loop
+#                 "target"     label or register                   CALL %lr
+#                 "memory"     register, memory operand            LOADW %ax, [%sp, #2]
+#                 "alu"        register, register or immediate     ADD %ax, #1
+#                 "rr"         register, register                  MOV %ax, %bx
+#                 "ri"         register, immediate                 MOVL %ax, $FF
+#                 "pseudo"     register, immediate [, register]    LDI %ax, $1234
+#   instr_type  the encoder family (each backend's INSTR_TYPE_TO_EVAL_FN);
+#               None for "alu", which is rr_format or ri_format depending on
+#               its second operand, and for pseudo-instructions
+#   size        bytes per encoded instruction; None for pseudo-instructions,
+#               whose expansion varies
+#   immediate   the immediate field of the RI form as (kind, bits): "uint"
+#               for a plain unsigned number, "mask" for an index into
+#               eval_lookups.BITMASKS_LOOKUPS
+#   ends_block  whether execution may not continue with the next
+#               instruction, which ends a basic block (see peephole.py)
+Opcode = namedtuple("Opcode", ["grammar", "instr_type", "size", "immediate", "ends_block"], defaults=[False])
+
+NOARG = Opcode("none", "noarg", 2, None)
+NOARG_TRANSFER = Opcode("none", "noarg", 2, None, True)
+JCC = Opcode("condition", "jcc", 2, None, True)
+JUMP_CALL = Opcode("target", "jump_call", 2, None, True)
+LOAD_STORE = Opcode("memory", "load_store", 2, None)
+ALU_UINT5 = Opcode("alu", None, 2, ("uint", 5))
+ALU_MASK = Opcode("alu", None, 2, ("mask", 5))
+RR = Opcode("rr", "rr_format", 2, None)
+RI_UINT8 = Opcode("ri", "ri_format", 2, ("uint", 8))
+PSEUDO = Opcode("pseudo", None, None, None)
+
+OPCODES = {
+    "HALT": NOARG_TRANSFER,
+    "RET": NOARG_TRANSFER,
+    "EI": NOARG,
+    "DI": NOARG,
+    "NOP": NOARG,
+    "J": JCC,
+    "JMP": JUMP_CALL,
+    "CALL": JUMP_CALL,
+    "LOADB": LOAD_STORE,
+    "STOREB": LOAD_STORE,
+    "LOADW": LOAD_STORE,
+    "STOREW": LOAD_STORE,
+    "ADD": ALU_UINT5,
+    "SUB": ALU_UINT5,
+    "AND": ALU_MASK,
+    "OR": ALU_MASK,
+    "XOR": ALU_MASK,
+    "CMP": ALU_UINT5,
+    "LSL": ALU_UINT5,
+    "LSR": ALU_UINT5,
+    "ADC": RR,
+    "SBC": RR,
+    "TEST": RR,
+    "ASR": RR,
+    "MOV": RR,
+    "MOVH": RI_UINT8,
+    "MOVL": RI_UINT8,
+    # pseudo-instructions, expanded into real instructions by pseudo.py
+    "LDI": PSEUDO,
+    "ANDI": PSEUDO,
+    "ORI": PSEUDO,
+    "XORI": PSEUDO,
+}
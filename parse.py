@@ -1,6 +1,13 @@
+import mmap
+import os
+import re
+import sys
+from array import array
+
+import eval_lookups
 import lex
-import parse_lookups
-from typing import cast
+import opcodes
+from statements import BranchDest, Directive, Instruction, Label, MemOperand
 
 
 def expect(condition, error, error_str):
@@ -8,8 +15,14 @@ def expect(condition, error, error_str):
         raise error(error_str)
 
 
+def register_name(lexer: lex.lexer):
+    # the current REGISTER token's name, checked against the register file
+    name = lexer.curr_tok.val
+    expect(name in eval_lookups.REG_BITS, SyntaxError, "Unknown register %%%s" % name.lower())
+    return name
+
+
 def parse_mem_operand(lexer: lex.lexer):
-    mem_operand = {}
     expect(
         lexer.curr_tok.type == "LBRACKET",
         SyntaxError,
@@ -21,9 +34,7 @@ def parse_mem_operand(lexer: lex.lexer):
         SyntaxError,
         "Expected Register operand, instead found %s" % lexer.curr_tok.val,
     )
-    mem_operand["source"] = lexer.curr_tok.val
-    mem_operand["type"] = "base-offset"
-    mem_operand["offset"] = 0
+    mem_operand = MemOperand("base-offset", register_name(lexer))
     lexer.advance()
     if lexer.curr_tok.type == "COMMA":
         lexer.advance()
@@ -32,7 +43,7 @@ def parse_mem_operand(lexer: lex.lexer):
             SyntaxError,
             "Expected Integer Literal operand, instead found %s" % lexer.curr_tok.val,
         )
-        mem_operand["offset"] = lexer.curr_tok.val
+        mem_operand.offset = lexer.curr_tok.val
         lexer.advance()
     expect(
         lexer.curr_tok.type == "RBRACKET",
@@ -42,14 +53,14 @@ def parse_mem_operand(lexer: lex.lexer):
     lexer.advance()
     if lexer.curr_tok.type == "COMMA":
         # post-index
-        mem_operand["type"] = "post-index"
+        mem_operand.type = "post-index"
         lexer.advance()
         if lexer.curr_tok.type == "NUMBER":
-            if mem_operand["offset"] != 0:
+            if mem_operand.offset != 0:
                 raise SyntaxError(
                     "Cannot have both an immediate offset and a post-index offset"
                 )
-            mem_operand["offset"] = lexer.curr_tok.val
+            mem_operand.offset = lexer.curr_tok.val
             lexer.advance()
         else:
             raise SyntaxError(
@@ -58,192 +69,236 @@ def parse_mem_operand(lexer: lex.lexer):
             )
     elif lexer.curr_tok.type == "BANG":
         # pre-index
-        mem_operand["type"] = "pre-index"
+        mem_operand.type = "pre-index"
         lexer.advance()
     return mem_operand
 
 
-def parse_instr_statement(lexer: lex.lexer):
-    # print("Parsing instruction statement `%s`" % lexer.input_str)
-    statement = {}
-    statement["type"] = "instruction"
-    statement["size"] = 2
-    # first token is the instruction opcode string
-    statement["opcode"] = cast(str, lexer.curr_tok.val).upper()
-    # print("found instruction with opcode of %s" % statement["opcode"])
-    # consume opcode token
+def expect_eol(lexer: lex.lexer, opcode):
+    # we should be looking at an EOL token right now
+    if lexer.curr_tok.type != "EOL":
+        raise SyntaxError(
+            "Unexpected token '%s' for instruction '%s'" % (lexer.curr_tok.val, opcode)
+        )
+
+
+def parse_no_operands(lexer: lex.lexer, statement, entry):
+    pass
+
+
+def parse_condition_operands(lexer: lex.lexer, statement, entry):
+    # we should be looking at a PERIOD token right now
+    expect(
+        lexer.curr_tok.type == "PERIOD",
+        SyntaxError,
+        "Expected period after J opcode",
+    )
+    lexer.advance()
+    expect(
+        lexer.curr_tok.type == "IDENTIFIER",
+        SyntaxError,
+        "Expected condition code following period in J.cc instruction",
+    )
+    statement.condition_code = lexer.curr_tok.val.upper()
+    expect(
+        statement.condition_code in eval_lookups.CC_BITS,
+        SyntaxError,
+        "Unknown condition code '%s'" % lexer.curr_tok.val,
+    )
+    lexer.advance()
+    # Looking for one label
+    expect(
+        lexer.curr_tok.type == "IDENTIFIER",
+        SyntaxError,
+        "Expected a label after J.cc instruction, found %s-type instead"
+        % lexer.curr_tok.type,
+    )
+    statement.branch_dest = BranchDest("LABEL", lexer.curr_tok.val)
     lexer.advance()
 
-    # parse NOARG instrs
-    if statement["opcode"] in parse_lookups.NO_ARG_INSTRS_LOOKUP:
-        statement["instr_type"] = "noarg"
-        pass
 
-    # parse conditional jumps
-    elif statement["opcode"] == "J":
-        statement["instr_type"] = "jcc"
-        # we should be looking at a PERIOD token right now
-        expect(
-            lexer.curr_tok.type == "PERIOD",
-            SyntaxError,
-            "Expected period after J opcode",
-        )
-        lexer.advance()
-        expect(
-            lexer.curr_tok.type == "IDENTIFIER",
-            SyntaxError,
-            "Expected condition code following period in J.cc instruction",
-        )
-        statement["condition_code"] = cast(str, lexer.curr_tok.val).upper()
-        lexer.advance()
-        # Looking for one label
-        expect(
-            lexer.curr_tok.type == "IDENTIFIER",
-            SyntaxError,
-            "Expected a label after J.cc instruction, found %s-type instead"
-            % lexer.curr_tok.type,
+def parse_target_operands(lexer: lex.lexer, statement, entry):
+    # We might have a register, we might have a label
+    if lexer.curr_tok.type == "REGISTER":
+        statement.branch_dest = BranchDest("REGISTER", register_name(lexer))
+    elif lexer.curr_tok.type == "IDENTIFIER":
+        statement.branch_dest = BranchDest("LABEL", lexer.curr_tok.val)
+    else:
+        raise SyntaxError(
+            "Expected label or register for jump target, found %s-type instead"
+            % lexer.curr_tok.type
         )
-        statement["branch_dest"] = {"type": "LABEL", "dest": lexer.curr_tok.val}
-        lexer.advance()
+    lexer.advance()
 
-    # parse unconditional jumps, calls
-    elif statement["opcode"] == "JMP" or statement["opcode"] == "CALL":
-        statement["instr_type"] = "jump_call"
-        # We might have a register, we might have a label
-        if lexer.curr_tok.type == "REGISTER":
-            statement["branch_dest"] = {"type": "REGISTER", "dest": lexer.curr_tok.val}
-        elif lexer.curr_tok.type == "IDENTIFIER":
-            expect(lexer.curr_tok.type == "IDENTIFIER", SyntaxError, "Bad label for jump!")
-            statement["branch_dest"] = {"type": "LABEL", "dest": lexer.curr_tok.val}
-        else:
-            raise SyntaxError(
-                "Expected label or register for jump target, found %s-type instead"
-                % lexer.curr_tok.type
-            )
-        lexer.advance()
 
-    # parse loads and stores
-    elif statement["opcode"] in ["LOADB", "STOREB", "LOADW", "STOREW"]:
-        statement["instr_type"] = "load_store"
+def parse_memory_operands(lexer: lex.lexer, statement, entry):
+    expect(
+        lexer.curr_tok.type == "REGISTER",
+        SyntaxError,
+        "Expected register token following opcode",
+    )
+    statement.trf = register_name(lexer)
+    lexer.advance()
+    expect(
+        lexer.curr_tok.type == "COMMA",
+        SyntaxError,
+        "Expected comma following register token in instr %s" % statement,
+    )
+    lexer.advance()
+    statement.mem_operand = parse_mem_operand(lexer)
+    # TODO: check base reg against load/store type
+
+
+def parse_alu_operands(lexer: lex.lexer, statement, entry):
+    # RR and RI format instrs
+    expect(
+        lexer.curr_tok.type == "REGISTER",
+        SyntaxError,
+        "Expected register token following opcode",
+    )
+    statement.dst = register_name(lexer)
+    lexer.advance()
+    expect(
+        lexer.curr_tok.type == "COMMA",
+        SyntaxError,
+        "Expected comma following register token",
+    )
+    lexer.advance()
+    if lexer.curr_tok.type == "NUMBER":
+        statement.instr_type = "ri_format"
         expect(
-            lexer.curr_tok.type == "REGISTER",
+            entry.immediate is not None,
             SyntaxError,
-            "Expected register token following opcode",
+            "Numeric literal source not allowed for this instruction!",
         )
-        statement["trf"] = lexer.curr_tok.val
-        lexer.advance()
+        statement.immediate = lexer.curr_tok.val
+    else:
+        statement.instr_type = "rr_format"
         expect(
-            lexer.curr_tok.type == "COMMA",
+            entry.grammar != "ri",
             SyntaxError,
-            "Expected comma following register token in instr %s" % statement,
+            "Register source not allowed for this instruction!",
         )
-        lexer.advance()
-        statement["mem_operand"] = parse_mem_operand(lexer)
-        # TODO: check base reg against load/store type
-
-    # parse RR and RI instrs
-    elif statement["opcode"] in parse_lookups.RR_RI_FORMAT_INSTRS_LOOKUP:
-        # RR format instr
         expect(
             lexer.curr_tok.type == "REGISTER",
             SyntaxError,
-            "Expected register token following opcode",
+            "Expected register token following comma",
         )
-        statement["dst"] = lexer.curr_tok.val
+        statement.src = register_name(lexer)
+    lexer.advance()
+
+
+# grammar name in the opcode registry -> function parsing those operands
+OPERAND_PARSERS = {
+    "none": parse_no_operands,
+    "condition": parse_condition_operands,
+    "target": parse_target_operands,
+    "memory": parse_memory_operands,
+    "alu": parse_alu_operands,
+    "rr": parse_alu_operands,
+    "ri": parse_alu_operands,
+}
+
+
+def parse_instr_statement(lexer: lex.lexer):
+    # first token is the instruction opcode string
+    opcode = lexer.curr_tok.val.upper()
+    entry = opcodes.OPCODES.get(opcode)
+    if entry is None:
+        raise SyntaxError("Unknown instruction '%s'" % opcode)
+    # consume opcode token
+    lexer.advance()
+    if entry.grammar == "pseudo":
+        return parse_pseudo_instr(lexer, opcode)
+    statement = Instruction(opcode, entry.instr_type, entry.size)
+    OPERAND_PARSERS[entry.grammar](lexer, statement, entry)
+    expect_eol(lexer, opcode)
+    return statement
+
+
+def parse_pseudo_instr(lexer: lex.lexer, opcode):
+    # OP %r, imm16 [, %scratch], expanded into a tuple of instructions
+    expect(lexer.curr_tok.type == "REGISTER", SyntaxError, "Expected register token following opcode")
+    dst = register_name(lexer)
+    lexer.advance()
+    expect(lexer.curr_tok.type == "COMMA", SyntaxError, "Expected comma following register token")
+    lexer.advance()
+    expect(lexer.curr_tok.type == "NUMBER", SyntaxError, "Expected a numeric literal for %s" % opcode)
+    value = lexer.curr_tok.val
+    lexer.advance()
+    scratch = None
+    if lexer.curr_tok.type == "COMMA":
         lexer.advance()
-        expect(
-            lexer.curr_tok.type == "COMMA",
-            SyntaxError,
-            "Expected comma following register token",
-        )
+        expect(lexer.curr_tok.type == "REGISTER", SyntaxError, "Expected a scratch register following comma")
+        scratch = register_name(lexer)
         lexer.advance()
-        if lexer.curr_tok.type == "NUMBER":
-            statement["instr_type"] = "ri_format"
-            # RI-format
-            expect(
-                statement["opcode"] in parse_lookups.RI_FORMAT_INSTRS_LOOKUP,
-                SyntaxError,
-                "Numeric literal source not allowed for this instruction!",
-            )
-            statement["immediate"] = lexer.curr_tok.val
-            lexer.advance()
-        else:
-            statement["instr_type"] = "rr_format"
-            expect(
-                lexer.curr_tok.type == "REGISTER",
-                SyntaxError,
-                "Expected register token following comma",
-            )
-            statement["src"] = lexer.curr_tok.val
-            lexer.advance()
+    expect_eol(lexer, opcode)
+    import pseudo
 
-    # we should be looking at an EOL token right now
-    if lexer.curr_tok.type != "EOL":
-        raise SyntaxError(
-            "Unexpected token '%s' for instruction '%s'"
-            % (lexer.curr_tok.val, statement["opcode"])
-        )
-    return statement
+    return pseudo.expand(opcode, dst, value, scratch)
 
 
-def parse_directive_statement(lexer: lex.lexer):
+def parse_directive_statement(lexer: lex.lexer, include_dir=None):
     lexer.advance()
     expect(lexer.curr_tok.type == "IDENTIFIER", SyntaxError, "Expected a directive following a dot.")
-    statement = {}
-    statement["type"] = "directive"
-    directive = cast(str, lexer.curr_tok.val).lower()
+    directive = lexer.curr_tok.val.lower()
     if directive == "ascii":
         expect(lexer.lookahead_tok.type == "STRING", SyntaxError, "Expected a string literal following a .ascii directive.")
-        statement["subtype"] = "bytes"
+        statement = Directive("bytes")
         lexer.advance()
-        statement["bytes"] = cast(str, lexer.curr_tok.val).encode("ascii")
-        statement["size"] = len(statement["bytes"])
+        statement.bytes = lexer.curr_tok.val.encode("ascii")
+        statement.size = len(statement.bytes)
         return statement
     elif directive == "asciiz":
         expect(lexer.lookahead_tok.type == "STRING", SyntaxError, "Expected a string literal following a .asciiz directive.")
-        statement["subtype"] = "bytes"
+        statement = Directive("bytes")
         lexer.advance()
-        statement["bytes"] = cast(str, lexer.curr_tok.val).encode("ascii") + b'\0'
-        statement["size"] = len(statement["bytes"])
+        statement.bytes = lexer.curr_tok.val.encode("ascii") + b'\0'
+        statement.size = len(statement.bytes)
         return statement
     elif directive == "byte":
         expect(lexer.lookahead_tok.type == "NUMBER", SyntaxError, "Expected at least one numerical literal following a .byte directive.")
-        statement["subtype"] = "bytes"
-        lexer.advance()
-        statement["bytes"] = cast(int, lexer.curr_tok.val).to_bytes(1, "little")
-        while lexer.lookahead_tok.type == "COMMA":
-            lexer.advance()
-            lexer.advance()
-            statement["bytes"] += cast(int, lexer.curr_tok.val).to_bytes(1, "little")
-        statement["size"] = len(statement["bytes"])
+        statement = Directive("bytes")
+        # truncate each value to 1 byte and pack the whole list at once
+        values = array("B", [value & 0xFF for value in parse_number_list(lexer, "byte")])
+        statement.bytes = values.tobytes()
+        statement.size = len(statement.bytes)
         return statement
     elif directive == "word":
         expect(lexer.lookahead_tok.type == "NUMBER", SyntaxError, "Expected at least one numerical literal following a .word directive.")
-        statement["subtype"] = "bytes"
+        statement = Directive("bytes")
+        # truncate each value to 2 bytes and pack the whole list at once
+        values = array("H", [value & 0xFFFF for value in parse_number_list(lexer, "word")])
+        if sys.byteorder != "little":
+            values.byteswap()
+        statement.bytes = values.tobytes()
+        statement.size = len(statement.bytes)
+        return statement
+    elif directive == "incbin":
+        expect(lexer.lookahead_tok.type == "STRING", SyntaxError, "Expected a file path string following a .incbin directive.")
         lexer.advance()
-        statement["bytes"] = cast(int, lexer.curr_tok.val).to_bytes(2, "little")
-        while lexer.lookahead_tok.type == "COMMA":
-            lexer.advance()
-            lexer.advance()
-            statement["bytes"] += cast(int, lexer.curr_tok.val).to_bytes(2, "little")
-        statement["size"] = len(statement["bytes"])
+        statement = Directive("bytes")
+        # relative to the including file, like .include
+        statement.path = os.path.normpath(os.path.join(include_dir or os.getcwd(), lexer.curr_tok.val))
+        statement.bytes = map_binary_file(statement.path)
+        statement.size = len(statement.bytes)
         return statement
     elif directive == "seek":
         expect(lexer.lookahead_tok.type == "NUMBER", SyntaxError, "Expected an offset after seek directive.")
         lexer.advance()
-        statement["subtype"] = "seek"
-        statement["seek"] = cast(int, lexer.curr_tok.val) % 65536
+        statement = Directive("seek")
+        statement.seek = lexer.curr_tok.val % 65536
         return statement
     elif directive == "align":
         expect(lexer.lookahead_tok.type == "NUMBER", SyntaxError, "Expected an alignment boundary value following .align directive.")
         lexer.advance()
-        statement["subtype"] = "align"
-        statement["align"] = cast(int, lexer.curr_tok.val)
+        statement = Directive("align")
+        statement.align = lexer.curr_tok.val
         if lexer.lookahead_tok.type == "NUMBER":
             lexer.advance()
-            statement["fill"] = (cast(int, lexer.curr_tok.val) % 256).to_bytes(1, "little")
+            statement.fill = (lexer.curr_tok.val % 256).to_bytes(1, "little")
         else:
-            statement["fill"] = b'\0'
+            statement.fill = b'\0'
         return statement
     else:
         raise SyntaxError("Unknown directive")
@@ -251,11 +306,34 @@ def parse_directive_statement(lexer: lex.lexer):
 
 
 
+def parse_number_list(lexer: lex.lexer, directive):
+    # the rest of the line must be NUMBER {COMMA NUMBER}
+    rest = lexer.take_rest()
+    numbers = rest[0::2]
+    commas = rest[1::2]
+    if len(rest) % 2 == 0 or any(tok.type != "NUMBER" for tok in numbers) or any(tok.type != "COMMA" for tok in commas):
+        raise SyntaxError(
+            "Expected a comma-separated list of numerical literals following a .%s directive."
+            % directive
+        )
+    return [tok.val for tok in numbers]
+
+
+def map_binary_file(path):
+    # Memory-map the file so its contents go straight into the image without
+    # being read into an intermediate buffer first.
+    try:
+        with open(path, "rb") as binary:
+            if os.fstat(binary.fileno()).st_size == 0:
+                return b""
+            return memoryview(mmap.mmap(binary.fileno(), 0, access=mmap.ACCESS_READ))
+    except OSError as e:
+        raise SyntaxError("Cannot read .incbin file %s: %s" % (path, e.strerror)) from None
+
+
 def parse_label_definition(lexer: lex.lexer):
     expect(lexer.curr_tok.type == "IDENTIFIER", SyntaxError, "Expected a label name following the correct grammar.")
-    statement = {}
-    statement["type"] = "label"
-    statement["label"] = lexer.curr_tok.val
+    statement = Label(lexer.curr_tok.val)
     lexer.advance()
     expect(
         lexer.curr_tok.type == "COLON",
@@ -265,20 +343,110 @@ def parse_label_definition(lexer: lex.lexer):
     return statement
 
 
-def parse_line(line: str):
-    # handle empty lines
-    if line == "":
-        return None
-    lexer = lex.lexer(line)
+def parse_statement(lexer: lex.lexer, include_dir=None):
     assert lexer.curr_tok.type == "BEGIN"
     lexer.advance()  # consume beginning of line token
-    if lexer.lookahead_tok.type == "COLON":
-        return parse_label_definition(lexer)
-    elif lexer.curr_tok.type == "SEMICOLON":
+    if lexer.curr_tok.type == "EOL":
+        # blank or comment-only line
         return None
+    elif lexer.lookahead_tok.type == "COLON":
+        return parse_label_definition(lexer)
     elif lexer.curr_tok.type == "IDENTIFIER":
         return parse_instr_statement(lexer)
     elif lexer.curr_tok.type == "PERIOD":
-        return parse_directive_statement(lexer)
+        return parse_directive_statement(lexer, include_dir)
     else:
         raise SyntaxError("Expected line to start with an instruction or directive!")
+
+
+def parse_line(line: str, include_dir=None):
+    # handle empty lines
+    if line == "":
+        return None
+    return parse_statement(lex.lexer(line), include_dir)
+
+
+# directives handled by preprocess.py, which is only imported once a source
+# actually uses one of them
+PREPROCESSOR_DIRECTIVES = frozenset(["include", "macro", "endm"])
+PREPROCESSOR_RE = re.compile(r"^[ \t]*\.(?:include|macro)\b", re.IGNORECASE | re.MULTILINE)
+
+
+def uses_preprocessor(source: str):
+    """Whether source has a .include or .macro (and so may invoke macros)."""
+    return PREPROCESSOR_RE.search(source) is not None
+
+
+def is_preprocessor_line(tokens, preprocessor):
+    if tokens[0].type == "PERIOD":
+        return tokens[1].type == "IDENTIFIER" and tokens[1].val.lower() in PREPROCESSOR_DIRECTIVES
+    return preprocessor is not None and preprocessor.is_invocation(tokens)
+
+
+def parse_source(source: str, include_dir=None):
+    """Parse a whole source buffer, yielding (line number, statement) pairs.
+
+    The buffer is tokenized in a single pass and one lexer cursor is reused for
+    every line. Blank and comment-only lines produce no statement. Paths in
+    .include and .incbin directives are relative to include_dir (default: the
+    working directory).
+    """
+    return parse_tokenized(lex.tokenize_lines(source), include_dir)
+
+
+def parse_tokenized(tokenized, include_dir=None, preprocessor=None):
+    """Parse (line number, tokens) pairs from lex.tokenize_lines.
+
+    .include, .macro and macro invocations are passed to preprocessor, a
+    preprocess.Preprocessor that is created for include_dir when it is first
+    needed. Statements they produce carry the line number of the directive or
+    invocation. .incbin paths are relative to the preprocessor's include_dir
+    when one is given, else to include_dir.
+    """
+    if preprocessor is not None:
+        include_dir = preprocessor.include_dir
+    lexer = lex.lexer()
+    tokenized = iter(tokenized)
+    for line_no, tokens in tokenized:
+        if len(tokens) == 1:
+            continue
+        if (preprocessor is not None or tokens[0].type == "PERIOD") and is_preprocessor_line(
+            tokens, preprocessor
+        ):
+            if preprocessor is None:
+                import preprocess
+
+                preprocessor = preprocess.Preprocessor(include_dir)
+            try:
+                for statement in preprocessor.handle(tokens, tokenized):
+                    yield line_no, statement
+            except SyntaxError as e:
+                raise SyntaxError("Line %d: %s" % (line_no, e)) from None
+            continue
+        lexer.load(tokens)
+        try:
+            statement = parse_statement(lexer, include_dir)
+        except SyntaxError as e:
+            raise SyntaxError("Line %d: %s" % (line_no, e)) from None
+        if statement is None:
+            continue
+        if type(statement) is tuple:
+            # a pseudo-instruction
+            for expanded in statement:
+                yield line_no, expanded
+        else:
+            yield line_no, statement
+
+
+def tokenize_each_line(lines):
+    for line_no, line in enumerate(lines, 1):
+        yield from lex.tokenize_lines(line, line_no)
+
+
+def parse_lines(lines, include_dir=None):
+    """Parse an iterable of source lines (such as an open file) lazily.
+
+    Unlike parse_source this never needs the whole source in memory: each line
+    is tokenized and parsed as it is pulled from the iterable.
+    """
+    return parse_tokenized(tokenize_each_line(lines), include_dir)
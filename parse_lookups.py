@@ -1,32 +0,0 @@
-NO_ARG_INSTRS_LOOKUP = ["HALT", "RET", "IRET", "EI", "DI", "NOP"]
-
-RR_RI_FORMAT_INSTRS_LOOKUP = [
-    "ADD",
-    "SUB",
-    "AND",
-    "OR",
-    "XOR",
-    "CMP",
-    "LSL",
-    "LSR",
-    "ADC",
-    "SBC",
-    "TEST",
-    "ASR",
-    "MOV",
-    "MOVH",
-    "MOVL",
-]
-
-RI_FORMAT_INSTRS_LOOKUP = [
-    "ADD",
-    "SUB",
-    "AND",
-    "OR",
-    "XOR",
-    "CMP",
-    "LSL",
-    "LSR",
-    "MOVH",
-    "MOVL",
-]
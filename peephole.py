@@ -0,0 +1,186 @@
+# Peephole optimiser, run with -O over the parsed statements before pass 1.
+#
+# Rewrites only ever happen inside a basic block: a run of instructions with no
+# label or directive in between, ended by any control transfer. Labels are
+# never removed or moved, so every label still names the same point in the
+# program. The patterns are:
+#
+#   MOVH %r, #0                 dropped when %r's high byte is known zero
+#   MOV %r, %r                  always dropped
+#   ADD/SUB %r, #0              dropped when the flags it sets are never read
+#   CMP/TEST ...                dropped when its flags are never read, e.g.
+#                               when another CMP follows directly
+#   JMP/J.cc L ; L:             a jump to the next instruction is dropped
+#
+# Flags are assumed live at the end of every block, so a CMP just before a
+# branch or a label is always kept.
+#
+# A register's high byte is known to be zero after MOVH %r, #0, XOR or SUB
+# %r, %r, LOADB (which zero-extends) and AND with a mask whose high byte is
+# zero. MOVL replaces only the low byte (see sim.py), so it keeps what is
+# known about the high byte, and a MOVH %r, #0 can go whether it comes
+# before or after the MOVL. Nothing is known at the start of a block.
+
+import opcodes
+
+# instructions that overwrite every flag, whatever was there before
+FLAG_SETTERS = {"ADD", "SUB", "CMP"}
+# ALU instructions that only set flags and leave their registers alone
+FLAG_ONLY = {"CMP", "TEST"}
+# instructions that read the carry flag as an operand
+CARRY_READERS = {"ADC", "SBC"}
+# branches, calls, returns and HALT
+BLOCK_ENDING = frozenset(name for name, opcode in opcodes.OPCODES.items() if opcode.ends_block)
+
+
+def ends_block(statement):
+    return statement.opcode in BLOCK_ENDING
+
+
+def is_alu(statement):
+    return statement.instr_type in ("rr_format", "ri_format") and statement.opcode != "MOV"
+
+
+def is_noop_immediate(statement):
+    return (
+        statement.instr_type == "ri_format"
+        and statement.opcode in ("ADD", "SUB")
+        and statement.immediate == 0
+    )
+
+
+def reads_flags(statement):
+    return statement.instr_type == "jcc" or statement.opcode in CARRY_READERS
+
+
+def written_registers(statement):
+    if statement.instr_type in ("rr_format", "ri_format"):
+        if statement.opcode in FLAG_ONLY:
+            return ()
+        return (statement.dst,)
+    if statement.instr_type == "load_store":
+        written = (statement.trf,) if statement.opcode.startswith("LOAD") else ()
+        if statement.mem_operand.type != "base-offset":
+            # pre and post index write the updated address back
+            written += (statement.mem_operand.source,)
+        return written
+    return ()
+
+
+def blocks(parsed, removed):
+    """Split (line number, statement) pairs into basic blocks of instructions.
+
+    Yields lists of indexes into parsed, skipping those already removed.
+    """
+    block = []
+    for index, (_, statement) in enumerate(parsed):
+        if index in removed:
+            continue
+        if statement.type != "instruction":
+            if block:
+                yield block
+                block = []
+            continue
+        block.append(index)
+        if ends_block(statement):
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def drop_jumps_to_next(parsed, removed):
+    """Mark jumps whose target label directly follows them."""
+    for index, (_, statement) in enumerate(parsed):
+        if statement.type != "instruction" or index in removed:
+            continue
+        branch_dest = statement.branch_dest
+        if (
+            statement.opcode not in ("JMP", "J")
+            or branch_dest is None
+            or branch_dest.type != "LABEL"
+        ):
+            continue
+        following = index + 1
+        while following < len(parsed) and (
+            following in removed or parsed[following][1].type == "label"
+        ):
+            if parsed[following][1].type == "label" and parsed[following][1].label == branch_dest.dest:
+                removed.add(index)
+                break
+            following += 1
+
+
+def clears_high_byte(statement):
+    """The register statement leaves with a zero high byte, if any."""
+    opcode = statement.opcode
+    if statement.instr_type == "rr_format":
+        if opcode in ("XOR", "SUB") and statement.src == statement.dst:
+            return statement.dst
+    elif statement.instr_type == "ri_format":
+        if opcode == "MOVH" and statement.immediate == 0:
+            return statement.dst
+        if opcode == "AND" and statement.immediate & 0xFF00 == 0:
+            return statement.dst
+    elif opcode == "LOADB":
+        return statement.trf
+    return None
+
+
+def optimize_block(parsed, block, removed):
+    count = 0
+    # forward: registers whose high byte is known to be zero
+    high_zero = set()
+    for index in block:
+        statement = parsed[index][1]
+        opcode = statement.opcode
+        if statement.instr_type == "rr_format" and opcode == "MOV" and statement.src == statement.dst:
+            removed.add(index)
+            count += 1
+            continue
+        if opcode == "MOVH" and statement.immediate == 0 and statement.dst in high_zero:
+            removed.add(index)
+            count += 1
+            continue
+        if opcode == "MOVL":
+            # only the low byte changes
+            continue
+        high_zero.difference_update(written_registers(statement))
+        cleared = clears_high_byte(statement)
+        if cleared is not None:
+            high_zero.add(cleared)
+
+    # backward: drop instructions whose only effect is flags nobody reads
+    flags_live = True
+    for index in reversed(block):
+        if index in removed:
+            continue
+        statement = parsed[index][1]
+        if not flags_live and is_alu(statement) and (
+            statement.opcode in FLAG_ONLY or is_noop_immediate(statement)
+        ):
+            removed.add(index)
+            count += 1
+            continue
+        if statement.opcode in FLAG_SETTERS and is_alu(statement):
+            flags_live = False
+        if reads_flags(statement):
+            flags_live = True
+    return count
+
+
+def optimize(parsed):
+    """Run the peephole patterns over (line number, statement) pairs.
+
+    Returns the surviving pairs as a list. Each block is reworked until
+    nothing changes, since dropping one instruction can expose another
+    pattern. Dropping a jump never does, as the label it targeted still ends
+    the block.
+    """
+    parsed = list(parsed)
+    removed = set()
+    drop_jumps_to_next(parsed, removed)
+    for block in list(blocks(parsed, removed)):
+        while optimize_block(parsed, block, removed):
+            block = [index for index in block if index not in removed]
+    return [pair for index, pair in enumerate(parsed) if index not in removed]
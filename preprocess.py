@@ -0,0 +1,249 @@
+import hashlib
+import itertools
+import os
+
+import lex
+import parse
+import statements
+
+# .include and .macro/.endm. parse.parse_tokenized hands these lines, and
+# every line invoking a macro, to a Preprocessor; all other lines never come
+# here.
+#
+#   .include "path"       splice in another file, relative to this one
+#   .macro NAME a, b      define NAME with parameters a and b, up to .endm
+#   NAME %ax, [%sp, #2]   expand NAME, each parameter replaced by the tokens
+#                         of its argument
+#
+# An included file is parsed on its own: it sees the macros it defines or
+# includes itself, not those of the file including it, and the macros it
+# defines are visible after the .include. That makes the result depend only on
+# the file, so it is parsed once per process and cached by path, checked
+# against the mtime, size and hash of the file and of everything it includes.
+# Macro bodies are kept as token lists, so expanding one never re-lexes text.
+# Labels defined inside a macro body are renamed on every expansion, so a
+# macro with a loop can be used more than once.
+
+# absolute path -> IncludedFile, shared by every assembly in this process
+include_cache = {}
+
+# numbers each macro expansion, for the names of labels inside macro bodies
+expansion_numbers = itertools.count()
+
+
+class Macro:
+    __slots__ = ("name", "params", "body", "labels")
+
+    def __init__(self, name, params, body, labels):
+        self.name = name
+        self.params = params
+        # the token list of every non-blank line up to .endm
+        self.body = body
+        # names of the labels the body defines
+        self.labels = labels
+
+
+class IncludedFile:
+    __slots__ = ("fields", "macros", "stamps")
+
+    def __init__(self, fields, macros, stamps):
+        # statements.to_fields tuples, so every inclusion gets fresh objects
+        self.fields = fields
+        self.macros = macros
+        # path -> (mtime_ns, size, sha256) of this file and all it depends on
+        self.stamps = stamps
+
+
+def file_stamp(path, data=None):
+    with open(path, "rb") as stamped:
+        info = os.fstat(stamped.fileno())
+        if data is None:
+            data = stamped.read()
+    return (info.st_mtime_ns, info.st_size, hashlib.sha256(data).digest())
+
+
+def is_current(stamps):
+    """Return whether none of the stamped files changed.
+
+    A file whose mtime or size moved is hashed again, so touching a file
+    without changing it does not throw the cached parse away.
+    """
+    for path, (mtime_ns, size, digest) in stamps.items():
+        try:
+            info = os.stat(path)
+            if (info.st_mtime_ns, info.st_size) == (mtime_ns, size):
+                continue
+            stamp = file_stamp(path)
+        except OSError:
+            return False
+        if stamp[2] != digest:
+            return False
+        stamps[path] = stamp
+    return True
+
+
+def split_arguments(tokens):
+    """Split a macro invocation's operand tokens at commas outside brackets."""
+    if not tokens:
+        return []
+    arguments = [[]]
+    depth = 0
+    for token in tokens:
+        if token.type == "COMMA" and depth == 0:
+            arguments.append([])
+            continue
+        if token.type == "LBRACKET":
+            depth += 1
+        elif token.type == "RBRACKET":
+            depth -= 1
+        arguments[-1].append(token)
+    if not all(arguments):
+        raise SyntaxError("Empty macro argument")
+    return arguments
+
+
+class Preprocessor:
+    """The .include and .macro state of one source file being parsed."""
+
+    def __init__(self, include_dir=None, including=()):
+        self.include_dir = os.path.abspath(include_dir or os.getcwd())
+        # files currently being included, to catch include cycles
+        self.including = including
+        # upper-case name -> Macro
+        self.macros = {}
+        # stamps of every file included so far
+        self.stamps = {}
+        # names of the macros being expanded; with no conditionals, a macro
+        # that invokes itself would never stop
+        self.expanding = set()
+
+    def is_invocation(self, tokens):
+        first = tokens[0]
+        return (
+            first.type == "IDENTIFIER"
+            and tokens[1].type != "COLON"
+            and first.val.upper() in self.macros
+        )
+
+    def handle(self, tokens, tokenized):
+        """Process one line handed over by parse_tokenized.
+
+        Returns the statements it produces. A .macro line also consumes the
+        rest of the definition from tokenized.
+        """
+        if tokens[0].type != "PERIOD":
+            return self.expand(tokens)
+        directive = tokens[1].val.lower()
+        if directive == "include":
+            return self.include(tokens)
+        if directive == "macro":
+            self.define(tokens, tokenized)
+            return ()
+        raise SyntaxError(".endm without a matching .macro")
+
+    def include(self, tokens):
+        if len(tokens) != 4 or tokens[2].type != "STRING":
+            raise SyntaxError("Expected a file path string following a .include directive.")
+        path = os.path.normpath(os.path.join(self.include_dir, tokens[2].val))
+        if path in self.including:
+            raise SyntaxError("%s includes itself" % path)
+        included = include_cache.get(path)
+        if included is None or not is_current(included.stamps):
+            included = include_cache[path] = self.load(path)
+        self.macros.update(included.macros)
+        self.stamps.update(included.stamps)
+        return map(statements.from_fields, included.fields)
+
+    def load(self, path):
+        try:
+            with open(path, "rb") as source_file:
+                data = source_file.read()
+        except OSError as e:
+            raise SyntaxError("Cannot read .include file %s: %s" % (path, e.strerror)) from None
+        nested = Preprocessor(os.path.dirname(path), self.including + (path,))
+        try:
+            parsed = parse.parse_tokenized(
+                lex.tokenize_lines(data.decode("utf-8")), preprocessor=nested
+            )
+            fields = [statements.to_fields(statement) for _, statement in parsed]
+        except (SyntaxError, EOFError, UnicodeDecodeError) as e:
+            raise SyntaxError("In %s: %s" % (path, e)) from None
+        stamps = {path: file_stamp(path, data)}
+        stamps.update(nested.stamps)
+        for field in fields:
+            # .incbin contents are part of the cached parse too
+            if field[0] == "directive" and field[7] is not None:
+                stamps[field[7]] = file_stamp(field[7])
+        return IncludedFile(fields, nested.macros, stamps)
+
+    def define(self, tokens, tokenized):
+        # .macro NAME [param {, param}]
+        if tokens[2].type != "IDENTIFIER":
+            raise SyntaxError("Expected a macro name following .macro")
+        name = tokens[2].val
+        rest = tokens[3:-1]
+        params = rest[0::2]
+        if (
+            (rest and len(rest) % 2 == 0)
+            or any(token.type != "IDENTIFIER" for token in params)
+            or any(token.type != "COMMA" for token in rest[1::2])
+        ):
+            raise SyntaxError("Expected a comma-separated list of parameter names following .macro %s" % name)
+        params = [token.val for token in params]
+        if len(set(params)) != len(params):
+            raise SyntaxError("Macro %s has a repeated parameter name" % name)
+
+        body = []
+        for _, line_tokens in tokenized:
+            if line_tokens[0].type == "PERIOD" and line_tokens[1].type == "IDENTIFIER":
+                directive = line_tokens[1].val.lower()
+                if directive == "endm":
+                    break
+                if directive == "macro":
+                    raise SyntaxError("Macro %s: a .macro cannot be defined inside another" % name)
+            if len(line_tokens) > 1:
+                body.append(line_tokens)
+        else:
+            raise SyntaxError("Macro %s has no matching .endm" % name)
+        labels = {
+            line_tokens[0].val
+            for line_tokens in body
+            if line_tokens[0].type == "IDENTIFIER" and line_tokens[1].type == "COLON"
+        }
+        self.macros[name.upper()] = Macro(name, params, body, labels)
+
+    def expand(self, tokens):
+        macro = self.macros[tokens[0].val.upper()]
+        arguments = split_arguments(tokens[1:-1])
+        if len(arguments) != len(macro.params):
+            raise SyntaxError(
+                "Macro %s takes %d argument(s), got %d"
+                % (macro.name, len(macro.params), len(arguments))
+            )
+        if macro.name in self.expanding:
+            raise SyntaxError("Macro %s invokes itself" % macro.name)
+        bound = dict(zip(macro.params, arguments))
+        labels = macro.labels
+        suffix = "__%d" % next(expansion_numbers)
+        lines = []
+        for line_tokens in macro.body:
+            expanded = []
+            for token in line_tokens:
+                if token.type == "IDENTIFIER":
+                    argument = bound.get(token.val)
+                    if argument is not None:
+                        expanded.extend(argument)
+                        continue
+                    if token.val in labels:
+                        token = token._replace(val=token.val + suffix)
+                expanded.append(token)
+            lines.append((line_tokens[0].line, expanded))
+
+        self.expanding.add(macro.name)
+        try:
+            for _, statement in parse.parse_tokenized(lines, preprocessor=self):
+                yield statement
+        except SyntaxError as e:
+            raise SyntaxError("In macro %s: %s" % (macro.name, e)) from None
+        finally:
+            self.expanding.discard(macro.name)
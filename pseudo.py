@@ -0,0 +1,102 @@
+import operator
+
+import eval_lookups
+from statements import Instruction
+
+# Pseudo-instructions, which the parser expands into real instructions:
+#
+#   LDI  %r, imm16           load any 16-bit constant into %r
+#   ANDI %r, imm16 [, %t]    AND/OR/XOR %r with any 16-bit constant, using %t
+#   ORI  %r, imm16 [, %t]    as a scratch register if the constant cannot be
+#   XORI %r, imm16 [, %t]    built from the bitmask table
+#
+# Each expands to the shortest sequence found. LDI is XOR %r, %r for zero and
+# MOVH then MOVL otherwise (-O drops the MOVH when the high byte is already
+# known to be zero); there is no single instruction that sets a whole register
+# to anything else. ANDI/ORI/XORI become one AND/OR/XOR when the constant is
+# in the bitmask table, else a chain of them: ANDing with several masks in a
+# row is the same as ANDing with their AND, and likewise for OR and XOR. Only
+# a constant no short chain reaches is loaded into the scratch register.
+
+# a chain of this many masks is as long as LDI into a scratch register plus an
+# RR op, so longer ones are never tried
+MAX_CHAIN = 3
+
+PSEUDO_OPS = {
+    "ANDI": "AND",
+    "ORI": "OR",
+    "XORI": "XOR",
+}
+
+
+def mask_chains(combine):
+    """Map every value reachable in up to MAX_CHAIN masks to its shortest chain."""
+    masks = list(eval_lookups.BITMASK_CODES)
+    chains = {mask: (mask,) for mask in masks}
+    frontier = masks
+    for _ in range(MAX_CHAIN - 1):
+        reached = []
+        for value in frontier:
+            chain = chains[value]
+            for mask in masks:
+                combined = combine(value, mask)
+                if combined not in chains:
+                    chains[combined] = chain + (mask,)
+                    reached.append(combined)
+        frontier = reached
+    return chains
+
+
+# opcode -> {constant: masks}, the reverse index the expansions are chosen from
+MASK_CHAINS = {
+    "AND": mask_chains(operator.and_),
+    "OR": mask_chains(operator.or_),
+    "XOR": mask_chains(operator.xor),
+}
+
+
+def rr(opcode, dst, src):
+    statement = Instruction(opcode, "rr_format")
+    statement.dst = dst
+    statement.src = src
+    return statement
+
+
+def ri(opcode, dst, immediate):
+    statement = Instruction(opcode, "ri_format")
+    statement.dst = dst
+    statement.immediate = immediate
+    return statement
+
+
+def load_immediate(dst, value):
+    if value == 0:
+        return (rr("XOR", dst, dst),)
+    return (ri("MOVH", dst, value >> 8), ri("MOVL", dst, value & 0xFF))
+
+
+def expand(opcode, dst, value, scratch=None):
+    """Return the instructions for one pseudo-instruction, as a tuple.
+
+    value is the constant operand, which may be given as a signed or an
+    unsigned 16-bit number.
+    """
+    if not -0x8000 <= value <= 0xFFFF:
+        raise SyntaxError("Immediate %d does not fit in 16 bits" % value)
+    value &= 0xFFFF
+    if opcode == "LDI":
+        if scratch is not None:
+            raise SyntaxError("LDI takes no scratch register")
+        return load_immediate(dst, value)
+    alu_opcode = PSEUDO_OPS[opcode]
+    chain = MASK_CHAINS[alu_opcode].get(value)
+    if chain is not None:
+        return tuple(ri(alu_opcode, dst, mask) for mask in chain)
+    if scratch is None:
+        raise SyntaxError(
+            "Immediate 0x%X cannot be built from the bitmask table for %s; "
+            "name a scratch register as a third operand" % (value, opcode)
+        )
+    if scratch == dst:
+        raise SyntaxError("%s needs a scratch register other than its destination" % opcode)
+    return load_immediate(scratch, value) + (rr(alu_opcode, dst, scratch),)
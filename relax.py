@@ -0,0 +1,205 @@
+from array import array
+
+from statements import BranchDest, Instruction, align_offset
+from symbols import OFFSET_BITS, FixupList, fits
+
+# Branch relaxation. A label branch whose target is out of reach of its offset
+# field is rewritten into a longer sequence:
+#
+#   J.cc far    ->  J.inv +2 ; JMP far                        (medium)
+#   J.cc farther->  J.inv +4 ; MOVH r ; MOVL r ; JMP r        (long)
+#   JMP farther ->  MOVH r ; MOVL r ; JMP r                   (long)
+#   CALL farther->  MOVH %lr ; MOVL %lr ; CALL %lr            (long)
+#
+# where r is a scratch register the caller has to give us, since nothing in
+# the program tells us which register is free. Every rewrite moves the code
+# after it, which can push other branches out of range in turn, so forms only
+# ever grow and the layout is recomputed until nothing changes. Afterwards the
+# fixup list is rebuilt against the new statement list, holding every branch
+# that still names a label (the short forms and the JMP of a medium J.cc).
+# Long forms load their target as immediates and have no fixup.
+
+SHORT, MEDIUM, LONG = 0, 1, 2
+
+# size in bytes of each form, by offset width (jump_call has no medium form)
+FORM_SIZES = {
+    OFFSET_BITS["jcc"]: (2, 4, 8),
+    OFFSET_BITS["jump_call"]: (2, 6, 6),
+}
+
+INVERSE_CONDITIONS = {
+    "EQ": "NE",
+    "NE": "EQ",
+    "GE": "LT",
+    "LT": "GE",
+    "GT": "LE",
+    "LE": "GT",
+    "CS": "CC",
+    "CC": "CS",
+}
+
+# layout items; see layout_items
+RUN, BRANCH, LABEL, SEEK, ALIGN = range(5)
+
+
+def layout_items(statements, symbols):
+    """Compress the statement list into what relaxation needs to lay it out.
+
+    Runs of fixed-size statements collapse into a single RUN of their total
+    size, so each layout iteration only visits labels, branches and
+    directives that move the current offset.
+    """
+    fixup_numbers = {site: i for i, site in enumerate(symbols.fixups.sites)}
+    label_ids = symbols.ids
+    items = []
+    run = 0
+    for index, statement in enumerate(statements):
+        if statement.type == "instruction" and index in fixup_numbers:
+            kind, value = BRANCH, fixup_numbers[index]
+        elif statement.type == "label":
+            kind, value = LABEL, label_ids[statement.label]
+        elif statement.type == "directive" and statement.subtype == "seek":
+            kind, value = SEEK, statement.seek
+        elif statement.type == "directive" and statement.subtype == "align":
+            kind, value = ALIGN, statement.align
+        else:
+            run += statement.size
+            continue
+        if run:
+            items.append((RUN, run))
+            run = 0
+        items.append((kind, value))
+    return items
+
+
+def layout(items, sizes, branch_addresses, label_addresses, start_address):
+    current_offset = start_address
+    for kind, value in items:
+        if kind == RUN:
+            current_offset += value
+        elif kind == BRANCH:
+            branch_addresses[value] = current_offset
+            current_offset += sizes[value]
+        elif kind == LABEL:
+            label_addresses[value] = current_offset
+        elif kind == SEEK:
+            current_offset = value
+        else:
+            current_offset = align_offset(current_offset, value)
+
+
+def relax_branches(statements, symbols, start_address, scratch=None):
+    """Rewrite out-of-range label branches until every branch reaches.
+
+    Updates the label addresses in symbols and returns a new statement list
+    with each relaxed branch replaced by its expansion, all targets resolved.
+    symbols.fixups is replaced by one whose sites index into the new list.
+    """
+    fixups = symbols.fixups
+    label_ids = fixups.label_ids
+    offset_bits = fixups.offset_bits
+    label_addresses = symbols.addresses
+    items = layout_items(statements, symbols)
+    forms = bytearray(len(fixups))
+    sizes = array("L", [2] * len(fixups))
+    branch_addresses = array("l", bytes(len(fixups) * array("l").itemsize))
+
+    changed = True
+    while changed:
+        layout(items, sizes, branch_addresses, label_addresses, start_address)
+        changed = False
+        for i, form in enumerate(forms):
+            if form == LONG:
+                continue
+            address = branch_addresses[i]
+            target = label_addresses[label_ids[i]]
+            bits = offset_bits[i]
+            if form == SHORT:
+                if fits(target - address, bits):
+                    continue
+                # a J.cc first tries hopping over a JMP, which sits one word in
+                if bits == OFFSET_BITS["jcc"] and fits(target - address - 2, OFFSET_BITS["jump_call"]):
+                    form = MEDIUM
+                else:
+                    form = LONG
+            elif fits(target - address - 2, OFFSET_BITS["jump_call"]):
+                continue
+            else:
+                form = LONG
+            forms[i] = form
+            sizes[i] = FORM_SIZES[bits][form]
+            changed = True
+
+    expansions = {}
+    needs_scratch = []
+    for i, site in enumerate(fixups.sites):
+        statement = statements[site]
+        target = label_addresses[label_ids[i]]
+        if forms[i] == SHORT:
+            statement.branch_dest.dest = target
+            continue
+        if forms[i] == LONG and scratch is None and statement.opcode != "CALL":
+            needs_scratch.append(statement.branch_dest.dest)
+            continue
+        expansions[site] = expand(statement, forms[i], branch_addresses[i], target, scratch)
+    if needs_scratch:
+        raise SyntaxError(
+            "Branch target(s) out of range of a relative jump: %s. Give a scratch "
+            "register (--relax-scratch) to allow absolute jumps through it."
+            % ", ".join(needs_scratch)
+        )
+
+    fixup_numbers = {site: i for i, site in enumerate(fixups.sites)}
+    relaxed = []
+    relaxed_fixups = FixupList()
+    for index, statement in enumerate(statements):
+        i = fixup_numbers.get(index)
+        expansion = expansions.get(index)
+        if expansion is None:
+            if i is not None:
+                relaxed_fixups.add(len(relaxed), label_ids[i], offset_bits[i])
+            relaxed.append(statement)
+            continue
+        if forms[i] == MEDIUM:
+            # the JMP after the inverted J.cc
+            relaxed_fixups.add(len(relaxed) + 1, label_ids[i], OFFSET_BITS["jump_call"])
+        relaxed.extend(expansion)
+    symbols.fixups = relaxed_fixups
+    return relaxed
+
+
+def branch(opcode, instr_type, dest_type, dest, condition_code=None):
+    statement = Instruction(opcode, instr_type)
+    statement.condition_code = condition_code
+    statement.branch_dest = BranchDest(dest_type, dest)
+    return statement
+
+
+def load_immediate(opcode, register, value):
+    statement = Instruction(opcode, "ri_format")
+    statement.dst = register
+    statement.immediate = value
+    return statement
+
+
+def long_jump(opcode, target, register):
+    # MOVH before MOVL, since MOVL keeps the high byte
+    return [
+        load_immediate("MOVH", register, target >> 8),
+        load_immediate("MOVL", register, target & 0xFF),
+        branch(opcode, "jump_call", "REGISTER", register),
+    ]
+
+
+def expand(statement, form, address, target, scratch):
+    """Return the instructions replacing branch statement in the given form."""
+    if statement.instr_type == "jcc":
+        # skip over the rest of the sequence when the condition fails
+        skip = address + FORM_SIZES[OFFSET_BITS["jcc"]][form]
+        inverse = branch("J", "jcc", "LABEL", skip, INVERSE_CONDITIONS[statement.condition_code])
+        if form == MEDIUM:
+            return [inverse, branch("JMP", "jump_call", "LABEL", target)]
+        return [inverse] + long_jump("JMP", target, scratch)
+    # a call overwrites %lr anyway, so it can carry the target
+    register = "LR" if statement.opcode == "CALL" else scratch
+    return long_jump(statement.opcode, target, register)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import concurrent.futures
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+import cheesegrater
+
+# Long-running assembler service, for callers that would otherwise start a new
+# process for every file. Requests and responses are JSON objects, one per
+# line, over stdin/stdout or a Unix socket. A request looks like
+#
+#   {"id": 7, "source": "MOVL %ax, #5\nHALT"}        or "path": "prog.sws"
+#
+# with optional "encoder", "optimize", "relax", "relax_scratch", "sparse",
+# "include_dir" (for .include in "source"; a "path" uses its own directory)
+# and "output" (write the WHEEL file there instead of returning it). The
+# response echoes the id:
+#
+#   {"id": 7, "ok": true, "wheel": "<base64 WHEEL file>", "seconds": 0.0004}
+#   {"id": 7, "ok": false, "error": "Line 1: ...", "seconds": 0.0001}
+#
+# Requests run concurrently on a pool of workers, so responses can come back
+# in a different order from the requests. {"op": "ping"} is answered at once.
+# Each worker keeps a memo.Memo for its whole life, so lines and instructions
+# it has seen before are neither parsed nor encoded again.
+
+# per-worker memo, shared by every request that worker handles
+worker_memo = None
+
+# optional request fields and the type each must have
+REQUEST_FIELD_TYPES = {
+    "source": str,
+    "path": str,
+    "include_dir": str,
+    "encoder": str,
+    "relax_scratch": str,
+    "output": str,
+    "optimize": bool,
+    "relax": bool,
+    "sparse": bool,
+}
+
+
+def init_worker():
+    global worker_memo
+    import memo
+
+    worker_memo = memo.Memo()
+    # compiles the tokenizer regex and fills the parser's tables up front
+    cheesegrater.assemble("NOP")
+
+
+def check_request(request):
+    # a field of the wrong type is the caller's mistake, not an internal error
+    for name, field_type in REQUEST_FIELD_TYPES.items():
+        value = request.get(name)
+        if value is not None and not isinstance(value, field_type):
+            raise ValueError(
+                "'%s' must be a %s" % (name, "string" if field_type is str else "boolean")
+            )
+
+
+def assemble_request(request):
+    """Handle one assemble request in a worker, returning its response."""
+    start = time.perf_counter()
+    response = {"id": request.get("id")}
+    try:
+        check_request(request)
+        source = request.get("source")
+        include_dir = request.get("include_dir")
+        if source is None:
+            path = request.get("path")
+            if path is None:
+                raise ValueError("Request needs either a 'source' or a 'path'")
+            with open(path, "r") as infile:
+                source = infile.read()
+            include_dir = os.path.dirname(os.path.abspath(path))
+        encoder = request.get("encoder", "int")
+        if encoder not in cheesegrater.ENCODER_NAMES:
+            raise ValueError("Unknown encoder %s" % encoder)
+        scratch = request.get("relax_scratch")
+        if scratch is not None:
+            scratch = cheesegrater.scratch_register(scratch)
+        image = cheesegrater.assemble(
+            source,
+            encoder,
+            worker_memo,
+            None,
+            request.get("relax", True),
+            scratch,
+            request.get("optimize", False),
+            include_dir,
+        )
+        sparse = request.get("sparse", False)
+        output = request.get("output")
+        if output is not None:
+            image.write(output, sparse)
+        else:
+            data = image.to_sparse_bytes() if sparse else image.to_bytes()
+            response["wheel"] = base64.b64encode(data).decode("ascii")
+        response["ok"] = True
+    except (OSError, SyntaxError, EOFError, ValueError, ImportError) as e:
+        response["ok"] = False
+        response["error"] = str(e)
+    response["seconds"] = time.perf_counter() - start
+    return response
+
+
+class AssemblerService:
+    """Dispatches request lines to a pool of warm workers.
+
+    With one worker, requests run on a thread of this process, which avoids
+    pickling requests and responses across processes.
+    """
+
+    def __init__(self, workers=None):
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            self.executor = concurrent.futures.ThreadPoolExecutor(1, initializer=init_worker)
+        else:
+            self.executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker)
+
+    def submit(self, line, respond):
+        """Start handling one request line; respond is called with the response.
+
+        Returns a future that is done once respond has been called.
+        """
+        start = time.perf_counter()
+        done = concurrent.futures.Future()
+
+        def respond_now(response):
+            response["seconds"] = time.perf_counter() - start
+            respond(response)
+            done.set_result(None)
+            return done
+
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            return respond_now({"id": None, "ok": False, "error": "Malformed request: %s" % e})
+        op = request.get("op", "assemble")
+        if op == "ping":
+            return respond_now({"id": request.get("id"), "ok": True})
+        if op != "assemble":
+            return respond_now({"id": request.get("id"), "ok": False, "error": "Unknown op %s" % op})
+
+        def finished(future):
+            try:
+                response = future.result()
+            except Exception as e:
+                # assemble_request reports every error in the request itself,
+                # so this is a bug or a worker process that died
+                response = {
+                    "id": request.get("id"),
+                    "ok": False,
+                    "error": "Internal error: %r" % e,
+                    "seconds": time.perf_counter() - start,
+                }
+            respond(response)
+            done.set_result(None)
+
+        self.executor.submit(assemble_request, request).add_done_callback(finished)
+        return done
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def line_writer(stream):
+    """Return a thread-safe function writing each response as one line."""
+    lock = threading.Lock()
+
+    def respond(response):
+        line = json.dumps(response) + "\n"
+        with lock:
+            stream.write(line)
+            stream.flush()
+
+    return respond
+
+
+def serve_stdio(service):
+    respond = line_writer(sys.stdout)
+    for line in sys.stdin:
+        if line.strip():
+            service.submit(line, respond)
+
+
+class ConnectionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        lock = threading.Lock()
+        wfile = self.wfile
+
+        def respond(response):
+            data = (json.dumps(response) + "\n").encode("utf-8")
+            with lock:
+                try:
+                    wfile.write(data)
+                    wfile.flush()
+                except OSError:
+                    # the client has gone away
+                    pass
+
+        pending = []
+        for line in self.rfile:
+            if line.strip():
+                pending.append(self.server.service.submit(line.decode("utf-8"), respond))
+        # keep the connection open until every answer has been sent
+        concurrent.futures.wait(pending)
+
+
+class UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        self.service = service
+        super().__init__(path, ConnectionHandler)
+
+
+def serve_socket(service, path):
+    if os.path.exists(path):
+        os.unlink(path)
+    server = UnixServer(path, service)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Run the assembler as a long-lived service speaking JSON lines "
+        "on stdin/stdout or a Unix socket."
+    )
+    arg_parser.add_argument(
+        "--socket", metavar="PATH", help="listen on this Unix socket instead of stdin/stdout"
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: all cores; 1 runs requests in this process)",
+    )
+    args = arg_parser.parse_args(argv)
+
+    service = AssemblerService(args.jobs)
+    # stop as on Ctrl-C, so that the socket file is removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        if args.socket:
+            serve_socket(service, args.socket)
+        else:
+            serve_stdio(service)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
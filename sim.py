@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+import time
+
+import decode
+import eval_lookups
+from statements import PROCESSOR_START_ADDR
+from wheel import IMAGE_SIZE, WheelImage
+
+# pARMesan instruction-set simulator. The whole 64KB image is predecoded into a
+# table holding a (handler, operands) pair for every address, so executing an
+# instruction is one table lookup and one call. Branch targets are resolved to
+# absolute addresses while predecoding. A store invalidates the entries that
+# overlap the bytes it wrote, and they are decoded again if they are ever
+# executed, so self-modifying code still behaves.
+#
+# Semantics the encoding alone does not pin down, chosen to match the samples
+# in sws/:
+#   - registers and flags start at zero, execution starts at 0xF000
+#   - MOVL and MOVH each replace one byte and keep the other
+#   - SUB, CMP and SBC set carry when there is no borrow, as on ARM
+#   - AND/OR/XOR/TEST only set N and Z; shifts set N, Z and C
+#   - LOADB zero-extends; a load into its own index register wins over
+#     the write-back
+#   - a store to 0x6969 is also recorded as program output
+
+OUTPUT_ADDR = 0x6969
+DEFAULT_MAX_STEPS = 100_000_000
+
+LR = eval_lookups.REG_BITS["LR"]
+
+# flags are kept as one 4-bit NZCV value
+N_FLAG, Z_FLAG, C_FLAG, V_FLAG = 8, 4, 2, 1
+
+# condition code -> whether it holds, indexed by NZCV
+CONDITIONS = {}
+for _nzcv in range(16):
+    _n = bool(_nzcv & N_FLAG)
+    _z = bool(_nzcv & Z_FLAG)
+    _c = bool(_nzcv & C_FLAG)
+    _v = bool(_nzcv & V_FLAG)
+    for _cc, _holds in (
+        ("EQ", _z),
+        ("NE", not _z),
+        ("GE", _n == _v),
+        ("GT", not _z and _n == _v),
+        ("LT", _n != _v),
+        ("LE", _z or _n != _v),
+        ("CS", _c),
+        ("CC", not _c),
+    ):
+        CONDITIONS.setdefault(_cc, []).append(_holds)
+CONDITIONS = {cc: tuple(row) for cc, row in CONDITIONS.items()}
+del _nzcv, _n, _z, _c, _v, _cc, _holds
+
+
+class Machine:
+    """A pARMesan CPU with its 64KB of memory."""
+
+    def __init__(self, memory=None, pc=PROCESSOR_START_ADDR):
+        self.memory = bytearray(IMAGE_SIZE) if memory is None else bytearray(memory)
+        self.regs = [0] * 8
+        # NZCV, in a list so that handlers can update it in place
+        self.flags = [0]
+        self.pc = pc
+        self.halted = False
+        self.interrupts_enabled = False
+        self.outputs = []
+        self.steps = 0
+        self.table = [None] * IMAGE_SIZE
+        # word -> table entry, for every word whose entry is address independent
+        self.entries = {}
+        self.handlers = self.make_handlers()
+        self.lazy_entry = (self.decode_and_run, None)
+        self.predecode()
+
+    @classmethod
+    def from_wheel(cls, path):
+        return cls(WheelImage.read(path).memory)
+
+    def entry_at(self, address):
+        """Decode the word at address into its (handler, operands) entry."""
+        memory = self.memory
+        word = memory[address] | (memory[(address + 1) & 0xFFFF] << 8)
+        entry = self.entries.get(word)
+        if entry is not None:
+            return entry
+        decoded = decode.decode(word)
+        if decoded is None:
+            return (self.handlers["illegal"], word)
+        opcode, form, operands = decoded
+        if form == "jcc":
+            cc, offset = operands
+            return (self.handlers["J"], ((address + 2 * offset) & 0xFFFF, CONDITIONS[cc]))
+        if form == "jump":
+            return (self.handlers[opcode, form], (address + 2 * operands[0]) & 0xFFFF)
+        entry = self.entries[word] = (self.handlers[opcode, form], operands)
+        return entry
+
+    def predecode(self):
+        entry_at = self.entry_at
+        self.table[:] = [entry_at(address) for address in range(IMAGE_SIZE)]
+
+    def decode_and_run(self, pc, _):
+        # entry for an address whose bytes changed since it was decoded
+        entry = self.table[pc] = self.entry_at(pc)
+        return entry[0](pc, entry[1])
+
+    def make_handlers(self):
+        """Build the handler for every (opcode, form), closed over the CPU state.
+
+        A handler takes the address of its instruction and the operands from
+        its table entry, and returns the address to execute next, or -1 to
+        stop.
+        """
+        regs = self.regs
+        flags = self.flags
+        memory = self.memory
+        table = self.table
+        outputs = self.outputs
+        machine = self
+
+        # ALU operations: (a, b) -> result, setting the flags
+
+        def add_with_carry(a, b, carry):
+            total = a + b + carry
+            result = total & 0xFFFF
+            flags[0] = (
+                ((result >> 12) & N_FLAG)
+                | ((result == 0) << 2)
+                | ((total >> 16) << 1)
+                | ((((a ^ result) & (b ^ result)) >> 15) & 1)
+            )
+            return result
+
+        def add(a, b):
+            return add_with_carry(a, b, 0)
+
+        def adc(a, b):
+            return add_with_carry(a, b, (flags[0] >> 1) & 1)
+
+        def sub(a, b):
+            return add_with_carry(a, b ^ 0xFFFF, 1)
+
+        def sbc(a, b):
+            return add_with_carry(a, b ^ 0xFFFF, (flags[0] >> 1) & 1)
+
+        def logic_flags(result):
+            flags[0] = ((result >> 12) & N_FLAG) | ((result == 0) << 2) | (flags[0] & (C_FLAG | V_FLAG))
+            return result
+
+        def and_(a, b):
+            return logic_flags(a & b)
+
+        def or_(a, b):
+            return logic_flags(a | b)
+
+        def xor(a, b):
+            return logic_flags(a ^ b)
+
+        def shift_flags(result, carry):
+            flags[0] = ((result >> 12) & N_FLAG) | ((result == 0) << 2) | (carry << 1) | (flags[0] & V_FLAG)
+            return result
+
+        def lsl(a, n):
+            if n == 0:
+                return logic_flags(a)
+            return shift_flags((a << n) & 0xFFFF, ((a << n) >> 16) & 1)
+
+        def lsr(a, n):
+            if n == 0:
+                return logic_flags(a)
+            return shift_flags(a >> n, (a >> (n - 1)) & 1)
+
+        def asr(a, n):
+            if n == 0:
+                return logic_flags(a)
+            a = decode.signed(a, 16)
+            return shift_flags((a >> n) & 0xFFFF, (a >> (n - 1)) & 1)
+
+        alu_ops = {
+            "ADD": add,
+            "SUB": sub,
+            "AND": and_,
+            "OR": or_,
+            "XOR": xor,
+            "CMP": sub,
+            "LSL": lsl,
+            "LSR": lsr,
+            "ADC": adc,
+            "SBC": sbc,
+            "TEST": and_,
+            "ASR": asr,
+        }
+        flag_only = ("CMP", "TEST")
+
+        def make_rr(op, writes):
+            if writes:
+                def handler(pc, operands):
+                    dst, src = operands
+                    regs[dst] = op(regs[dst], regs[src])
+                    return (pc + 2) & 0xFFFF
+            else:
+                def handler(pc, operands):
+                    dst, src = operands
+                    op(regs[dst], regs[src])
+                    return (pc + 2) & 0xFFFF
+            return handler
+
+        def make_ri(op, writes):
+            if writes:
+                def handler(pc, operands):
+                    dst, immediate = operands
+                    regs[dst] = op(regs[dst], immediate)
+                    return (pc + 2) & 0xFFFF
+            else:
+                def handler(pc, operands):
+                    dst, immediate = operands
+                    op(regs[dst], immediate)
+                    return (pc + 2) & 0xFFFF
+            return handler
+
+        def mov(pc, operands):
+            dst, src = operands
+            regs[dst] = regs[src]
+            return (pc + 2) & 0xFFFF
+
+        def movl(pc, operands):
+            dst, immediate = operands
+            regs[dst] = (regs[dst] & 0xFF00) | immediate
+            return (pc + 2) & 0xFFFF
+
+        def movh(pc, operands):
+            dst, immediate = operands
+            regs[dst] = (regs[dst] & 0x00FF) | (immediate << 8)
+            return (pc + 2) & 0xFFFF
+
+        # memory
+
+        def invalidate(address, length):
+            # every entry whose word overlaps the written bytes
+            lazy_entry = machine.lazy_entry
+            for i in range(-1, length):
+                table[(address + i) & 0xFFFF] = lazy_entry
+
+        def read_word(address):
+            return memory[address] | (memory[(address + 1) & 0xFFFF] << 8)
+
+        def read_byte(address):
+            return memory[address]
+
+        def write_word(address, value):
+            memory[address] = value & 0xFF
+            memory[(address + 1) & 0xFFFF] = value >> 8
+            invalidate(address, 2)
+            if address == OUTPUT_ADDR:
+                outputs.append(value)
+
+        def write_byte(address, value):
+            memory[address] = value & 0xFF
+            invalidate(address, 1)
+            if address == OUTPUT_ADDR:
+                outputs.append(value & 0xFF)
+
+        def make_load(read, mode):
+            if mode == "base-offset":
+                def handler(pc, operands):
+                    trf, base, offset = operands
+                    regs[trf] = read((regs[base] + offset) & 0xFFFF)
+                    return (pc + 2) & 0xFFFF
+            elif mode == "pre-index":
+                def handler(pc, operands):
+                    trf, src, offset = operands
+                    address = regs[src] = (regs[src] + offset) & 0xFFFF
+                    regs[trf] = read(address)
+                    return (pc + 2) & 0xFFFF
+            else:
+                def handler(pc, operands):
+                    trf, src, offset = operands
+                    address = regs[src]
+                    regs[src] = (address + offset) & 0xFFFF
+                    regs[trf] = read(address)
+                    return (pc + 2) & 0xFFFF
+            return handler
+
+        def make_store(write, mode):
+            if mode == "base-offset":
+                def handler(pc, operands):
+                    trf, base, offset = operands
+                    write((regs[base] + offset) & 0xFFFF, regs[trf])
+                    return (pc + 2) & 0xFFFF
+            elif mode == "pre-index":
+                def handler(pc, operands):
+                    trf, src, offset = operands
+                    value = regs[trf]
+                    address = regs[src] = (regs[src] + offset) & 0xFFFF
+                    write(address, value)
+                    return (pc + 2) & 0xFFFF
+            else:
+                def handler(pc, operands):
+                    trf, src, offset = operands
+                    value = regs[trf]
+                    address = regs[src]
+                    regs[src] = (address + offset) & 0xFFFF
+                    write(address, value)
+                    return (pc + 2) & 0xFFFF
+            return handler
+
+        # control flow
+
+        def halt(pc, operands):
+            machine.pc = pc
+            machine.halted = True
+            return -1
+
+        def nop(pc, operands):
+            return (pc + 2) & 0xFFFF
+
+        def ret(pc, operands):
+            return regs[LR]
+
+        def enable_interrupts(pc, operands):
+            machine.interrupts_enabled = True
+            return (pc + 2) & 0xFFFF
+
+        def disable_interrupts(pc, operands):
+            machine.interrupts_enabled = False
+            return (pc + 2) & 0xFFFF
+
+        def jcc(pc, operands):
+            target, holds = operands
+            if holds[flags[0]]:
+                return target
+            return (pc + 2) & 0xFFFF
+
+        def jmp(pc, target):
+            return target
+
+        def call(pc, target):
+            regs[LR] = (pc + 2) & 0xFFFF
+            return target
+
+        def jmp_reg(pc, operands):
+            return regs[operands[0]]
+
+        def call_reg(pc, operands):
+            target = regs[operands[0]]
+            regs[LR] = (pc + 2) & 0xFFFF
+            return target
+
+        def illegal(pc, word):
+            machine.pc = pc
+            raise ValueError("Illegal instruction 0x%04X at 0x%04X" % (word, pc))
+
+        handlers = {
+            ("HALT", "noarg"): halt,
+            ("NOP", "noarg"): nop,
+            ("RET", "noarg"): ret,
+            ("EI", "noarg"): enable_interrupts,
+            ("DI", "noarg"): disable_interrupts,
+            "J": jcc,
+            ("JMP", "jump"): jmp,
+            ("CALL", "jump"): call,
+            ("JMP", "jump_reg"): jmp_reg,
+            ("CALL", "jump_reg"): call_reg,
+            ("MOV", "rr"): mov,
+            ("MOVL", "ri"): movl,
+            ("MOVH", "ri"): movh,
+            "illegal": illegal,
+        }
+        for opcode, op in alu_ops.items():
+            handlers[opcode, "rr"] = make_rr(op, opcode not in flag_only)
+            handlers[opcode, "ri"] = make_ri(op, opcode not in flag_only)
+        for opcode, read, write in (
+            ("LOADW", read_word, None),
+            ("LOADB", read_byte, None),
+            ("STOREW", None, write_word),
+            ("STOREB", None, write_byte),
+        ):
+            for mode in ("base-offset", "pre-index", "post-index"):
+                if read is not None:
+                    handlers[opcode, mode] = make_load(read, mode)
+                else:
+                    handlers[opcode, mode] = make_store(write, mode)
+        return handlers
+
+    def run(self, max_steps=DEFAULT_MAX_STEPS):
+        """Execute until HALT or max_steps instructions. Returns the count run."""
+        table = self.table
+        pc = self.pc
+        executed = 0
+        for executed in range(1, max_steps + 1):
+            handler, operands = table[pc]
+            pc = handler(pc, operands)
+            if pc < 0:
+                break
+        else:
+            self.pc = pc
+        self.steps += executed
+        return executed
+
+
+def load_machine(path):
+    if path.endswith(".sws"):
+        import cheesegrater
+
+        return Machine(cheesegrater.assemble_file(path).memory)
+    return Machine.from_wheel(path)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Run a WHEEL image (or a SWISS file, assembled first) on a simulated pARMesan CPU."
+    )
+    arg_parser.add_argument("path", metavar="PATH", help="a .wheel image or .sws source file")
+    arg_parser.add_argument(
+        "--max-steps",
+        type=int,
+        default=DEFAULT_MAX_STEPS,
+        help="stop after this many instructions (default: %d)" % DEFAULT_MAX_STEPS,
+    )
+    arg_parser.add_argument(
+        "--expect",
+        metavar="VALUES",
+        help="comma-separated values the program must output (stores to $6969); exit 1 otherwise",
+    )
+    arg_parser.add_argument(
+        "-q", "--quiet", action="store_true", help="only print the execution statistics"
+    )
+    args = arg_parser.parse_args(argv)
+
+    try:
+        start = time.perf_counter()
+        machine = load_machine(args.path)
+        loaded = time.perf_counter()
+        machine.run(args.max_steps)
+        finished = time.perf_counter()
+    except FileNotFoundError:
+        print("No such file exists for input file of:\n\t%s" % args.path)
+        return 1
+    except (SyntaxError, EOFError, ValueError) as e:
+        print(e)
+        return 1
+
+    if not args.quiet:
+        for value in machine.outputs:
+            print(value)
+    seconds = finished - loaded
+    print(
+        "%s after %d instructions in %.4fs (%.0f instructions/s), load and predecode %.4fs"
+        % (
+            "halted at 0x%04X" % machine.pc if machine.halted else "stopped at 0x%04X" % machine.pc,
+            machine.steps,
+            seconds,
+            machine.steps / seconds if seconds else 0,
+            loaded - start,
+        ),
+        file=sys.stderr,
+    )
+    if args.expect is not None:
+        expected = [int(value, 0) for value in args.expect.split(",") if value]
+        if machine.outputs != expected:
+            print("expected output %s, got %s" % (expected, machine.outputs), file=sys.stderr)
+            return 1
+    if not machine.halted:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
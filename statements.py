@@ -0,0 +1,190 @@
+# Intermediate representation shared by the parser, both assembler passes and
+# the encoders. Every class uses __slots__ so that sources with hundreds of
+# thousands of lines do not pay for a dict per statement.
+
+# where pass 1 starts laying out the program
+PROCESSOR_START_ADDR = 0xF000
+
+
+def align_offset(offset, boundary):
+    return ((offset + boundary - 1) // boundary) * boundary
+
+
+class MemOperand:
+    __slots__ = ("type", "source", "offset")
+
+    def __init__(self, type, source, offset=0):
+        # type is one of "base-offset", "pre-index", "post-index"
+        self.type = type
+        self.source = source
+        self.offset = offset
+
+    def __repr__(self):
+        return "MemOperand(%r, %r, %r)" % (self.type, self.source, self.offset)
+
+
+class BranchDest:
+    __slots__ = ("type", "dest")
+
+    def __init__(self, type, dest):
+        # type is "LABEL" (dest is a label name) or "REGISTER" (dest is a register name)
+        self.type = type
+        self.dest = dest
+
+    def __repr__(self):
+        return "BranchDest(%r, %r)" % (self.type, self.dest)
+
+
+class Instruction:
+    __slots__ = (
+        "opcode",
+        "instr_type",
+        "size",
+        "address",
+        "condition_code",
+        "branch_dest",
+        "trf",
+        "mem_operand",
+        "dst",
+        "src",
+        "immediate",
+    )
+    type = "instruction"
+
+    def __init__(self, opcode, instr_type=None, size=2):
+        self.opcode = opcode
+        self.instr_type = instr_type
+        self.size = size
+        self.address = None
+        self.condition_code = None
+        self.branch_dest = None
+        self.trf = None
+        self.mem_operand = None
+        self.dst = None
+        self.src = None
+        self.immediate = None
+
+    def __repr__(self):
+        fields = ", ".join(
+            "%s=%r" % (name, getattr(self, name))
+            for name in self.__slots__
+            if getattr(self, name) is not None
+        )
+        return "Instruction(%s)" % fields
+
+    def __reduce__(self):
+        return (from_fields, (to_fields(self),))
+
+
+class Directive:
+    __slots__ = ("subtype", "size", "bytes", "seek", "align", "fill", "path")
+    type = "directive"
+
+    def __init__(self, subtype):
+        # subtype is one of "bytes", "seek", "align"
+        self.subtype = subtype
+        self.size = 0
+        self.bytes = None
+        self.seek = None
+        self.align = None
+        self.fill = None
+        # file the bytes were mapped from, for .incbin
+        self.path = None
+
+    def __repr__(self):
+        fields = ", ".join(
+            "%s=%r" % (name, getattr(self, name))
+            for name in self.__slots__
+            if getattr(self, name) is not None
+        )
+        return "Directive(%s)" % fields
+
+    def __reduce__(self):
+        return (from_fields, (to_fields(self),))
+
+
+class Label:
+    __slots__ = ("label",)
+    type = "label"
+    size = 0
+
+    def __init__(self, label):
+        self.label = label
+
+    def __repr__(self):
+        return "Label(%r)" % self.label
+
+    def __reduce__(self):
+        return (from_fields, (to_fields(self),))
+
+
+# Statements flattened to tuples of plain values. Rebuilding from a tuple is
+# several times cheaper than the generic pickle path for __slots__ classes,
+# which matters wherever statements are cached or sent between processes.
+
+
+def to_fields(statement):
+    if statement.type == "instruction":
+        branch_dest = statement.branch_dest
+        mem_operand = statement.mem_operand
+        return (
+            "instruction",
+            statement.opcode,
+            statement.instr_type,
+            statement.size,
+            statement.address,
+            statement.condition_code,
+            None if branch_dest is None else branch_dest.type,
+            None if branch_dest is None else branch_dest.dest,
+            statement.trf,
+            None if mem_operand is None else mem_operand.type,
+            None if mem_operand is None else mem_operand.source,
+            None if mem_operand is None else mem_operand.offset,
+            statement.dst,
+            statement.src,
+            statement.immediate,
+        )
+    if statement.type == "directive":
+        data = statement.bytes
+        if isinstance(data, memoryview):
+            # .incbin contents are a view of a memory-mapped file
+            data = data.tobytes()
+        return (
+            "directive",
+            statement.subtype,
+            statement.size,
+            data,
+            statement.seek,
+            statement.align,
+            statement.fill,
+            statement.path,
+        )
+    return ("label", statement.label)
+
+
+def from_fields(fields):
+    kind = fields[0]
+    if kind == "instruction":
+        statement = Instruction(fields[1], fields[2])
+        statement.size = fields[3]
+        statement.address = fields[4]
+        statement.condition_code = fields[5]
+        if fields[6] is not None:
+            statement.branch_dest = BranchDest(fields[6], fields[7])
+        statement.trf = fields[8]
+        if fields[9] is not None:
+            statement.mem_operand = MemOperand(fields[9], fields[10], fields[11])
+        statement.dst = fields[12]
+        statement.src = fields[13]
+        statement.immediate = fields[14]
+        return statement
+    if kind == "directive":
+        statement = Directive(fields[1])
+        statement.size = fields[2]
+        statement.bytes = fields[3]
+        statement.seek = fields[4]
+        statement.align = fields[5]
+        statement.fill = fields[6]
+        statement.path = fields[7]
+        return statement
+    return Label(fields[1])
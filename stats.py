@@ -0,0 +1,140 @@
+import collections
+import contextlib
+import json
+import time
+import types
+
+# Instrumentation for a single assembler run. Nothing here is imported or
+# called unless a Stats object is handed to cheesegrater.assemble, so the
+# normal path pays nothing for it: per-statement hooks are installed by
+# wrapping the encoder, and phases are timed only around whole passes.
+
+# phases in the order they are reported
+PHASES = ["lex", "parse", "optimize", "layout", "labels", "encode", "stream", "wheel"]
+
+
+class Stats:
+    """Timers and counters collected while assembling."""
+
+    def __init__(self):
+        # phase -> seconds
+        self.timers = collections.defaultdict(float)
+        # instr_type -> seconds spent in its encoder
+        self.encoder_timers = collections.defaultdict(float)
+        self.statement_counts = collections.Counter()
+        self.instr_type_counts = collections.Counter()
+        self.opcode_counts = collections.Counter()
+        # memo.Memo.hit_rates(), when a memo or cache was used
+        self.memo = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.perf_counter() - start
+
+    def timed(self, name, run_phase, *args):
+        """Run one pass under the timer for phase name and return its result.
+
+        A lazy pass, one returning a generator, is run to completion inside
+        the timer, so that its work is not billed to the pass consuming it.
+        """
+        with self.phase(name):
+            result = run_phase(*args)
+            if isinstance(result, types.GeneratorType):
+                result = list(result)
+        return result
+
+    def count_statements(self, statements):
+        for statement in statements:
+            self.statement_counts[statement.type] += 1
+
+    def count_instructions(self, statements):
+        for statement in statements:
+            if statement.type == "instruction":
+                self.instr_type_counts[statement.instr_type] += 1
+                self.opcode_counts[statement.opcode] += 1
+
+    def wrap_encoder(self, encode_statement):
+        """Wrap an encode_statement function to time and count every call."""
+        encoder_timers = self.encoder_timers
+        instr_type_counts = self.instr_type_counts
+        opcode_counts = self.opcode_counts
+        perf_counter = time.perf_counter
+
+        def encode_counted(statement):
+            start = perf_counter()
+            data = encode_statement(statement)
+            encoder_timers[statement.instr_type] += perf_counter() - start
+            instr_type_counts[statement.instr_type] += 1
+            opcode_counts[statement.opcode] += 1
+            return data
+
+        return encode_counted
+
+    def report(self):
+        phases = [name for name in PHASES if name in self.timers]
+        phases += sorted(name for name in self.timers if name not in PHASES)
+        return {
+            "phases": {name: self.timers[name] for name in phases},
+            "total_s": sum(self.timers.values()),
+            "statements": dict(self.statement_counts),
+            "encoders": {
+                instr_type: {
+                    "count": self.instr_type_counts[instr_type],
+                    "seconds": self.encoder_timers.get(instr_type),
+                }
+                for instr_type in sorted(self.instr_type_counts)
+            },
+            "opcodes": dict(self.opcode_counts.most_common()),
+            "memo": self.memo,
+        }
+
+    def format_report(self):
+        report = self.report()
+        total = report["total_s"] or 1
+        lines = ["phase          seconds      %"]
+        for name, seconds in report["phases"].items():
+            lines.append("%-10s %11.6f %6.1f" % (name, seconds, 100 * seconds / total))
+        lines.append("%-10s %11.6f" % ("total", report["total_s"]))
+        if report["statements"]:
+            lines.append("")
+            lines.append(
+                "statements: "
+                + ", ".join("%s=%d" % item for item in sorted(report["statements"].items()))
+            )
+        if report["encoders"]:
+            lines.append("")
+            lines.append("encoder        count      seconds")
+            for instr_type, encoder in report["encoders"].items():
+                seconds = encoder["seconds"]
+                lines.append(
+                    "%-10s %9d %12s"
+                    % (instr_type, encoder["count"], "-" if seconds is None else "%.6f" % seconds)
+                )
+        if report["opcodes"]:
+            lines.append("")
+            lines.append(
+                "opcodes: " + ", ".join("%s=%d" % item for item in report["opcodes"].items())
+            )
+        if report["memo"]:
+            lines.append("")
+            for layer, counts in report["memo"].items():
+                rate = counts["hit_rate"]
+                lines.append(
+                    "memo %-9s %d hits, %d misses (%s)"
+                    % (
+                        layer,
+                        counts["hits"],
+                        counts["misses"],
+                        "-" if rate is None else "%.1f%%" % (100 * rate),
+                    )
+                )
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        with open(path, "w") as out:
+            json.dump(self.report(), out, indent=2)
+            out.write("\n")
@@ -0,0 +1,112 @@
+import os
+
+import eval_int_fns
+import parse
+from statements import PROCESSOR_START_ADDR, align_offset
+from symbols import OFFSET_BITS, OFFSET_NAMES, SymbolTable
+from wheel import WheelImage
+
+# Constant-memory assembly. Statements flow through generator stages and are
+# dropped as soon as their bytes are in the image, so nothing proportional to
+# the number of source lines is kept alive. Label branches cannot be encoded
+# until their target is known; they are written as placeholder words and
+# recorded in a compact fixup list that is swept once the source is exhausted.
+# Since the sweep patches memory rather than statements, a .seek that writes
+# over a branch still waiting for its offset is an error.
+
+# the fixup list only keeps each branch's offset width, which tells J.cc apart
+# from JMP/CALL
+OFFSET_NAMES_BY_BITS = {OFFSET_BITS[instr_type]: name for instr_type, name in OFFSET_NAMES.items()}
+
+
+def locate(parsed, labels):
+    """Stage: assign an address to each statement and define labels.
+
+    Yields (line number, statement) for everything that occupies memory or
+    moves the current offset; label definitions are consumed here.
+    """
+    current_offset = PROCESSOR_START_ADDR
+    for line_no, statement in parsed:
+        if statement.type == "label":
+            labels.define(statement.label, current_offset)
+            continue
+        if statement.type == "directive" and statement.subtype == "seek":
+            current_offset = statement.seek
+            continue
+        if statement.type == "directive" and statement.subtype == "align":
+            aligned = align_offset(current_offset, statement.align)
+            statement.size = aligned - current_offset
+            statement.bytes = statement.fill * statement.size
+        if statement.type == "instruction":
+            statement.address = current_offset
+        yield current_offset, statement
+        current_offset += statement.size
+
+
+def emit(located, image, labels):
+    """Stage: write each located statement's bytes straight into the image."""
+    # one flag per byte of memory holding a branch that is waiting for its
+    # offset; only writes below the highest address written so far can land
+    # on one
+    branch_bytes = bytearray(1 << 16)
+    written_end = 0
+    for address, statement in located:
+        is_branch = False
+        if statement.type == "instruction":
+            branch_dest = statement.branch_dest
+            if branch_dest is not None and branch_dest.type == "LABEL":
+                # encode with a zero offset now, patch the offset field later
+                labels.reference(address, branch_dest.dest, statement.instr_type)
+                branch_dest.dest = address
+                is_branch = True
+            data = eval_int_fns.encode_statement(statement)
+        else:
+            data = statement.bytes
+        end = address + len(data)
+        if address < written_end:
+            overwritten = branch_bytes.find(1, address, end)
+            if overwritten != -1:
+                raise SyntaxError(
+                    "A .seek writes over $%04X, part of a label branch that --stream "
+                    "cannot patch afterwards" % overwritten
+                )
+        image.write_at(address, data)
+        written_end = max(written_end, end)
+        if is_branch:
+            branch_bytes[address] = branch_bytes[address + 1] = 1
+
+
+def resolve_fixups(image, labels):
+    """Patch every recorded branch with the offset to its now-known target.
+
+    All duplicate and undefined labels are reported together.
+    """
+    labels.check()
+    label_addresses = labels.addresses
+    fixups = labels.fixups
+    memory = image.memory
+    for address, label_id, offset_bits in zip(fixups.sites, fixups.label_ids, fixups.offset_bits):
+        offset = label_addresses[label_id] - address
+        assert offset % 2 == 0
+        word = memory[address] | (memory[address + 1] << 8)
+        word |= eval_int_fns.check_int(offset // 2, offset_bits, OFFSET_NAMES_BY_BITS[offset_bits])
+        memory[address] = word & 0xFF
+        memory[address + 1] = word >> 8
+
+
+def assemble_stream(lines, include_dir=None):
+    """Assemble an iterable of source lines (e.g. an open file) into a WheelImage.
+
+    Peak memory depends on the number of labels and branches, never on the
+    number of statements, since no statement outlives its own line.
+    """
+    image = WheelImage()
+    labels = SymbolTable()
+    emit(locate(parse.parse_lines(lines, include_dir), labels), image, labels)
+    resolve_fixups(image, labels)
+    return image
+
+
+def assemble_stream_file(in_path):
+    with open(in_path, "r") as infile:
+        return assemble_stream(infile, os.path.dirname(os.path.abspath(in_path)))
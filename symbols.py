@@ -0,0 +1,111 @@
+from array import array
+
+# Symbol table shared by the assembler passes. Label names are interned to
+# small integer IDs as soon as they are seen, whether defined or referenced,
+# and every label branch is recorded as a fixup against its label's ID. Once
+# all labels have addresses, resolution is a single sweep over the fixups,
+# and it can be repeated cheaply after the addresses change.
+
+# width of the signed word-offset field, by instruction type
+OFFSET_BITS = {
+    "jcc": 8,
+    "jump_call": 11,
+}
+
+# what the offset field is called in range errors, as eval_int_fns names it
+OFFSET_NAMES = {
+    "jcc": "Branch offset",
+    "jump_call": "Jump offset",
+}
+
+
+def fits(offset, bits):
+    words = offset >> 1
+    return -(1 << (bits - 1)) <= words < (1 << (bits - 1))
+
+
+def out_of_range(statements, symbols):
+    """Return the fixup numbers whose branch cannot reach its label as is.
+
+    Expects each branch statement's address to have been set by pass 1.
+    """
+    label_addresses = symbols.addresses
+    fixups = symbols.fixups
+    return [
+        i
+        for i, (site, label_id, offset_bits) in enumerate(
+            zip(fixups.sites, fixups.label_ids, fixups.offset_bits)
+        )
+        if not fits(label_addresses[label_id] - statements[site].address, offset_bits)
+    ]
+
+
+class FixupList:
+    """Pending label branches, stored column-wise in typed arrays.
+
+    site is whatever locates the branch for the pass that patches it: a
+    statement index in the normal pipeline, an address when streaming.
+    """
+
+    def __init__(self):
+        self.sites = array("L")
+        self.label_ids = array("L")
+        self.offset_bits = array("B")
+
+    def __len__(self):
+        return len(self.sites)
+
+    def add(self, site, label_id, offset_bits):
+        self.sites.append(site)
+        self.label_ids.append(label_id)
+        self.offset_bits.append(offset_bits)
+
+
+class SymbolTable:
+    """Label names interned to small integer IDs, with an address per ID.
+
+    Duplicate and undefined labels are not raised as they are found; check()
+    reports all of them together once the whole source has been seen.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        # address per label ID, -1 while undefined
+        self.addresses = array("l")
+        self.duplicates = []
+        self.fixups = FixupList()
+
+    def intern(self, name):
+        label_id = self.ids.get(name)
+        if label_id is None:
+            label_id = self.ids[name] = len(self.addresses)
+            self.addresses.append(-1)
+        return label_id
+
+    def define(self, name, address):
+        label_id = self.intern(name)
+        if self.addresses[label_id] != -1:
+            self.duplicates.append(name)
+        else:
+            self.addresses[label_id] = address
+
+    def reference(self, site, name, instr_type):
+        """Record a branch at site that needs the address of label name."""
+        self.fixups.add(site, self.intern(name), OFFSET_BITS[instr_type])
+
+    def undefined(self):
+        addresses = self.addresses
+        return [name for name, label_id in self.ids.items() if addresses[label_id] == -1]
+
+    def check(self):
+        problems = []
+        if self.duplicates:
+            problems.append("Duplicate label(s): %s" % ", ".join(self.duplicates))
+        undefined = self.undefined()
+        if undefined:
+            problems.append("Undefined label(s): %s" % ", ".join(undefined))
+        if problems:
+            raise SyntaxError("; ".join(problems))
+
+    def as_dict(self):
+        return {name: self.addresses[label_id] for name, label_id in self.ids.items()}
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+import batch
+import cheesegrater
+from wheel import WheelImage
+
+
+@pytest.fixture
+def sources(tmp_path):
+    paths = []
+    for name, source in (("a", "MOVL %ax, #1\nHALT"), ("b", "MOVL %bx, #2\nMOVH %bx, #0\nHALT")):
+        path = tmp_path / (name + ".sws")
+        path.write_text(source)
+        paths.append(str(path))
+    return paths
+
+
+def jobs_for(paths, extension=".wheel"):
+    return [(path, batch.output_path_for(path, extension=extension)) for path in paths]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_matches_single_file_builds(sources, workers):
+    results = batch.run_batch(jobs_for(sources), workers)
+    assert [result.error for result in results] == [None, None]
+    for path, result in zip(sources, results):
+        assert WheelImage.read(result.out_path).memory == cheesegrater.assemble_file(path).memory
+
+
+def test_options_apply_to_every_job(sources):
+    options = batch.BatchOptions(optimize=True, sparse=True)
+    results = batch.run_batch(jobs_for(sources), 1, options)
+    for path, result in zip(sources, results):
+        expected = cheesegrater.assemble_file(path, optimize=True).to_sparse_bytes()
+        with open(result.out_path, "rb") as wheel_file:
+            assert wheel_file.read() == expected
+
+
+def test_object_jobs(sources):
+    results = batch.run_batch(jobs_for(sources, ".obj"), 1, batch.BatchOptions(object_file=True))
+    assert all(result.error is None and os.path.exists(result.out_path) for result in results)
+
+
+def test_failures_do_not_stop_the_batch(sources, tmp_path):
+    bad = tmp_path / "bad.sws"
+    bad.write_text("FOO %ax")
+    paths = [str(bad)] + sources + [str(tmp_path / "missing.sws")]
+    results = batch.run_batch(jobs_for(paths), 1)
+    assert [result.error is None for result in results] == [False, True, True, False]
+    assert "Unknown instruction" in results[0].error
+
+
+def test_internal_errors_are_recorded(sources, monkeypatch):
+    def broken(*args):
+        raise KeyError("bug")
+
+    monkeypatch.setattr(cheesegrater, "assemble_file", broken)
+    results = batch.run_batch(jobs_for(sources), 1)
+    assert all(result.error.startswith("Internal error") for result in results)
+
+
+def test_read_manifest(tmp_path):
+    manifest = tmp_path / "build.txt"
+    manifest.write_text("# comment\n\na.sws\nb.sws out/b.bin\n")
+    assert batch.read_manifest(str(manifest), str(tmp_path / "wheels")) == [
+        (str(tmp_path / "a.sws"), str(tmp_path / "wheels" / "a.wheel")),
+        (str(tmp_path / "b.sws"), str(tmp_path / "out" / "b.bin")),
+    ]
+
+
+@pytest.mark.parametrize("option", [["--cache", "x.cache"], ["--parse-jobs", "2"], ["--stats"]])
+def test_cli_rejects_options_batch_mode_cannot_honour(option, sources):
+    with pytest.raises(SystemExit):
+        cheesegrater.main(["--batch"] + option + sources)
@@ -0,0 +1,50 @@
+import pickle
+
+import pytest
+
+import cache
+import cheesegrater
+import disasm
+
+
+def test_second_run_reuses_the_cache(tmp_path, sample_source):
+    path = str(tmp_path / "build.cache")
+    first = cache.AssemblyCache(path)
+    expected = cheesegrater.assemble(sample_source, cache=first).memory
+    first.save()
+    second = cache.AssemblyCache(path)
+    assert cheesegrater.assemble(sample_source, cache=second).memory == expected
+    assert second.hit_rates()["lines"]["misses"] == 0
+
+
+def test_other_assembler_versions_are_ignored(tmp_path):
+    path = str(tmp_path / "build.cache")
+    first = cache.AssemblyCache(path)
+    cheesegrater.assemble("NOP", cache=first)
+    first.save()
+    with open(path, "rb") as cache_file:
+        contents = pickle.load(cache_file)
+    contents["version"] = "older"
+    cache.dump_atomically(path, contents)
+    assert len(cache.AssemblyCache(path).statements) == 0
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [b"", b"not a pickle", pickle.dumps([1, 2, 3]), pickle.dumps("version"), pickle.dumps({"version": None})],
+)
+def test_corrupt_or_foreign_files_are_a_miss(tmp_path, contents):
+    path = tmp_path / "foreign"
+    path.write_bytes(contents)
+    assert cache.load_versioned(str(path), cache.assembler_version()) is None
+    assert len(cache.AssemblyCache(str(path)).statements) == 0
+
+
+def test_foreign_decode_table_is_rebuilt(tmp_path, monkeypatch):
+    path = tmp_path / "decode_table.pickle"
+    path.write_bytes(pickle.dumps(["not", "a", "dict"]))
+    monkeypatch.setattr(disasm, "table", None)
+    assert len(disasm.load_table(str(path))) == 1 << 16
+    # and the rebuilt table replaced the foreign file
+    monkeypatch.setattr(disasm, "table", None)
+    assert cache.load_versioned(str(path), cache.source_digest(disasm.TABLE_MODULES)) is not None
@@ -0,0 +1,52 @@
+import pytest
+
+import bench
+import cheesegrater
+import chunked
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # the test programs are far below the size that is normally split
+    monkeypatch.setattr(chunked, "MIN_CHUNK_LINES", 4)
+
+
+@pytest.mark.parametrize("jobs", [1, 2, 3])
+def test_matches_default_build(small_chunks, sample_source, jobs):
+    expected = cheesegrater.assemble(sample_source).memory
+    assert cheesegrater.assemble(sample_source, parse_jobs=jobs).memory == expected
+
+
+def test_labels_and_branches_across_chunks(small_chunks):
+    source = bench.generate_program(400)
+    expected = cheesegrater.assemble(source).memory
+    assert cheesegrater.assemble(source, parse_jobs=4).memory == expected
+
+
+def test_seek_and_align_in_later_chunks(small_chunks):
+    source = "NOP\n" * 6 + ".seek $F101\n.byte $01\n.align #8\nend:\n" + "NOP\n" * 6 + "JMP end\n"
+    expected = cheesegrater.assemble(source).memory
+    assert cheesegrater.assemble(source, parse_jobs=3).memory == expected
+
+
+@pytest.mark.parametrize("count", [1, 2, 5, 50])
+def test_split_source_keeps_every_line(count):
+    source = "".join("NOP ; %d\n" % i for i in range(20))
+    chunks = chunked.split_source(source, count)
+    assert "".join(text for text, _ in chunks) == source
+    assert [first_line for _, first_line in chunks] == [
+        1 + sum(text.count("\n") for text, _ in chunks[:i]) for i in range(len(chunks))
+    ]
+
+
+def test_line_numbers_in_errors_count_from_the_whole_source(small_chunks):
+    source = "NOP\n" * 10 + "FOO\n"
+    with pytest.raises(SyntaxError, match="Line 11:"):
+        cheesegrater.assemble(source, parse_jobs=3)
+
+
+def test_negative_job_count_is_rejected():
+    with pytest.raises(ValueError):
+        cheesegrater.assemble("NOP", parse_jobs=-1)
+    with pytest.raises(SystemExit):
+        cheesegrater.main(["--parse-jobs", "-1", "in.sws", "out.wheel"])
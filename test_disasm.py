@@ -0,0 +1,30 @@
+import cheesegrater
+import disasm
+
+
+def reassemble(image, decode_table):
+    return cheesegrater.assemble("\n".join(disasm.disassemble(image, decode_table)))
+
+
+def test_decode_table_round_trips(decode_table):
+    assert disasm.check_round_trip(decode_table) == []
+
+
+def test_disassembly_reassembles_to_image(decode_table, sample_source):
+    image = cheesegrater.assemble(sample_source)
+    assert reassemble(image, decode_table).memory == image.memory
+
+
+def test_invalid_words_are_kept_as_data(decode_table):
+    image = cheesegrater.assemble(".word $0001\n.word $12B0\nHALT")
+    lines = disasm.disassemble(image, decode_table)
+    assert lines[:3] == [".seek $F000", "  .word $0001", "  .word $12B0 ; AND %ax, $0000"]
+    assert reassemble(image, decode_table).memory == image.memory
+
+
+def test_out_of_image_branch_is_kept_as_data(decode_table):
+    # a branch into memory nothing was written to has no label to name
+    image = cheesegrater.assemble("J.eq far\n.seek $F020\nfar:")
+    lines = disasm.disassemble(image, decode_table)
+    assert lines[1].startswith("  .word $")
+    assert reassemble(image, decode_table).memory == image.memory
@@ -0,0 +1,34 @@
+import pytest
+
+import cheesegrater
+import disasm
+
+
+@pytest.fixture
+def bitarray_encoder():
+    pytest.importorskip("bitstring")
+    return cheesegrater.encoder_backend("bitarray")
+
+
+def test_bitarray_matches_int_on_every_word(decode_table, bitarray_encoder):
+    assert disasm.check_round_trip(decode_table, bitarray_encoder) == []
+
+
+@pytest.mark.parametrize("encoder", ["bitarray", "check"])
+def test_encoders_build_the_same_image(sample_source, encoder):
+    pytest.importorskip("bitstring")
+    expected = cheesegrater.assemble(sample_source).memory
+    assert cheesegrater.assemble(sample_source, encoder).memory == expected
+
+
+def test_check_encoder_reports_a_mismatch(monkeypatch, bitarray_encoder):
+    import eval_fns
+
+    monkeypatch.setattr(eval_fns, "encode_statement", lambda statement: b"\xff\xff")
+    with pytest.raises(AssertionError, match="Encoder mismatch"):
+        cheesegrater.assemble("NOP", "check")
+
+
+def test_range_errors_are_value_errors():
+    with pytest.raises(ValueError, match="Memory offset"):
+        cheesegrater.assemble("LOADW %ax, [%sp, #100]")
@@ -0,0 +1,41 @@
+import pytest
+
+import bench
+import cheesegrater
+
+pytest.importorskip("numpy")
+
+
+def assert_same_image(source):
+    expected = cheesegrater.assemble(source).memory
+    assert cheesegrater.assemble(source, "numpy").memory == expected
+
+
+def test_matches_default_build(sample_source):
+    assert_same_image(sample_source)
+
+
+def test_matches_default_build_on_a_generated_program():
+    assert_same_image(bench.generate_program(5000))
+
+
+def test_seeking_back_over_code_matches_default_build():
+    assert_same_image("MOVL %ax, #1\nHALT\n.seek $F000\nMOVL %bx, #2")
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "ADD %ax, #40",
+        "AND %ax, $1234",
+        "LOADW %ax, [%sp, #100]",
+        "NOP\nJ.eq far\n.seek $F200\nfar:",
+    ],
+)
+def test_errors_match_default_build(source):
+    with pytest.raises((SyntaxError, ValueError)) as expected:
+        cheesegrater.assemble(source, relax=False)
+    with pytest.raises((SyntaxError, ValueError)) as raised:
+        cheesegrater.assemble(source, "numpy", relax=False)
+    assert type(raised.value) is type(expected.value)
+    assert str(raised.value) == str(expected.value)
@@ -0,0 +1,88 @@
+import pytest
+
+import cheesegrater
+import link
+import objfile
+
+MAIN_MODULE = """\
+  MOVL %ax, #3
+  CALL double
+  STOREW %ax, [%bx], #0
+  J.ne done
+  NOP
+done:
+  HALT
+"""
+
+LIB_MODULE = """\
+.align #4
+double:
+  ADD %ax, %ax
+  MOVL %bx, $69
+  MOVH %bx, $69
+  CMP %ax, #0
+  RET
+.seek $F100
+table:
+  .word $1234
+  JMP double
+"""
+
+
+def link_sources(*sources):
+    return link.link([objfile.assemble_object(source, name="m%d.sws" % i) for i, source in enumerate(sources)])
+
+
+def test_matches_single_file_build():
+    whole = cheesegrater.assemble(MAIN_MODULE + LIB_MODULE)
+    assert link_sources(MAIN_MODULE, LIB_MODULE).memory == whole.memory
+
+
+def test_object_files_round_trip(tmp_path):
+    (tmp_path / "main.sws").write_text(MAIN_MODULE)
+    (tmp_path / "lib.sws").write_text(LIB_MODULE)
+    paths = [str(tmp_path / "main.sws"), str(tmp_path / "lib.sws")]
+    obj_paths, results = link.build_objects(paths, workers=1)
+    assert [result.error for result in results] == [None, None]
+    image = link.link([objfile.read_object(path) for path in obj_paths])
+    assert image.memory == cheesegrater.assemble(MAIN_MODULE + LIB_MODULE).memory
+
+
+def test_only_changed_modules_are_reassembled(tmp_path):
+    main_path = tmp_path / "main.sws"
+    lib_path = tmp_path / "lib.sws"
+    main_path.write_text(MAIN_MODULE)
+    lib_path.write_text(LIB_MODULE)
+    paths = [str(main_path), str(lib_path)]
+    link.build_objects(paths, workers=1)
+    assert link.build_objects(paths, workers=1)[1] == []
+    lib_path.write_text(LIB_MODULE + "  NOP\n")
+    _, results = link.build_objects(paths, workers=1)
+    assert [result.in_path for result in results] == [str(lib_path)]
+
+
+@pytest.mark.parametrize(
+    "sources, error, message",
+    [
+        (["a:\nHALT", "a:\nHALT"], SyntaxError, "Duplicate label\\(s\\): a"),
+        (["JMP b"], SyntaxError, "Undefined label\\(s\\): b"),
+        (["J.eq odd\nHALT", '.ascii "x"\nodd:\nHALT'], ValueError, "Branch offset 5 is odd"),
+        (["J.eq far", ".seek $F200\nfar:\nHALT"], ValueError, "Branch offset"),
+        (["JMP far", ".seek $1000\nfar:\nHALT"], ValueError, "Jump offset"),
+    ],
+)
+def test_link_errors(sources, error, message):
+    with pytest.raises(error, match=message):
+        link_sources(*sources)
+
+
+def test_objects_reject_vector_encoders():
+    with pytest.raises(ValueError):
+        objfile.assemble_object("HALT", "numpy")
+
+
+def test_read_object_rejects_other_files(tmp_path):
+    path = tmp_path / "not.obj"
+    path.write_text("[1, 2]")
+    with pytest.raises(ValueError, match="not an object file"):
+        objfile.read_object(str(path))
@@ -0,0 +1,53 @@
+import pytest
+
+import cheesegrater
+import memo
+
+
+def test_matches_default_build(sample_source):
+    line_memo = memo.Memo()
+    expected = cheesegrater.assemble(sample_source).memory
+    for _ in range(2):
+        assert cheesegrater.assemble(sample_source, cache=line_memo).memory == expected
+    assert line_memo.hit_rates()["lines"]["hits"] > 0
+
+
+def test_repeated_lines_and_instructions_hit():
+    line_memo = memo.Memo()
+    source = "loop:\n" + "ADD %ax, #1\n  ADD   %ax,  #1\n" * 3 + "J.ne loop\nJ.ne loop\n"
+    image = cheesegrater.assemble(source, cache=line_memo)
+    assert image.memory == cheesegrater.assemble(source).memory
+    rates = line_memo.hit_rates()
+    assert (rates["lines"]["hits"], rates["lines"]["misses"]) == (6, 3)
+    assert rates["encodings"]["misses"] == 2
+
+
+def test_pseudo_instruction_expansions_are_memoised():
+    line_memo = memo.Memo()
+    source = "LDI %ax, $1234\n" * 2 + "ORI %bx, $1234, %cx\n" * 2
+    assert cheesegrater.assemble(source, cache=line_memo).memory == cheesegrater.assemble(source).memory
+    assert line_memo.hit_rates()["lines"]["hits"] == 2
+
+
+def test_encodings_are_kept_per_encoder(monkeypatch):
+    pytest.importorskip("bitstring")
+    import eval_fns
+
+    line_memo = memo.Memo()
+    cheesegrater.assemble("NOP", cache=line_memo)
+    # a warm memo must not let --encoder=check skip its cross-check
+    monkeypatch.setattr(eval_fns, "encode_statement", lambda statement: b"\xff\xff")
+    with pytest.raises(AssertionError, match="Encoder mismatch"):
+        cheesegrater.assemble("NOP", "check", line_memo)
+
+
+def test_entries_are_bounded():
+    line_memo = memo.Memo(max_entries=4)
+    cheesegrater.assemble("".join("ADD %%ax, #%d\n" % i for i in range(10)), cache=line_memo)
+    assert len(line_memo.statements) == 4
+    assert len(line_memo.encodings) == 4
+
+
+def test_normalize_keeps_whitespace_in_strings():
+    assert memo.normalize("  ADD   %ax,\t#1 ") == "ADD %ax, #1"
+    assert memo.normalize('  .ascii "a  b" ') == '.ascii "a  b"'
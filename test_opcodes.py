@@ -0,0 +1,37 @@
+import pytest
+
+import eval_int_fns
+import opcodes
+import parse
+import peephole
+
+
+def test_every_grammar_has_a_parser():
+    # pseudo-instructions are expanded by pseudo.py instead
+    grammars = {entry.grammar for entry in opcodes.OPCODES.values()} - {"pseudo"}
+    assert grammars <= set(parse.OPERAND_PARSERS)
+
+
+def test_every_encoder_family_exists():
+    families = {entry.instr_type for entry in opcodes.OPCODES.values()} - {None}
+    assert families <= set(eval_int_fns.INSTR_TYPE_TO_EVAL_FN)
+
+
+def test_block_ending_instructions_come_from_the_registry():
+    assert peephole.BLOCK_ENDING == {"HALT", "RET", "J", "JMP", "CALL"}
+
+
+@pytest.mark.parametrize(
+    "line, message",
+    [
+        ("FOO %ax", "Unknown instruction 'FOO'"),
+        ("IRET", "Unknown instruction 'IRET'"),
+        ("MOV %zz, %ax", "Unknown register %zz"),
+        ("J.xx loop", "Unknown condition code 'xx'"),
+        ("MOVL %ax, %bx", ""),
+        ("HALT %ax", ""),
+    ],
+)
+def test_parse_errors(line, message):
+    with pytest.raises(SyntaxError, match="Line 1: " + message):
+        list(parse.parse_source(line))
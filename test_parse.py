@@ -0,0 +1,62 @@
+import pytest
+
+import cheesegrater
+
+
+def data_at(source, address=0x1000, length=8, **options):
+    image = cheesegrater.assemble(".seek $%04X\n%s" % (address, source), **options)
+    return bytes(image.memory[address : address + length])
+
+
+@pytest.mark.parametrize(
+    "source, data",
+    [
+        (".byte $01, #2, $1FF", b"\x01\x02\xff"),
+        (".byte #-1", b"\xff"),
+        (".word $1234, #1", b"\x34\x12\x01\x00"),
+        (".word $12345", b"\x45\x23"),
+        ('.ascii "Hi!"', b"Hi!"),
+        ('.asciiz "Hi"', b"Hi\x00"),
+        ('.byte $01\n.align #4 $EE\n.byte $02', b"\x01\xee\xee\xee\x02"),
+    ],
+)
+def test_data_directives(source, data):
+    assert data_at(source).startswith(data)
+
+
+def test_incbin_inserts_the_file(tmp_path):
+    (tmp_path / "blob.bin").write_bytes(bytes(range(6)))
+    source = '.incbin "blob.bin"\n.byte $FF'
+    assert data_at(source, include_dir=str(tmp_path)) == bytes(range(6)) + b"\xff\x00"
+
+
+def test_empty_incbin_takes_no_space(tmp_path):
+    (tmp_path / "empty.bin").write_bytes(b"")
+    source = '.incbin "empty.bin"\n.byte $FF'
+    assert data_at(source, include_dir=str(tmp_path), length=2) == b"\xff\x00"
+
+
+def test_incbin_is_relative_to_the_source_file(tmp_path):
+    (tmp_path / "blob.bin").write_bytes(b"\x07")
+    (tmp_path / "prog.sws").write_text('.seek $1000\n.incbin "blob.bin"\n')
+    assert cheesegrater.assemble_file(str(tmp_path / "prog.sws")).memory[0x1000] == 7
+
+
+@pytest.mark.parametrize(
+    "source, error",
+    [
+        (".byte", "Expected at least one numerical literal following a .byte"),
+        (".word", "Expected at least one numerical literal following a .word"),
+        (".byte $01,", "comma-separated list of numerical literals following a .byte"),
+        (".word $01 $02", "comma-separated list of numerical literals following a .word"),
+        (".byte $01, %ax", "comma-separated list of numerical literals following a .byte"),
+        (".ascii $41", "Expected a string literal following a .ascii"),
+        (".asciiz", "Expected a string literal following a .asciiz"),
+        (".incbin blob", "Expected a file path string following a .incbin"),
+        ('.incbin "/nonexistent/blob.bin"', "Cannot read .incbin file"),
+        (".frob", "Unknown directive"),
+    ],
+)
+def test_directive_errors(source, error):
+    with pytest.raises(SyntaxError, match=error):
+        cheesegrater.assemble(source)
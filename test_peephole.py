@@ -0,0 +1,63 @@
+import pytest
+
+import cheesegrater
+import parse
+import peephole
+import sim
+
+
+def optimized(source):
+    return [str(statement) for _, statement in peephole.optimize(parse.parse_source(source))]
+
+
+def unchanged(source):
+    return [str(statement) for _, statement in parse.parse_source(source)]
+
+
+@pytest.mark.parametrize(
+    "source, kept",
+    [
+        # the MOVH goes whichever side of the MOVL it is on
+        ("XOR %cx, %cx\nMOVL %cx, #4\nMOVH %cx, #0", "XOR %cx, %cx\nMOVL %cx, #4"),
+        ("XOR %cx, %cx\nMOVH %cx, #0\nMOVL %cx, #4", "XOR %cx, %cx\nMOVL %cx, #4"),
+        ("MOVH %ax, #0\nMOVL %ax, #1\nMOVH %ax, #0", "MOVH %ax, #0\nMOVL %ax, #1"),
+        ("SUB %ax, %ax\nMOVH %ax, #0", "SUB %ax, %ax"),
+        ("LOADB %ax, [%sp, #0]\nMOVH %ax, #0", "LOADB %ax, [%sp, #0]"),
+        ("AND %ax, $00FF\nMOVH %ax, #0", "AND %ax, $00FF"),
+        ("MOV %ax, %ax\nHALT", "HALT"),
+        ("CMP %ax, #1\nCMP %ax, #2\nJ.eq x\nNOP\nx:", "CMP %ax, #2\nJ.eq x\nNOP\nx:"),
+        ("ADD %ax, #0\nCMP %bx, #1\nHALT", "CMP %bx, #1\nHALT"),
+        ("JMP next\nnext:\nHALT", "next:\nHALT"),
+    ],
+)
+def test_patterns(source, kept):
+    assert optimized(source) == unchanged(kept)
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        # the high byte is unknown at the start of a block
+        "MOVL %cx, #4\nMOVH %cx, #0",
+        "x:\nMOVL %cx, #4\nMOVH %cx, #0",
+        # anything else writing the register forgets what was known
+        "XOR %cx, %cx\nADD %cx, #1\nMOVH %cx, #0",
+        "XOR %cx, %cx\nMOVH %cx, #1\nMOVH %cx, #0",
+        "XOR %cx, %cx\nLOADW %cx, [%sp, #0]\nMOVH %cx, #0",
+        "XOR %cx, %cx\nJ.eq x\nMOVH %cx, #0\nx:\nHALT",
+        "AND %ax, $FF00\nMOVH %ax, #0",
+        # flags read later, or live at the end of the block
+        "ADD %ax, #0\nADC %bx, %cx",
+        "CMP %ax, #1\nJ.eq x\nNOP\nx:",
+        "TEST %ax, %bx\nx:",
+    ],
+)
+def test_kept(source):
+    assert optimized(source) == unchanged(source)
+
+
+def test_samples_behave_the_same(sample_source, sample_output):
+    machine = sim.Machine(cheesegrater.assemble(sample_source, optimize=True).memory)
+    machine.run(100_000)
+    assert machine.halted
+    assert machine.outputs == sample_output
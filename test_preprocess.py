@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+import cheesegrater
+import preprocess
+
+PUSH = ".macro PUSH reg\nSTOREW reg, [%sp, #-2]!\n.endm\n"
+
+
+def assemble_in(directory, source):
+    return cheesegrater.assemble(source, include_dir=str(directory)).memory
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+def test_include_is_relative_to_the_including_file(tmp_path):
+    write(tmp_path / "lib" / "outer.sws", '.include "inner.sws"\nMOVL %bx, $02\n')
+    write(tmp_path / "lib" / "inner.sws", "MOVL %ax, $01\n")
+    memory = assemble_in(tmp_path, '.include "lib/outer.sws"\nHALT')
+    assert memory == assemble_in(tmp_path, "MOVL %ax, $01\nMOVL %bx, $02\nHALT")
+
+
+def test_macro_arguments_can_be_whole_operands(tmp_path):
+    source = ".macro LOAD dst, src\nLOADW dst, src\n.endm\nLOAD %ax, [%sp, #2]\nHALT"
+    assert assemble_in(tmp_path, source) == assemble_in(tmp_path, "LOADW %ax, [%sp, #2]\nHALT")
+
+
+def test_macro_labels_are_unique_per_expansion(tmp_path):
+    source = ".macro WAIT reg\nspin:\nSUB reg, #1\nJ.NE spin\n.endm\nWAIT %ax\nWAIT %bx\nHALT"
+    expected = "s0:\nSUB %ax, #1\nJ.NE s0\ns1:\nSUB %bx, #1\nJ.NE s1\nHALT"
+    assert assemble_in(tmp_path, source) == assemble_in(tmp_path, expected)
+
+
+def test_included_macros_are_visible_after_the_include(tmp_path):
+    write(tmp_path / "push.sws", PUSH)
+    memory = assemble_in(tmp_path, '.include "push.sws"\nPUSH %ax\nHALT')
+    assert memory == assemble_in(tmp_path, "STOREW %ax, [%sp, #-2]!\nHALT")
+
+
+def test_included_file_does_not_see_the_includers_macros(tmp_path):
+    write(tmp_path / "uses.sws", "PUSH %ax\n")
+    with pytest.raises(SyntaxError, match="uses.sws"):
+        assemble_in(tmp_path, PUSH + '.include "uses.sws"\nHALT')
+
+
+@pytest.mark.parametrize(
+    "source, error",
+    [
+        (PUSH + "PUSH %ax, %bx", "Macro PUSH takes 1 argument"),
+        (".macro LOOP\nLOOP\n.endm\nLOOP", "Macro LOOP invokes itself"),
+        (".macro A\n.macro B\n.endm\n.endm", "cannot be defined inside another"),
+        (".macro A\nNOP", "Macro A has no matching .endm"),
+        (".endm", ".endm without a matching .macro"),
+        (".macro A x, x\n.endm", "repeated parameter name"),
+        (".macro A x y\n.endm", "comma-separated list of parameter names"),
+        ('.include "missing.sws"', "Cannot read .include file"),
+        (".include missing", "Expected a file path string"),
+    ],
+)
+def test_errors(tmp_path, source, error):
+    with pytest.raises(SyntaxError, match=error):
+        assemble_in(tmp_path, source)
+
+
+def test_include_cycle_is_an_error(tmp_path):
+    write(tmp_path / "a.sws", '.include "b.sws"\n')
+    write(tmp_path / "b.sws", '.include "a.sws"\n')
+    with pytest.raises(SyntaxError, match="includes itself"):
+        assemble_in(tmp_path, '.include "a.sws"')
+
+
+def test_incbin_is_relative_to_the_included_file(tmp_path):
+    write(tmp_path / "data" / "blob.sws", '.incbin "blob.bin"\n')
+    (tmp_path / "data" / "blob.bin").write_bytes(b"\x01\x02\x03")
+    memory = assemble_in(tmp_path, '.seek $1000\n.include "data/blob.sws"')
+    assert memory[0x1000:0x1004] == b"\x01\x02\x03\x00"
+
+
+def test_changed_include_is_parsed_again(tmp_path):
+    inner = write(tmp_path / "inner.sws", "MOVL %ax, $01\n")
+    first = assemble_in(tmp_path, '.include "inner.sws"')
+    cached = preprocess.include_cache[str(inner)]
+    # touching the file without changing it keeps the cached parse
+    os.utime(inner, ns=(0, 0))
+    assert assemble_in(tmp_path, '.include "inner.sws"') == first
+    assert preprocess.include_cache[str(inner)] is cached
+    inner.write_text("MOVL %ax, $02\n")
+    assert assemble_in(tmp_path, '.include "inner.sws"') == assemble_in(tmp_path, "MOVL %ax, $02")
+
+
+def test_changed_nested_include_is_parsed_again(tmp_path):
+    write(tmp_path / "outer.sws", '.include "inner.sws"\n')
+    inner = write(tmp_path / "inner.sws", "MOVL %ax, $01\n")
+    assemble_in(tmp_path, '.include "outer.sws"')
+    inner.write_text("MOVL %ax, $02\nNOP\n")
+    expected = assemble_in(tmp_path, "MOVL %ax, $02\nNOP")
+    assert assemble_in(tmp_path, '.include "outer.sws"') == expected
@@ -0,0 +1,67 @@
+import functools
+import operator
+
+import pytest
+
+import cheesegrater
+import pseudo
+import sim
+
+COMBINE = {"AND": operator.and_, "OR": operator.or_, "XOR": operator.xor}
+
+
+def run(source, **options):
+    machine = sim.Machine(cheesegrater.assemble(source + "\nHALT", **options).memory)
+    machine.run(1000)
+    assert machine.halted
+    return machine.regs
+
+
+def opcodes(opcode, value, scratch=None):
+    return [statement.opcode for statement in pseudo.expand(opcode, "AX", value, scratch)]
+
+
+def test_ldi_expansions():
+    assert opcodes("LDI", 0) == ["XOR"]
+    assert opcodes("LDI", 0x1234) == ["MOVH", "MOVL"]
+    assert opcodes("LDI", -1) == ["MOVH", "MOVL"]
+
+
+@pytest.mark.parametrize("opcode", ["AND", "OR", "XOR"])
+def test_mask_chains_reach_their_value(opcode):
+    for value, chain in pseudo.MASK_CHAINS[opcode].items():
+        assert 1 <= len(chain) <= pseudo.MAX_CHAIN
+        assert functools.reduce(COMBINE[opcode], chain) == value
+
+
+def test_chain_is_preferred_over_scratch():
+    assert opcodes("ANDI", 0x0011, "DX") == ["AND", "AND"]
+
+
+@pytest.mark.parametrize(
+    "opcode, value, scratch, error",
+    [
+        ("ORI", 0x1234, None, "name a scratch register"),
+        ("ORI", 0x1234, "AX", "scratch register other than its destination"),
+        ("LDI", 1, "DX", "LDI takes no scratch register"),
+        ("LDI", 0x10000, None, "does not fit in 16 bits"),
+        ("ANDI", -0x8001, None, "does not fit in 16 bits"),
+    ],
+)
+def test_errors(opcode, value, scratch, error):
+    with pytest.raises(SyntaxError, match=error):
+        pseudo.expand(opcode, "AX", value, scratch)
+
+
+@pytest.mark.parametrize("value", [0, 1, 0x00FF, 0x0100, 0x1234, 0xFFFF])
+@pytest.mark.parametrize("optimize", [False, True])
+def test_ldi_runs(value, optimize):
+    # %ax starts out dirty, so a dropped MOVH would show
+    assert run("MOVH %%ax, $AB\nMOVL %%ax, $CD\nLDI %%ax, #%d" % value, optimize=optimize)[0] == value
+
+
+@pytest.mark.parametrize("opcode", ["ANDI", "ORI", "XORI"])
+@pytest.mark.parametrize("value", [0x0011, 0x00FF, 0x1234, 0xFFF0])
+def test_alu_pseudo_ops_run(opcode, value):
+    regs = run("LDI %%ax, $5A5A\n%s %%ax, #%d, %%dx" % (opcode, value))
+    assert regs[0] == COMBINE[pseudo.PSEUDO_OPS[opcode]](0x5A5A, value)
@@ -0,0 +1,92 @@
+import pytest
+
+import cheesegrater
+import parse
+import sim
+
+# 200 words of padding: beyond J.cc's reach, within JMP's
+MEDIUM_GAP = "NOP\n" * 200
+# far beyond JMP's reach
+LONG_GAP = ".seek $1000\n"
+
+
+def relaxed(source, scratch=None):
+    statements, symbols = cheesegrater.build_statements(parse.parse_source(source))
+    statements = cheesegrater.resolve_labels(statements, symbols, True, scratch)
+    return statements, symbols
+
+
+def opcodes_of(statements, count):
+    return [statement.opcode for statement in statements if statement.type == "instruction"][:count]
+
+
+def run(source, scratch=None):
+    machine = sim.Machine(cheesegrater.assemble(source, scratch=scratch).memory)
+    machine.run(10_000)
+    assert machine.halted
+    return machine
+
+
+def test_in_range_branches_are_left_alone():
+    statements, _ = relaxed("J.eq end\nNOP\nend:\nHALT")
+    assert opcodes_of(statements, 3) == ["J", "NOP", "HALT"]
+
+
+def test_jcc_hops_over_a_jmp():
+    statements, _ = relaxed("J.eq far\n" + MEDIUM_GAP + "far:\nHALT")
+    assert opcodes_of(statements, 2) == ["J", "JMP"]
+    assert statements[0].condition_code == "NE"
+
+
+@pytest.mark.parametrize(
+    "branch, expected",
+    [
+        ("J.eq", ["J", "MOVH", "MOVL", "JMP"]),
+        ("JMP", ["MOVH", "MOVL", "JMP"]),
+        ("CALL", ["MOVH", "MOVL", "CALL"]),
+    ],
+)
+def test_far_branches_become_absolute_jumps(branch, expected):
+    statements, _ = relaxed("%s far\n%sfar:\nHALT" % (branch, LONG_GAP), "BP")
+    assert opcodes_of(statements, len(expected)) == expected
+
+
+def test_absolute_jmp_needs_a_scratch_register():
+    with pytest.raises(SyntaxError, match="--relax-scratch"):
+        relaxed("JMP far\n" + LONG_GAP + "far:\nHALT")
+    # CALL goes through %lr instead
+    relaxed("CALL far\n" + LONG_GAP + "far:\nHALT")
+
+
+def test_no_relax_reports_the_branch():
+    with pytest.raises(ValueError, match="Branch offset"):
+        cheesegrater.assemble("J.eq far\n" + MEDIUM_GAP + "far:\nHALT", relax=False)
+
+
+def test_fixups_index_into_the_relaxed_list():
+    source = "J.eq far\nJ.eq near\nnear:\n" + MEDIUM_GAP + "far:\nJMP near\nHALT"
+    statements, symbols = relaxed(source)
+    names = {label_id: name for name, label_id in symbols.ids.items()}
+    branches = [
+        (statements[site].opcode, names[label_id])
+        for site, label_id in zip(symbols.fixups.sites, symbols.fixups.label_ids)
+    ]
+    assert branches == [("JMP", "far"), ("J", "near"), ("JMP", "near")]
+
+
+def test_relaxation_can_push_other_branches_out_of_range():
+    # relaxing the second J.cc moves "far" out of the first one's reach
+    source = "J.ne far\nJ.eq farther\n" + "NOP\n" * 125 + "far:\n" + MEDIUM_GAP + "farther:\nHALT"
+    statements, _ = relaxed(source)
+    assert opcodes_of(statements, 4) == ["J", "JMP", "J", "JMP"]
+
+
+@pytest.mark.parametrize("taken, expected", [(0, [1]), (1, [2])])
+def test_relaxed_branches_run_correctly(taken, expected):
+    source = (
+        "MOVL %%ix, $69\nMOVH %%ix, $69\nMOVL %%ax, #%d\nCMP %%ax, #0\nJ.eq zero\nMOVL %%bx, #2\nJMP out\n"
+        % taken
+        + LONG_GAP
+        + "zero:\nMOVL %bx, #1\nout:\nSTOREW %bx, [%ix], #0\nHALT"
+    )
+    assert run(source, "BP").outputs == expected
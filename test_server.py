@@ -0,0 +1,107 @@
+import base64
+import json
+import socket
+import threading
+
+import pytest
+
+import cheesegrater
+import server
+from wheel import WheelImage
+
+
+@pytest.fixture
+def service():
+    service = server.AssemblerService(workers=1)
+    yield service
+    service.shutdown()
+
+
+def ask(service, *requests):
+    responses = []
+    futures = [service.submit(json.dumps(request), responses.append) for request in requests]
+    for future in futures:
+        future.result(timeout=10)
+    return responses
+
+
+def test_source_request_returns_the_image(sample_source):
+    response = server.assemble_request({"id": 3, "source": sample_source})
+    assert response["id"] == 3 and response["ok"] and response["seconds"] >= 0
+    assert base64.b64decode(response["wheel"]) == cheesegrater.assemble(sample_source).to_bytes()
+
+
+def test_path_request_writes_output(sample_path, tmp_path):
+    out_path = str(tmp_path / "out.wheel")
+    response = server.assemble_request({"path": sample_path, "output": out_path, "sparse": True})
+    assert response["ok"] and "wheel" not in response
+    assert WheelImage.read(out_path).memory == cheesegrater.assemble_file(sample_path).memory
+
+
+@pytest.mark.parametrize(
+    "request_, error",
+    [
+        ({}, "Request needs either a 'source' or a 'path'"),
+        ({"source": "HALT", "encoder": "abacus"}, "Unknown encoder abacus"),
+        ({"source": "HALT", "optimize": "yes"}, "'optimize' must be a boolean"),
+        ({"source": 7}, "'source' must be a string"),
+        ({"source": "HALT", "relax_scratch": "%zz"}, "zz"),
+        ({"path": "/nonexistent/prog.sws"}, "No such file"),
+        ({"source": "FROB %ax"}, "Line 1"),
+    ],
+)
+def test_bad_requests_are_reported(request_, error):
+    response = server.assemble_request(request_)
+    assert not response["ok"] and error in response["error"]
+    assert "seconds" in response
+
+
+def test_service_answers_every_request(service, sample_source):
+    responses = ask(
+        service,
+        {"id": 1, "op": "ping"},
+        {"id": 2, "op": "reboot"},
+        {"id": 3, "source": sample_source},
+        {"id": 4, "source": "FROB"},
+    )
+    by_id = {response["id"]: response for response in responses}
+    assert by_id[1]["ok"]
+    assert by_id[2] == {"id": 2, "ok": False, "error": "Unknown op reboot", "seconds": by_id[2]["seconds"]}
+    assert base64.b64decode(by_id[3]["wheel"]) == cheesegrater.assemble(sample_source).to_bytes()
+    assert not by_id[4]["ok"]
+    assert all("seconds" in response for response in responses)
+
+
+@pytest.mark.parametrize("line", ["{not json", "[1, 2]"])
+def test_malformed_lines_are_reported(service, line):
+    responses = []
+    service.submit(line, responses.append).result(timeout=10)
+    assert responses[0]["id"] is None and not responses[0]["ok"]
+    assert responses[0]["error"].startswith("Malformed request")
+
+
+def test_unix_socket(service, tmp_path):
+    path = str(tmp_path / "asm.sock")
+    unix_server = server.UnixServer(path, service)
+    thread = threading.Thread(target=unix_server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(path)
+            client.sendall(b'{"id": 1, "op": "ping"}\n{"id": 2, "source": "HALT"}\n')
+            client.shutdown(socket.SHUT_WR)
+            lines = client.makefile("r").read().splitlines()
+    finally:
+        unix_server.shutdown()
+        unix_server.server_close()
+    assert sorted(json.loads(line)["id"] for line in lines) == [1, 2]
+
+
+def test_worker_processes(sample_source):
+    service = server.AssemblerService(workers=2)
+    try:
+        responses = ask(service, {"id": 1, "source": sample_source}, {"id": 2, "source": sample_source})
+    finally:
+        service.shutdown()
+    expected = cheesegrater.assemble(sample_source).to_bytes()
+    assert [base64.b64decode(response["wheel"]) for response in responses] == [expected, expected]
@@ -0,0 +1,65 @@
+import cheesegrater
+import sim
+
+
+def run(source, max_steps=sim.DEFAULT_MAX_STEPS):
+    machine = sim.Machine(cheesegrater.assemble(source).memory)
+    machine.run(max_steps)
+    return machine
+
+
+def test_sample_matches_expected_output(sample_path, sample_output):
+    expect = ",".join(str(value) for value in sample_output)
+    assert sim.main([sample_path, "--expect", expect, "-q"]) == 0
+
+
+def test_wrong_expected_output_fails(sample_path, sample_output, capsys):
+    assert sim.main([sample_path, "--expect", "999", "-q"]) == 1
+    assert "expected output [999]" in capsys.readouterr().err
+
+
+def test_wheel_image_runs(sample_path, sample_output, tmp_path):
+    out_path = str(tmp_path / "out.wheel")
+    cheesegrater.assemble_file(sample_path).write(out_path)
+    machine = sim.load_machine(out_path)
+    machine.run()
+    assert machine.halted and machine.outputs == sample_output
+
+
+def test_max_steps_stops_runaway_program(tmp_path, capsys):
+    source = tmp_path / "spin.sws"
+    source.write_text("spin:\nJMP spin\n")
+    assert sim.main([str(source), "--max-steps", "100", "-q"]) == 1
+    assert "stopped at 0xF000 after 100 instructions" in capsys.readouterr().err
+    machine = run("spin:\nJMP spin", max_steps=100)
+    assert not machine.halted and machine.steps == 100
+
+
+def test_movl_and_movh_keep_the_other_byte():
+    machine = run("MOVH %ax, $12\nMOVL %ax, $34\nMOVL %ax, $56\nMOVH %bx, $78\nMOVL %bx, $9A\nHALT")
+    assert machine.regs[:2] == [0x1256, 0x789A]
+
+
+def test_loadb_zero_extends():
+    machine = run(
+        "MOVH %sp, $01\nMOVL %ax, $FF\nSTOREB %ax, [%sp]\n"
+        "MOVH %ax, $FF\nLOADB %ax, [%sp]\nHALT"
+    )
+    assert machine.regs[0] == 0xFF
+
+
+def test_self_modifying_code_is_decoded_again():
+    # overwrite the NOP at $F010 with a store of %cx to the output address
+    word = int.from_bytes(cheesegrater.assemble("STOREW %cx, [%ix]").memory[0xF000:0xF002], "little")
+    machine = run(
+        "MOVH %%sp, $F0\nMOVL %%sp, $10\nMOVH %%ax, $%02X\nMOVL %%ax, $%02X\nSTOREW %%ax, [%%sp]\n"
+        "MOVH %%ix, $69\nMOVL %%ix, $69\nMOVL %%cx, $07\n.seek $F010\nNOP\nHALT" % (word >> 8, word & 0xFF)
+    )
+    assert machine.halted and machine.outputs == [7]
+
+
+def test_illegal_instruction_is_reported(tmp_path, capsys):
+    source = tmp_path / "bad.sws"
+    source.write_text(".word $0001\n")
+    assert sim.main([str(source), "-q"]) == 1
+    assert "Illegal instruction 0x0001 at 0xF000" in capsys.readouterr().out
@@ -0,0 +1,28 @@
+import os
+import re
+import subprocess
+import sys
+
+import cheesegrater
+
+
+def test_startup_phases_add_up_to_total(tmp_path, capsys):
+    source = tmp_path / "loop.sws"
+    source.write_text("HALT\n")
+    assert cheesegrater.main([str(source), str(tmp_path / "out.wheel"), "--time-startup"]) == 0
+    times = [float(ms) for ms in re.findall(r"([\d.]+) ms", capsys.readouterr().err)]
+    assert len(times) == 5
+    # each phase is rounded to 0.1 ms before printing
+    assert abs(sum(times[:4]) - times[4]) <= 0.25
+
+
+def test_library_import_skips_argparse():
+    code = "import sys, cheesegrater; print('argparse' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(cheesegrater.__file__)),
+    )
+    assert result.stdout.strip() == "False"
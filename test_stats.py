@@ -0,0 +1,42 @@
+import pytest
+
+import cheesegrater
+import stats as assembler_stats
+
+
+@pytest.mark.parametrize(
+    "options, phases",
+    [
+        ({}, ["lex", "parse", "layout", "labels", "encode"]),
+        ({"optimize": True}, ["lex", "parse", "optimize", "layout", "labels", "encode"]),
+        ({"parse_jobs": 1}, ["parse", "labels", "encode"]),
+    ],
+)
+def test_instrumented_build_matches_plain_build(sample_source, options, phases):
+    stats = assembler_stats.Stats()
+    image = cheesegrater.assemble(sample_source, stats=stats, **options)
+    assert image.memory == cheesegrater.assemble(sample_source, **options).memory
+    assert list(stats.report()["phases"]) == phases
+
+
+def test_every_instruction_is_counted():
+    stats = assembler_stats.Stats()
+    cheesegrater.assemble("loop:\nADD %ax, #1\nADD %bx, #1\nJ.ne loop\n.byte $01", stats=stats)
+    report = stats.report()
+    assert report["statements"] == {"label": 1, "instruction": 3, "directive": 1}
+    assert report["opcodes"] == {"ADD": 2, "J": 1}
+    assert report["encoders"]["ri_format"]["count"] == 2
+    assert report["encoders"]["ri_format"]["seconds"] is not None
+
+
+def test_vector_encoder_counts_without_timing_each_call():
+    pytest.importorskip("numpy")
+    stats = assembler_stats.Stats()
+    cheesegrater.assemble("ADD %ax, #1\nHALT", "numpy", stats=stats)
+    assert stats.report()["encoders"]["ri_format"] == {"count": 1, "seconds": None}
+
+
+def test_timed_runs_lazy_passes_to_completion():
+    stats = assembler_stats.Stats()
+    assert stats.timed("parse", lambda n: (i for i in range(n)), 3) == [0, 1, 2]
+    assert "parse" in stats.timers
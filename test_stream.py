@@ -0,0 +1,48 @@
+import io
+
+import pytest
+
+import cheesegrater
+import stream
+
+
+def assemble_stream(source):
+    return stream.assemble_stream(io.StringIO(source))
+
+
+def test_matches_default_build(sample_source):
+    expected = cheesegrater.assemble(sample_source).memory
+    assert assemble_stream(sample_source).memory == expected
+
+
+def test_forward_and_backward_branches():
+    source = "back:\nJ.eq fwd\nJMP back\nCALL fwd\nfwd:\nHALT"
+    assert assemble_stream(source).memory == cheesegrater.assemble(source).memory
+
+
+def test_overwriting_plain_data_matches_default_build():
+    source = ".word $1234\n.word $0000\nJ.eq end\n.seek $F000\n.word $5678\nend:"
+    assert assemble_stream(source).memory == cheesegrater.assemble(source, relax=False).memory
+
+
+@pytest.mark.parametrize(
+    "source, message",
+    [
+        ("J.eq far\n.seek $F100\nfar:\nHALT", "Branch offset"),
+        ("JMP far\n.seek $F900\nfar:\nHALT", "Jump offset"),
+    ],
+)
+def test_range_errors_name_the_branch_type(source, message):
+    with pytest.raises(ValueError, match=message):
+        assemble_stream(source)
+
+
+@pytest.mark.parametrize("seek", ["$F000", "$EFFF"])
+def test_writing_over_a_pending_branch_is_an_error(seek):
+    with pytest.raises(SyntaxError, match="cannot patch"):
+        assemble_stream("J.eq end\nend:\n.seek %s\n.word $0000" % seek)
+
+
+def test_undefined_labels_are_reported_together():
+    with pytest.raises(SyntaxError, match="Undefined label\\(s\\): a, b"):
+        assemble_stream("JMP a\nJMP b")
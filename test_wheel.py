@@ -0,0 +1,101 @@
+import pytest
+
+import cheesegrater
+import wheel
+from wheel import WHEEL_HEADER, WEDGE_HEADER, WheelImage
+
+
+def image_with(*writes):
+    image = WheelImage()
+    for address, data in writes:
+        image.write_at(address, data)
+    return image
+
+
+def header_count(data):
+    return WHEEL_HEADER.unpack_from(data, 0)[2]
+
+
+def test_full_image_round_trips(sample_source):
+    image = cheesegrater.assemble(sample_source)
+    data = image.to_bytes()
+    assert header_count(data) == 1
+    assert WheelImage.from_bytes(data).memory == image.memory
+
+
+def test_sparse_image_round_trips(sample_source):
+    image = cheesegrater.assemble(sample_source)
+    data = image.to_sparse_bytes()
+    assert header_count(data) == len(image.wedges())
+    assert len(data) < len(image.to_bytes())
+    assert WheelImage.from_bytes(data).memory == image.memory
+
+
+def test_sequential_writes_make_one_range():
+    image = image_with((0x100, b"\x01\x02"), (0x102, b"\x03"), (0x100, b""))
+    assert image.ranges == [[0x100, 0x103]]
+
+
+@pytest.mark.parametrize(
+    "merge_gap, wedges",
+    [
+        (0, [(0x10, 0x12), (0x20, 0x22), (0x1000, 0x1002)]),
+        (16, [(0x10, 0x22), (0x1000, 0x1002)]),
+        (0x10000, [(0x10, 0x1002)]),
+    ],
+)
+def test_merge_gap(merge_gap, wedges):
+    # written out of order, so the wedges must be sorted
+    image = image_with((0x1000, b"\x01\x02"), (0x20, b"\x03\x04"), (0x10, b"\x05\x06"))
+    assert image.wedges(merge_gap) == wedges
+    data = image.to_sparse_bytes(merge_gap)
+    assert header_count(data) == len(wedges)
+    assert WheelImage.from_bytes(data).memory == image.memory
+
+
+def test_overlapping_writes_merge():
+    image = image_with((0x10, b"\x01" * 8), (0x14, b"\x02" * 8))
+    assert image.wedges(0) == [(0x10, 0x1C)]
+
+
+def test_too_many_ranges_close_the_smallest_gaps():
+    writes = [(address * 4, b"\x01") for address in range(wheel.MAX_WEDGES + 2)]
+    # one range that is further away than every other gap
+    writes.append((0x8000, b"\x02"))
+    image = image_with(*writes)
+    wedges = image.wedges(0)
+    assert len(wedges) == wheel.MAX_WEDGES
+    assert wedges[-1] == (0x8000, 0x8001)
+    assert WheelImage.from_bytes(image.to_sparse_bytes(0)).memory == image.memory
+
+
+def test_long_ranges_are_split():
+    image = image_with((0, bytes(wheel.IMAGE_SIZE)))
+    assert image.wedges() == [(0, wheel.MAX_WEDGE_LENGTH), (wheel.MAX_WEDGE_LENGTH, wheel.IMAGE_SIZE)]
+
+
+def test_write_past_the_end_is_an_error():
+    with pytest.raises(ValueError, match="past the end"):
+        image_with((0xFFFF, b"\x01\x02"))
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [
+        (b"nope" + bytes(4), "bad magic"),
+        (WHEEL_HEADER.pack(b"whee", 2, 1, 0) + WEDGE_HEADER.pack(0x100, 4, 0) + b"\x01", "truncated"),
+    ],
+)
+def test_bad_files(data, error):
+    with pytest.raises(ValueError, match=error):
+        WheelImage.from_bytes(data)
+
+
+def test_sparse_cli_output(tmp_path, sample_path):
+    out_path = str(tmp_path / "out.wheel")
+    assert cheesegrater.main([sample_path, out_path, "--sparse", "--merge-gap", "0"]) == 0
+    with open(out_path, "rb") as wheel_file:
+        data = wheel_file.read()
+    image = cheesegrater.assemble_file(sample_path)
+    assert header_count(data) == len(image.wedges(0))
+    assert WheelImage.from_bytes(data).memory == image.memory
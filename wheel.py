@@ -0,0 +1,145 @@
+import struct
+
+WHEEL_VERSION = 2
+IMAGE_SIZE = 0x10000
+
+# WHEEL header
+#   char magic_identifier[4]; // should be "whee"
+#   uint8_t version;
+#   uint8_t num_of_segments;
+#   uint16_t reserved;
+WHEEL_HEADER = struct.Struct("<4sBBH")
+
+# wedge header
+#   uint16_t start_address;
+#   uint16_t length;
+#   uint32_t checksum; // currently unimplemented, but might eventually be
+WEDGE_HEADER = struct.Struct("<HHI")
+
+MAX_WEDGES = 255
+MAX_WEDGE_LENGTH = 0xFFFF
+
+# Touched ranges closer together than this are emitted as one wedge, since a
+# short run of padding is cheaper than another 8-byte wedge header.
+DEFAULT_MERGE_GAP = 16
+
+
+class WheelImage:
+    """A full 64KB pARMesan memory image, built in memory by the assembler.
+
+    Every write is recorded, so the image can be serialised either as a single
+    64KB wedge or sparsely, with one wedge per region the program touched.
+    """
+
+    def __init__(self):
+        self.memory = bytearray(IMAGE_SIZE)
+        # [start, end) address ranges written so far, in write order
+        self.ranges = []
+
+    def view(self):
+        return memoryview(self.memory)
+
+    def write_at(self, address, data):
+        end = address + len(data)
+        if end > IMAGE_SIZE:
+            raise ValueError(
+                "Data at 0x%04X extends past the end of the 64KB address space"
+                % address
+            )
+        self.memory[address:end] = data
+        if end == address:
+            return
+        ranges = self.ranges
+        if ranges and ranges[-1][1] == address:
+            # sequential writes just grow the current range
+            ranges[-1][1] = end
+        else:
+            ranges.append([address, end])
+
+    def wedges(self, merge_gap=DEFAULT_MERGE_GAP):
+        """Return the (start, end) ranges to emit as wedges.
+
+        Touched ranges are sorted and merged when they overlap or are separated
+        by fewer than merge_gap bytes. If that still leaves more wedges than the
+        header can count, the smallest gaps are closed first until it fits.
+        """
+        merged = []
+        for start, end in sorted(self.ranges):
+            if merged and start - merged[-1][1] < merge_gap:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        if len(merged) > MAX_WEDGES:
+            gaps = sorted(
+                range(len(merged) - 1), key=lambda i: merged[i + 1][0] - merged[i][1]
+            )
+            closed = set(gaps[: len(merged) - MAX_WEDGES])
+            fitted = [merged[0]]
+            for i in range(1, len(merged)):
+                if i - 1 in closed:
+                    fitted[-1][1] = merged[i][1]
+                else:
+                    fitted.append(merged[i])
+            merged = fitted
+        # the length field is 16 bits wide, so split anything longer
+        wedges = []
+        for start, end in merged:
+            while end - start > MAX_WEDGE_LENGTH:
+                wedges.append((start, start + MAX_WEDGE_LENGTH))
+                start += MAX_WEDGE_LENGTH
+            wedges.append((start, end))
+        if len(wedges) > MAX_WEDGES:
+            raise ValueError("Image needs %d wedges, more than a WHEEL header can hold" % len(wedges))
+        return wedges
+
+    def to_sparse_bytes(self, merge_gap=DEFAULT_MERGE_GAP):
+        """Serialise only the touched parts of the image, one wedge per range."""
+        wedges = self.wedges(merge_gap)
+        parts = [WHEEL_HEADER.pack(b"whee", WHEEL_VERSION, len(wedges), 0)]
+        view = self.view()
+        for start, end in wedges:
+            parts.append(WEDGE_HEADER.pack(start, end - start, 0))
+            parts.append(view[start:end])
+        return b"".join(parts)
+
+    def to_bytes(self):
+        """Serialise the image as a WHEEL file with a single 64KB wedge."""
+        # the length field is only 16 bits wide, so a full image is recorded
+        # as 65535 bytes even though all 65536 follow the header
+        return (
+            WHEEL_HEADER.pack(b"whee", WHEEL_VERSION, 1, 0)
+            + WEDGE_HEADER.pack(0, IMAGE_SIZE - 1, 0)
+            + self.memory
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Load a WHEEL file's wedges into a fresh image."""
+        magic, version, num_wedges, _ = WHEEL_HEADER.unpack_from(data, 0)
+        if magic != b"whee":
+            raise ValueError("Not a WHEEL file (bad magic %r)" % magic)
+        image = cls()
+        offset = WHEEL_HEADER.size
+        for _ in range(num_wedges):
+            start, length, _ = WEDGE_HEADER.unpack_from(data, offset)
+            offset += WEDGE_HEADER.size
+            if num_wedges == 1 and start == 0 and length == IMAGE_SIZE - 1:
+                # a full image, whose length field is one short (see to_bytes)
+                length = min(IMAGE_SIZE, len(data) - offset)
+            if offset + length > len(data):
+                raise ValueError("WHEEL file is truncated in the wedge at 0x%04X" % start)
+            image.write_at(start, data[offset : offset + length])
+            offset += length
+        return image
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "rb") as file:
+            return cls.from_bytes(file.read())
+
+    def write(self, path, sparse=False, merge_gap=DEFAULT_MERGE_GAP):
+        with open(path, "wb") as file:
+            if sparse:
+                file.write(self.to_sparse_bytes(merge_gap))
+            else:
+                file.write(self.to_bytes())